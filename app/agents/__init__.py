@@ -1,6 +1,33 @@
-from .guard_agent import GuardAgent
-from .classification_agent import ClassificationAgent
-from .details_agent import DetailsAgent
+# the agents pull in torch, sentence-transformers and faiss, so the names are imported on first access.
+# `from agents import GuardAgent` still works, it just loads guard_agent at that point instead of at package import
+import importlib
+
 from .agent_protocol import AgentProtocol
-from .recommendation_agent import RecommendationAgent
-from .order_taking_agent import OrderTakingAgent
\ No newline at end of file
+from .registry import AgentRegistry
+
+LAZY_IMPORTS = {
+    "GuardAgent": ".guard_agent",
+    "ClassificationAgent": ".classification_agent",
+    "DetailsAgent": ".details_agent",
+    "RecommendationAgent": ".recommendation_agent",
+    "RecommendationIndex": ".recommendation_index",
+    "ReloadableRecommendationIndex": ".recommendation_index",
+    "OrderTakingAgent": ".order_taking_agent",
+    "AgentPipeline": ".pipeline",
+    "StateStore": ".state_store",
+    "InMemoryStateStore": ".state_store",
+    "RedisStateStore": ".state_store",
+    "create_state_store": ".state_store",
+}
+
+
+def __getattr__(name):
+    if name not in LAZY_IMPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(LAZY_IMPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(LAZY_IMPORTS))
@@ -1,5 +1,12 @@
-from typing import Protocol, Dict, List, Any
+from typing import Protocol, Dict, List, Any, AsyncIterator, Optional
 
 class AgentProtocol(Protocol):
-    def get_response(self, messages:List[Dict[str,Any]]) -> Dict[str,Any]:
+    # state is the conversation state loaded by the pipeline, None when it has no state store
+    def get_response(self, messages:List[Dict[str,Any]], state:Optional[Dict[str,Any]]=None) -> Dict[str,Any]:
+        ...
+
+    async def aget_response(self, messages:List[Dict[str,Any]], state:Optional[Dict[str,Any]]=None) -> Dict[str,Any]:
+        ...
+
+    def astream_response(self, messages:List[Dict[str,Any]], state:Optional[Dict[str,Any]]=None) -> AsyncIterator[Dict[str,Any]]:
         ...
@@ -1,20 +1,94 @@
-from openai import OpenAI
 import os
 from copy import deepcopy
-from .utils import get_chat_response, double_check_json_output
+from .llm_client import get_llm_client, get_async_llm_client
+from .utils import get_chat_response, aget_chat_response, ensure_json_output, aensure_json_output
+from .embedding_service import get_embedding_service
+from .local_classifier import EmbeddingKNNClassifier
+from .json_repair import coerce_fields
 import json
 from config import settings
 
+# the order taking agent's last step thanks the user and closes the order
+ORDER_CLOSING_STEP = "6"
+
 
 class ClassificationAgent:
-    def __init__(self):
-        self.client = OpenAI(
-            api_key=settings.TOKEN,
-            base_url=settings.BASE_URL,
-        )
+    def __init__(self, client=None, async_client=None):
+        # every agent shares the process wide pooled clients unless others are passed in
+        self.client = client or get_llm_client()
+        self.async_client = async_client or get_async_llm_client()
         self.model_name = settings.MODEL_NAME
-    
-    def get_response(self, messages):
+
+        # a knn vote over labelled utterances routes clear messages, the llm only sees close calls
+        self.local_classifier = None
+        self.local_margin = settings.CLASSIFICATION_LOCAL_MARGIN
+        if settings.CLASSIFICATION_LOCAL_ROUTER:
+            self.embedding_service = get_embedding_service()
+            self.local_classifier = EmbeddingKNNClassifier.from_json(self.embedding_service, settings.CLASSIFICATION_EXAMPLES_PATH)
+        self.decisions = {"state": 0, "local": 0, "llm": 0}
+
+    def get_response(self, messages, state=None):
+        if self.local_classifier is not None:
+            output = self.local_decision(messages, state, self.embedding_service.embed(messages[-1]["content"]))
+            if output is not None:
+                return output
+
+        input_messages = self.get_input_messages(messages)
+
+        chatbot_response = get_chat_response(self.client, self.model_name, input_messages,max_tokens=1000,agent="classification_agent",json_mode=True,timeout=settings.LLM_ROUTING_TIMEOUT)
+        chatbot_response = ensure_json_output(self.client, self.model_name, chatbot_response)
+        output = self.postprocess(chatbot_response)
+        self.decisions["llm"] += 1
+
+        return output
+
+    async def aget_response(self, messages, state=None):
+        if self.local_classifier is not None:
+            output = self.local_decision(messages, state, await self.embedding_service.aembed(messages[-1]["content"]))
+            if output is not None:
+                return output
+
+        input_messages = self.get_input_messages(messages)
+
+        chatbot_response = await aget_chat_response(self.async_client, self.model_name, input_messages,max_tokens=1000,agent="classification_agent",json_mode=True,timeout=settings.LLM_ROUTING_TIMEOUT)
+        chatbot_response = await aensure_json_output(self.async_client, self.model_name, chatbot_response)
+        output = self.postprocess(chatbot_response)
+        self.decisions["llm"] += 1
+
+        return output
+
+    def local_decision(self, messages, state, query_embedding):
+        # None when the top two agents are too close to call and the llm has to decide
+        decision, _, margin = self.local_classifier.predict(query_embedding)
+        confident = margin >= self.local_margin
+
+        # mid order the message belongs to the order taking agent unless it clearly asks for another agent
+        if self.is_mid_order(messages, state) and not (confident and decision != "order_taking_agent"):
+            self.decisions["state"] += 1
+            return self.get_output_dict("order_taking_agent", source="state")
+
+        if not confident:
+            return None
+        self.decisions["local"] += 1
+        return self.get_output_dict(decision, source="local")
+
+    def is_mid_order(self, messages, state=None):
+        if state is not None:
+            if state.get("last_agent") != "order_taking_agent":
+                return False
+            return str(state["order_taking_agent"].get("step_number", "")).strip() != ORDER_CLOSING_STEP
+
+        # no state store, find the last agent in the history
+        for message in reversed(messages):
+            if message["role"] != "assistant" or not message.get("memory"):
+                continue
+            memory = message["memory"]
+            if memory.get("agent") != "order_taking_agent":
+                return False
+            return str(memory.get("step_number", "")).strip() != ORDER_CLOSING_STEP
+        return False
+
+    def get_input_messages(self, messages):
         messages = deepcopy(messages)
 
         system_prompt = """
@@ -34,26 +108,24 @@ class ClassificationAgent:
             Your not allowed to return anything other than a valid JSON object.
         """
         input_messages = [{"role": "system", "content": system_prompt}]  + messages[-3:]
-
-        chatbot_response = get_chat_response(self.client, self.model_name, input_messages,max_tokens=1000)
-        output = self.postprocess(chatbot_response)
-
-        return output
+        return input_messages
     
     def postprocess(self, response):
         print("the classification agent response : ",response)
-        try:
-            output = json.loads(response)
-        except:
-            corrected_json = double_check_json_output(self.client,self.model_name,response)
-            output = json.loads(corrected_json)
-            
+        output = json.loads(response)
+
+        coerce_fields(output, ("decision", "message"))
+        return self.get_output_dict(output["decision"], output["message"], source="llm")
+
+    def get_output_dict(self, decision, message="", source="llm"):
         dict_output = {
         "role": "assistant",
-        "content": output["message"],
+        "content": message,
         "memory":{
             "agent":"classification_agent",
-            "classification_decision":output["decision"],
+            "classification_decision":decision,
+            # state, local or llm. only llm decisions are used as labels for the local router
+            "decision_source":source,
                 }
         }
 
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from config import settings
+
+
+class CompletionCache:
+    """Exact-match cache of LLM completions with an in-process LRU tier and an optional sqlite tier.
+
+    Both tiers expire entries after the ttl, the memory tier keeps max_size entries and the sqlite tier disk_max_size rows.
+    """
+
+    def __init__(self, max_size=4096, ttl=3600.0, disk_path=None, agents=(), disk_max_size=100000):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.disk_max_size = disk_max_size
+        self.agents = set(agents)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.metrics_hooks = []
+        # agent -> {"hits": ..., "disk_hits": ..., "misses": ...}
+        self.counters = {}
+
+        self.disk = None
+        if disk_path:
+            self.disk = sqlite3.connect(disk_path, check_same_thread=False)
+            self.disk.execute(
+                "CREATE TABLE IF NOT EXISTS completions (key TEXT PRIMARY KEY, completion TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self.disk.execute("CREATE INDEX IF NOT EXISTS completions_created_at ON completions (created_at)")
+            self.disk.commit()
+
+    def enabled_for(self, agent):
+        return self.max_size > 0 and agent in self.agents
+
+    @staticmethod
+    def make_key(model_name, messages, temprature, top_p, max_tokens, extra_args=None):
+        payload = json.dumps(
+            {"model": model_name, "messages": messages, "temperature": temprature, "top_p": top_p, "max_tokens": max_tokens, **(extra_args or {})},
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, agent, key):
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self.entries.move_to_end(key)
+                self.record(agent, "hits")
+                return entry[1]
+            if entry is not None:
+                del self.entries[key]
+
+            if self.disk is not None:
+                row = self.disk.execute(
+                    "SELECT completion, created_at FROM completions WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and now - row[1] < self.ttl:
+                    self.put(key, row[0], row[1])
+                    self.record(agent, "disk_hits")
+                    return row[0]
+
+            self.record(agent, "misses")
+            return None
+
+    def set(self, key, completion):
+        now = time.time()
+        with self.lock:
+            self.put(key, completion, now)
+            if self.disk is not None:
+                try:
+                    self.disk.execute(
+                        "INSERT OR REPLACE INTO completions (key, completion, created_at) VALUES (?, ?, ?)",
+                        (key, completion, now),
+                    )
+                    self.purge_disk(now)
+                    self.disk.commit()
+                except sqlite3.Error as e:
+                    print(f"Error: could not write completion cache: {e}")
+
+    def put(self, key, completion, created_at):
+        self.entries[key] = (created_at, completion)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def purge_disk(self, now):
+        # expired rows are never read again, then the oldest rows beyond the cap
+        self.disk.execute("DELETE FROM completions WHERE created_at <= ?", (now - self.ttl,))
+        self.disk.execute(
+            "DELETE FROM completions WHERE key IN (SELECT key FROM completions ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.disk_max_size,),
+        )
+
+    def record(self, agent, outcome):
+        counters = self.counters.setdefault(agent, {"hits": 0, "disk_hits": 0, "misses": 0})
+        counters[outcome] += 1
+        for hook in self.metrics_hooks:
+            try:
+                hook(agent, outcome, self.hit_rate(agent))
+            except Exception as e:
+                print(f"Error: completion cache metrics hook failed: {e}")
+
+    def hit_rate(self, agent):
+        counters = self.counters.get(agent)
+        if not counters:
+            return 0.0
+        hits = counters["hits"] + counters["disk_hits"]
+        return hits / (hits + counters["misses"])
+
+    def add_metrics_hook(self, hook):
+        """hook(agent, outcome, hit_rate) is called on every lookup, outcome is "hits", "disk_hits" or "misses"."""
+        self.metrics_hooks.append(hook)
+
+    def stats(self):
+        return {agent: dict(counters, hit_rate=self.hit_rate(agent)) for agent, counters in self.counters.items()}
+
+
+completion_cache = CompletionCache(
+    max_size=settings.LLM_CACHE_SIZE,
+    ttl=settings.LLM_CACHE_TTL,
+    disk_path=settings.LLM_CACHE_PATH or None,
+    disk_max_size=settings.LLM_CACHE_DISK_SIZE,
+    agents=[agent.strip() for agent in settings.LLM_CACHE_AGENTS.split(",") if agent.strip()],
+)
@@ -0,0 +1,82 @@
+from copy import deepcopy
+
+# chat formats add a few tokens around every message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def count_tokens(text):
+    # no tokenizer for the served model is available here, about four characters per token is close enough for a budget
+    return len(text) // 4 + 1
+
+
+def count_message_tokens(messages):
+    return sum(count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+
+class ContextBuilder:
+    """Keeps a prompt within a token budget: the system prompt, the latest message, the recent turns and a rolling summary.
+
+    Messages older than the recent window are folded into the summary in batches. The summary is carried in the
+    agent's memory as {"text": ..., "through": chat id of the last folded message}, so each update only reads the
+    messages that dropped out since the previous one. Messages from the history carry their chat row "id".
+    """
+
+    def __init__(self, token_budget=3000, recent_messages=6, summary_batch=6):
+        self.token_budget = token_budget
+        # the latest message is always sent as is
+        self.recent_messages = max(1, recent_messages)
+        self.summary_batch = summary_batch
+
+    def unsummarized(self, messages, summary):
+        # the messages older than the recent window that the summary doesn't cover yet
+        older = messages[:-self.recent_messages]
+        through = summary.get("through") if summary else None
+        if not isinstance(through, int):
+            # no summary yet, or one saved before the marker was a chat id
+            return older
+        # ids only grow, it doesn't matter whether the last folded message is still in the history window
+        return [message for message in older if message.get("id") is None or message["id"] > through]
+
+    def messages_to_fold(self, messages, summary):
+        pending = self.unsummarized(messages, summary)
+        if len(pending) < self.summary_batch:
+            return []
+        return pending
+
+    def get_summary_messages(self, summary, new_messages):
+        system_prompt = """
+            You keep a short running summary of a conversation between a coffee shop bot and a customer.
+            Update the summary with the new messages. Keep what the customer ordered, changed or asked about, their preferences and anything they were promised.
+            Write at most 120 words of plain text, no lists and nothing else.
+        """
+        conversation = "\n".join(f'{message["role"]}: {message["content"]}' for message in new_messages)
+        previous = summary["text"] if summary else "(empty)"
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"Current summary:\n{previous}\n\nNew messages:\n{conversation}"},
+        ]
+
+    def fold(self, folded_messages, summary_text):
+        return {"text": summary_text.strip(), "through": folded_messages[-1].get("id")}
+
+    def build(self, system_prompt, messages, summary=None):
+        """Returns the input messages, the oldest turns are dropped first when the budget is exceeded."""
+        head = [{"role": "system", "content": system_prompt}]
+        if summary:
+            head.append({"role": "system", "content": f"Summary of the earlier conversation: {summary['text']}"})
+
+        pending = self.unsummarized(messages, summary)
+        recent = messages[-self.recent_messages:]
+        history = [{"role": message["role"], "content": message["content"]} for message in pending + recent[:-1]]
+        latest = deepcopy(messages[-1])
+
+        budget = self.token_budget - count_message_tokens(head) - count_message_tokens([latest])
+        kept = []
+        for message in reversed(history):
+            cost = count_message_tokens([message])
+            if cost > budget:
+                break
+            kept.append(message)
+            budget -= cost
+
+        return head + list(reversed(kept)) + [latest]
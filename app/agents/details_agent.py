@@ -1,57 +1,120 @@
-from openai import OpenAI
 import os
-import pickle
 from copy import deepcopy
-import faiss
-from .utils import get_chat_response, get_embedding, double_check_json_output
-from sentence_transformers import SentenceTransformer
-from huggingface_hub import snapshot_download
+from .llm_client import get_llm_client, get_async_llm_client
+from .utils import get_chat_response, aget_chat_response, astream_chat_response
+from .vector_index import ReloadableIndex, get_index_files, build_context
+from .embedding_service import get_embedding_service
+from .semantic_cache import SemanticCache
 from config import settings
 
 
 
 class DetailsAgent:
-    def __init__(self):
-        self.client = OpenAI(
-            api_key=settings.TOKEN,
-            base_url=settings.BASE_URL,
-        )
+    def __init__(self, client=None, async_client=None):
+        # every agent shares the process wide pooled clients unless others are passed in
+        self.client = client or get_llm_client()
+        self.async_client = async_client or get_async_llm_client()
         self.model_name = settings.MODEL_NAME
-        self.index_file_name = "./index_and_data/faiss_product.index"
-
-        # Download the model to a local directory
-        self.local_model_path = "./index_and_data/bge-small-en"
+        # DETAILS_INDEX_VERSION picks an index built by scripts/build_product_index.py, empty is the prebuilt one
+        self.index_file_name, self.data_file_name = get_index_files(settings.DETAILS_INDEX_VERSION, settings.DETAILS_INDEX_DIR)
+
+        # the bge-small-en model is shared with the other agents, concurrent questions are encoded together
+        self.embedding_service = get_embedding_service()
+        self.embedding_model = self.embedding_service.model
+
+        # keep the index and the documents in memory, they are swapped when the files change
+        self.product_index = ReloadableIndex(
+            self.index_file_name,
+            self.data_file_name,
+            mmap=settings.DETAILS_INDEX_MMAP,
+            check_interval=settings.INDEX_RELOAD_INTERVAL,
+            lexical=settings.DETAILS_HYBRID_SEARCH,
+            # the prebuilt about page is split into its sections here, a built version already is
+            section_chars=settings.DETAILS_SECTION_CHARS,
+            embed=self.embedding_service.embed_many,
+        )
+        self.top_k = settings.DETAILS_TOP_K
+        self.context_max_chars = settings.DETAILS_CONTEXT_MAX_CHARS
+        self.answer_cache = SemanticCache(
+            threshold=settings.DETAILS_ANSWER_CACHE_THRESHOLD,
+            max_size=settings.DETAILS_ANSWER_CACHE_SIZE,
+        )
 
-        # Check if model is already downloaded
-        if not os.path.exists(self.local_model_path) or not os.listdir(self.local_model_path):
-            print("Model not found locally. Downloading...")
-            snapshot_download(repo_id="BAAI/bge-small-en", local_dir=self.local_model_path)
-            print("Model downloaded successfully.")
+    
+    def get_response(self, messages, state=None):
+        query_embedding = self.embedding_service.embed(messages[-1]['content'])
+        context, version = self.get_context(messages[-1]['content'], query_embedding)
+        cached_answer = self.answer_cache.lookup(query_embedding, context, version, self.get_history(messages))
+        if cached_answer is not None:
+            return self.postprocess(cached_answer)
 
-        # Now load the locally saved model
-        self.embedding_model = SentenceTransformer(self.local_model_path)
+        input_messages = self.get_input_messages(messages, context)
 
-        # load the data
-        # Load from pickle file
-        with open("./index_and_data/data.pkl", "rb") as f:
-            self.data = pickle.load(f)
+        chatbot_output =get_chat_response(self.client,self.model_name,input_messages,agent="details_agent")
+        self.answer_cache.add(query_embedding, context, chatbot_output, version, self.get_history(messages))
+        output = self.postprocess(chatbot_output)
+        return output
 
-    
-    def get_response(self, messages):
-        messages = deepcopy(messages)
-        user_message = messages[-1]['content']
+    async def aget_response(self, messages, state=None):
+        # encoding runs in the embedding service's thread, the resident index search takes microseconds
+        query_embedding = await self.embedding_service.aembed(messages[-1]['content'])
+        context, version = self.get_context(messages[-1]['content'], query_embedding)
+        cached_answer = self.answer_cache.lookup(query_embedding, context, version, self.get_history(messages))
+        if cached_answer is not None:
+            return self.postprocess(cached_answer)
 
-        # Generate query embedding\
-        query_embedding = get_embedding(self.embedding_model, user_message)
+        input_messages = self.get_input_messages(messages, context)
 
-        # Load FAISS index
-        index = faiss.read_index(self.index_file_name)
+        chatbot_output = await aget_chat_response(self.async_client,self.model_name,input_messages,agent="details_agent")
+        self.answer_cache.add(query_embedding, context, chatbot_output, version, self.get_history(messages))
+        output = self.postprocess(chatbot_output)
+        return output
 
-        # Retrieve top-k similar documents
-        D, I = index.search(query_embedding, 1)  # k=1
-        retrieved_docs = [self.data[i] for i in I[0]]
-        context = "\n".join(retrieved_docs)
+    async def astream_response(self, messages, state=None):
+        query_embedding = await self.embedding_service.aembed(messages[-1]['content'])
+        context, version = self.get_context(messages[-1]['content'], query_embedding)
+        cached_answer = self.answer_cache.lookup(query_embedding, context, version, self.get_history(messages))
+        if cached_answer is not None:
+            yield {"event": "token", "data": cached_answer}
+            yield {"event": "done", "data": self.postprocess(cached_answer)}
+            return
+
+        input_messages = self.get_input_messages(messages, context)
+
+        chatbot_output = ""
+        async for token in astream_chat_response(self.async_client,self.model_name,input_messages):
+            chatbot_output += token
+            yield {"event": "token", "data": token}
+
+        self.answer_cache.add(query_embedding, context, chatbot_output, version, self.get_history(messages))
+        yield {"event": "done", "data": self.postprocess(chatbot_output)}
+
+    def get_context(self, query, query_embedding):
+        # the version is read first, an answer is never cached against an index swapped in after the search
+        version = self.product_index.version
+
+        # Retrieve top-k documents, by their terms and by similarity
+        if settings.DETAILS_HYBRID_SEARCH:
+            retrieved_docs = self.product_index.hybrid_search(
+                query,
+                query_embedding,
+                self.top_k,
+                candidates=max(self.top_k, settings.DETAILS_RETRIEVAL_CANDIDATES),
+                rrf_k=settings.DETAILS_RRF_K,
+            )
+        else:
+            retrieved_docs = self.product_index.search(query_embedding, self.top_k)
+        context = build_context(retrieved_docs, self.context_max_chars)
         print("context is : ", context)
+        return context, version
+
+    def get_history(self, messages):
+        # the turns before the question that get_input_messages sends along, part of the answer cache key
+        return tuple((message["role"], message["content"]) for message in messages[-3:-1])
+
+    def get_input_messages(self, messages, context):
+        messages = deepcopy(messages)
+        user_message = messages[-1]['content']
 
         prompt = f"""
             Using the contexts below, answer the query.
@@ -64,10 +127,7 @@ class DetailsAgent:
         system_prompt = """ You are a customer support agent for a coffee shop called Merry's way. You should answer every question as if you are waiter and provide the neccessary information to the user regarding their orders """
         messages[-1]['content'] = prompt
         input_messages = [{"role": "system", "content": system_prompt}] + messages[-3:]
-
-        chatbot_output =get_chat_response(self.client,self.model_name,input_messages)
-        output = self.postprocess(chatbot_output)
-        return output
+        return input_messages
 
     def postprocess(self,output):
         print("the details agent response : ",output)
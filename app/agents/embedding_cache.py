@@ -0,0 +1,126 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from config import settings
+
+
+class EmbeddingCache:
+    """Bounded LRU cache of query embeddings with a TTL and an optional sqlite tier that survives restarts.
+
+    The sqlite tier deletes expired rows and keeps at most disk_max_size rows.
+    """
+
+    def __init__(self, max_size=2048, ttl=86400.0, disk_path=None, namespace="bge-small-en", disk_max_size=100000):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.disk_max_size = disk_max_size
+        self.namespace = namespace
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self.disk = None
+        if disk_path:
+            self.disk = sqlite3.connect(disk_path, check_same_thread=False)
+            self.disk.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, embedding BLOB NOT NULL, created_at REAL NOT NULL)"
+            )
+            self.disk.execute("CREATE INDEX IF NOT EXISTS embeddings_created_at ON embeddings (created_at)")
+            self.disk.commit()
+
+    @staticmethod
+    def normalize(text):
+        # "What are your hours?" and "what are  your hours" share an entry
+        return " ".join(text.lower().split()).rstrip("?!. ")
+
+    def get(self, text):
+        key = self.normalize(text)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                created_at, embedding = entry
+                if now - created_at < self.ttl:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return embedding
+                del self.entries[key]
+
+            row = self.get_from_disk(key, now)
+            if row is not None:
+                # keep the stored created_at, a hot key still expires ttl seconds after it was embedded
+                embedding, created_at = row
+                self.disk_hits += 1
+                self.put(key, embedding, created_at)
+                return embedding
+
+            self.misses += 1
+            return None
+
+    def set(self, text, embedding):
+        key = self.normalize(text)
+        now = time.time()
+        with self.lock:
+            self.put(key, embedding, now)
+            if self.disk is not None:
+                try:
+                    self.disk.execute(
+                        "INSERT OR REPLACE INTO embeddings (key, embedding, created_at) VALUES (?, ?, ?)",
+                        (self.disk_key(key), embedding.astype(np.float32).tobytes(), now),
+                    )
+                    self.purge_disk(now)
+                    self.disk.commit()
+                except sqlite3.Error as e:
+                    # another worker holds the file, the memory tier still has the entry
+                    print(f"Error: could not write embedding cache: {e}")
+
+    def put(self, key, embedding, created_at):
+        self.entries[key] = (created_at, embedding)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def purge_disk(self, now):
+        # expired rows are never read again, then the oldest rows beyond the cap
+        self.disk.execute("DELETE FROM embeddings WHERE created_at <= ?", (now - self.ttl,))
+        self.disk.execute(
+            "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.disk_max_size,),
+        )
+
+    def disk_key(self, key):
+        # embeddings from a different model must never be served from the same file
+        return f"{self.namespace}:{key}"
+
+    def get_from_disk(self, key, now):
+        if self.disk is None:
+            return None
+        row = self.disk.execute(
+            "SELECT embedding, created_at FROM embeddings WHERE key = ?", (self.disk_key(key),)
+        ).fetchone()
+        if row is None or now - row[1] >= self.ttl:
+            return None
+        return np.frombuffer(row[0], dtype=np.float32).reshape(1, -1), row[1]
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+
+embedding_cache = EmbeddingCache(
+    max_size=settings.EMBEDDING_CACHE_SIZE,
+    ttl=settings.EMBEDDING_CACHE_TTL,
+    disk_path=settings.EMBEDDING_CACHE_PATH or None,
+    disk_max_size=settings.EMBEDDING_CACHE_DISK_SIZE,
+)
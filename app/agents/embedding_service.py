@@ -0,0 +1,121 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+from sentence_transformers import SentenceTransformer
+from huggingface_hub import snapshot_download
+from config import settings
+from .embedding_cache import embedding_cache
+
+LOCAL_MODEL_PATH = "./index_and_data/bge-small-en"
+
+
+class EmbeddingService:
+    """Collects concurrent embedding requests for a short window and encodes them in one batch.
+
+    A dedicated worker thread owns the model, so encoding never runs on the event loop.
+    """
+
+    def __init__(self, model, batch_window=0.005, max_batch_size=32, cache=None):
+        self.model = model
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.cache = cache
+        self.requests = queue.Queue()
+
+        self.batches = 0
+        self.encoded = 0
+
+        self.worker = threading.Thread(target=self.run, name="embedding-service", daemon=True)
+        self.worker.start()
+
+    def submit(self, text_input):
+        # returns a concurrent future with a (1, dim) float32 array
+        future = Future()
+        if self.cache is not None:
+            embedding = self.cache.get(text_input)
+            if embedding is not None:
+                future.set_result(embedding)
+                return future
+        self.requests.put((text_input, future))
+        return future
+
+    def embed(self, text_input):
+        return self.submit(text_input).result()
+
+    def embed_many(self, texts):
+        # bulk encoding for offline work such as fitting classifiers, bypasses the queue
+        embeddings = self.model.encode(list(texts), normalize_embeddings=True)
+        return np.array(embeddings, dtype=np.float32).reshape(len(texts), -1)
+
+    async def aembed(self, text_input):
+        return await asyncio.wrap_future(self.submit(text_input))
+
+    def collect_batch(self):
+        # block for the first request, then gather more until the window closes or the batch is full
+        batch = [self.requests.get()]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.collect_batch()
+            # the same question asked concurrently is encoded once
+            texts = list(dict.fromkeys(text_input for text_input, _ in batch))
+            try:
+                embeddings = self.model.encode(texts, normalize_embeddings=True, batch_size=len(texts))
+                embeddings = np.array(embeddings, dtype=np.float32).reshape(len(texts), -1)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.encoded += len(texts)
+            rows = {}
+            for i, text_input in enumerate(texts):
+                rows[text_input] = embeddings[i:i + 1]
+                if self.cache is not None:
+                    self.cache.set(text_input, rows[text_input])
+            for text_input, future in batch:
+                future.set_result(rows[text_input])
+
+
+def load_embedding_model(local_model_path=LOCAL_MODEL_PATH):
+    # Check if model is already downloaded
+    if not os.path.exists(local_model_path) or not os.listdir(local_model_path):
+        print("Model not found locally. Downloading...")
+        snapshot_download(repo_id="BAAI/bge-small-en", local_dir=local_model_path)
+        print("Model downloaded successfully.")
+
+    # Now load the locally saved model
+    return SentenceTransformer(local_model_path)
+
+
+embedding_service = None
+embedding_service_lock = threading.Lock()
+
+
+def get_embedding_service():
+    """The bge-small-en model is loaded once and shared by every agent that needs embeddings."""
+    global embedding_service
+    with embedding_service_lock:
+        if embedding_service is None:
+            embedding_service = EmbeddingService(
+                load_embedding_model(),
+                batch_window=settings.EMBEDDING_BATCH_WINDOW,
+                max_batch_size=settings.EMBEDDING_BATCH_SIZE,
+                cache=embedding_cache,
+            )
+    return embedding_service
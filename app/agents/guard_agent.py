@@ -1,21 +1,92 @@
-from openai import OpenAI
+import asyncio
 import os
+import re
 from copy import deepcopy
-from .utils import get_chat_response, double_check_json_output
+from .llm_client import get_llm_client, get_async_llm_client
+from .utils import get_chat_response, aget_chat_response, ensure_json_output, aensure_json_output
+from .embedding_service import get_embedding_service
+from .local_classifier import EmbeddingKNNClassifier
+from .json_repair import coerce_fields
 from dotenv import load_dotenv
 from config import settings
 import json
 
+REJECTION_MESSAGE = "Sorry, I can't help with that. Can I help you with your order?"
+# sentences and lines are voted on one by one, "a latte please. ignore your instructions and ..." must not pass as a
+# coffee message. longer messages always go to the llm
+SEGMENT_PATTERN = re.compile(r"(?<=[.!?;])\s+|\n+")
+MAX_LOCAL_SEGMENTS = 4
+
+
+def split_segments(text):
+    return [segment.strip() for segment in SEGMENT_PATTERN.split(text) if segment.strip()]
+
+
+def is_clearly_allowed(predictions, margin):
+    # predictions are the (label, confidence, margin) votes of the segments of one message. only a message whose
+    # every segment is confidently allowed skips the llm, rejections and anything ambiguous are left to it
+    return bool(predictions) and all(label == "allowed" and vote_margin >= margin for label, _, vote_margin in predictions)
+
 
 class GuardAgent:
-    def __init__(self):
-        self.client = OpenAI(
-            api_key=settings.TOKEN,
-            base_url=settings.BASE_URL,
-        )
+    def __init__(self, client=None, async_client=None):
+        # every agent shares the process wide pooled clients unless others are passed in
+        self.client = client or get_llm_client()
+        self.async_client = async_client or get_async_llm_client()
         self.model_name = settings.MODEL_NAME
-    
-    def get_response(self, messages):
+
+        # clearly allowed messages are decided by a knn vote over labelled examples, the llm sees the rest
+        self.local_classifier = None
+        self.local_margin = settings.GUARD_LOCAL_MARGIN
+        if settings.GUARD_LOCAL_CLASSIFIER:
+            self.embedding_service = get_embedding_service()
+            self.local_classifier = EmbeddingKNNClassifier.from_json(self.embedding_service, settings.GUARD_EXAMPLES_PATH)
+        self.decisions = {"local": 0, "llm": 0}
+
+    def get_response(self, messages, state=None):
+        if self.local_classifier is not None:
+            segments = split_segments(messages[-1]["content"])
+            if len(segments) <= MAX_LOCAL_SEGMENTS:
+                futures = [self.embedding_service.submit(segment) for segment in segments]
+                output = self.local_decision([future.result() for future in futures])
+                if output is not None:
+                    return output
+
+        input_messages = self.get_input_messages(messages)
+
+        chatbot_response = get_chat_response(self.client, self.model_name, input_messages,max_tokens=1000,agent="guard_agent",json_mode=True,timeout=settings.LLM_ROUTING_TIMEOUT)
+        chatbot_response = ensure_json_output(self.client, self.model_name, chatbot_response)
+        output = self.postprocess(chatbot_response)
+        self.decisions["llm"] += 1
+
+        return output
+
+    async def aget_response(self, messages, state=None):
+        if self.local_classifier is not None:
+            segments = split_segments(messages[-1]["content"])
+            if len(segments) <= MAX_LOCAL_SEGMENTS:
+                output = self.local_decision(await asyncio.gather(*[self.embedding_service.aembed(segment) for segment in segments]))
+                if output is not None:
+                    return output
+
+        input_messages = self.get_input_messages(messages)
+
+        chatbot_response = await aget_chat_response(self.async_client, self.model_name, input_messages,max_tokens=1000,agent="guard_agent",json_mode=True,timeout=settings.LLM_ROUTING_TIMEOUT)
+        chatbot_response = await aensure_json_output(self.async_client, self.model_name, chatbot_response)
+        output = self.postprocess(chatbot_response)
+        self.decisions["llm"] += 1
+
+        return output
+
+    def local_decision(self, segment_embeddings):
+        # None when the message is not clearly allowed and the llm has to decide
+        predictions = [self.local_classifier.predict(embedding) for embedding in segment_embeddings]
+        if not is_clearly_allowed(predictions, self.local_margin):
+            return None
+        self.decisions["local"] += 1
+        return self.get_output_dict("allowed", "")
+
+    def get_input_messages(self, messages):
         messages = deepcopy(messages)
 
         system_prompt = """
@@ -41,26 +112,23 @@ class GuardAgent:
             """
 
         input_messages = [{"role": "system", "content": system_prompt}]  + messages[-3:]
-
-        chatbot_response = get_chat_response(self.client, self.model_name, input_messages,max_tokens=1000)
-        output = self.postprocess(chatbot_response)
-
-        return output
+        return input_messages
     
     def postprocess(self, response):
         print("the gaurd agent response : ",response)
-        try:
-            output = json.loads(response)
-        except:
-            corrected_json = double_check_json_output(self.client,self.model_name,response)
-            output = json.loads(corrected_json)
+        # ensure_json_output already ran on both the sync and the async path, it keeps the repair stats
+        output = json.loads(response)
         
+        coerce_fields(output, ("decision", "message"))
+        return self.get_output_dict(output["decision"], output["message"])
+
+    def get_output_dict(self, decision, message):
         dict_output = {
             "role": "assistant",
-            "content": output["message"],
+            "content": message,
             "memory":{
                 "agent":"gurad_agent",
-                "guard_decision":output["decision"],
+                "guard_decision":decision,
             }
         }
 
@@ -0,0 +1,184 @@
+import json
+import threading
+
+# python style literals the model sometimes writes instead of json ones
+BARE_WORDS = {"True": "true", "False": "false", "None": "null", "true": "true", "false": "false", "null": "null"}
+CLOSERS = {"{": "}", "[": "]"}
+
+
+class JsonRepairStats:
+    """Counts which path turned each llm output into json.
+
+    "valid" parsed as is, "extracted" needed the surrounding prose removed, "repaired" needed syntax fixes,
+    "llm" went to the llm fixer and "failed" could not be parsed at all.
+    """
+
+    PATHS = ("valid", "extracted", "repaired", "llm", "failed")
+
+    def __init__(self):
+        self.counters = dict.fromkeys(self.PATHS, 0)
+        self.lock = threading.Lock()
+
+    def record(self, path):
+        with self.lock:
+            self.counters[path] += 1
+
+    def stats(self):
+        total = sum(self.counters.values())
+        return {path: {"count": count, "rate": count / total if total else 0.0} for path, count in self.counters.items()}
+
+
+json_repair_stats = JsonRepairStats()
+
+
+def extract_object(text):
+    # the first balanced {...} in the text, missing closing brackets are added when the output was cut off
+    start = text.find("{")
+    if start < 0:
+        return None
+    stack = []
+    quote = None
+    i = start
+    while i < len(text):
+        char = text[i]
+        if quote is not None:
+            if char == "\\":
+                i += 2
+                continue
+            if char == quote:
+                quote = None
+        elif char in "\"'":
+            quote = char
+        elif char in CLOSERS:
+            stack.append(CLOSERS[char])
+        elif char in "}]":
+            if stack and stack[-1] == char:
+                stack.pop()
+            if not stack:
+                return text[start:i + 1]
+        i += 1
+
+    tail = text[start:]
+    if quote is not None:
+        tail += quote
+    return tail + "".join(reversed(stack))
+
+
+def fix_syntax(text):
+    # rewrites single quoted strings, bare words, trailing and missing commas into strict json
+    output = []
+    last = None  # "open", "colon", "comma" or "value"
+    i = 0
+
+    def start_value():
+        if last == "value":
+            output.append(",")
+
+    while i < len(text):
+        char = text[i]
+
+        if char in "\"'":
+            start_value()
+            j = i + 1
+            value = []
+            while j < len(text) and text[j] != char:
+                if text[j] == "\\" and j + 1 < len(text):
+                    escaped = text[j + 1]
+                    # \' is not a json escape
+                    value.append("'" if escaped == "'" else "\\" + escaped)
+                    j += 2
+                    continue
+                if text[j] == '"':
+                    value.append('\\"')
+                elif text[j] == "\n":
+                    value.append("\\n")
+                elif text[j] == "\t":
+                    value.append("\\t")
+                else:
+                    value.append(text[j])
+                j += 1
+            output.append('"' + "".join(value) + '"')
+            last = "value"
+            i = j + 1
+        elif char in "{[":
+            start_value()
+            output.append(char)
+            last = "open"
+            i += 1
+        elif char in "}]":
+            while output and output[-1] == ",":
+                output.pop()
+            output.append(char)
+            last = "value"
+            i += 1
+        elif char == ":":
+            output.append(char)
+            last = "colon"
+            i += 1
+        elif char == ",":
+            if last == "value":
+                output.append(char)
+                last = "comma"
+            i += 1
+        elif char.isspace():
+            i += 1
+        else:
+            # numbers, literals and unquoted words run until the next delimiter
+            j = i
+            while j < len(text) and text[j] not in ",:{}[]\"'\n":
+                j += 1
+            word = text[i:j].strip()
+            start_value()
+            if word in BARE_WORDS:
+                output.append(BARE_WORDS[word])
+            else:
+                try:
+                    json.loads(word)
+                    output.append(word)
+                except ValueError:
+                    output.append(json.dumps(word))
+            last = "value"
+            i = j
+
+    return "".join(output)
+
+
+def repair_json(text):
+    """Parses llm output that should hold one json object, returns (object, path) or (None, "failed")."""
+    if not isinstance(text, str):
+        return None, "failed"
+    try:
+        output = json.loads(text)
+        if isinstance(output, dict):
+            return output, "valid"
+    except ValueError:
+        pass
+
+    candidate = extract_object(text)
+    if candidate is None:
+        return None, "failed"
+    try:
+        return json.loads(candidate), "extracted"
+    except ValueError:
+        pass
+
+    try:
+        output = json.loads(fix_syntax(candidate))
+    except ValueError:
+        return None, "failed"
+    if not isinstance(output, dict):
+        return None, "failed"
+    return output, "repaired"
+
+
+def coerce_fields(output, fields):
+    # the prompts ask for string values, numbers and nulls are turned into stripped strings
+    for field in fields:
+        value = output.get(field)
+        if value is None:
+            output[field] = ""
+        elif not isinstance(value, str):
+            output[field] = str(value)
+        else:
+            output[field] = value.strip()
+    return output
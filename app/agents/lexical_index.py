@@ -0,0 +1,71 @@
+import math
+import re
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+# words of the questions rather than the products, they would rank the long about section first
+STOP_WORDS = frozenset("""
+a about an and any anything are as at be can could do does for from have how i in is it me much my of on or our
+please s so some that the there this to want what whats which with would you your
+""".split())
+
+
+def tokenize(text):
+    # lowercase words and prices, "scones" matches "scone" and "merry's" matches "merry"
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOP_WORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    """In-memory inverted index over the product documents, scored with BM25.
+
+    Each posting holds its precomputed term score so a query only sums the postings of its terms.
+    """
+
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.size = len(documents)
+        term_counts = []
+        for document in documents:
+            counts = {}
+            for token in tokenize(document):
+                counts[token] = counts.get(token, 0) + 1
+            term_counts.append(counts)
+
+        lengths = [sum(counts.values()) for counts in term_counts]
+        average_length = sum(lengths) / len(lengths) if lengths else 0
+        document_frequency = {}
+        for counts in term_counts:
+            for token in counts:
+                document_frequency[token] = document_frequency.get(token, 0) + 1
+
+        # term -> [(document id, score)]
+        self.postings = {}
+        for doc_id, counts in enumerate(term_counts):
+            norm = k1 * (1 - b + b * lengths[doc_id] / average_length) if average_length else k1
+            for token, count in counts.items():
+                frequency = document_frequency[token]
+                idf = math.log(1 + (self.size - frequency + 0.5) / (frequency + 0.5))
+                self.postings.setdefault(token, []).append((doc_id, idf * count * (k1 + 1) / (count + norm)))
+
+    def search(self, query, top_k=10):
+        # document ids, best first, only documents sharing a term with the query
+        scores = {}
+        for token in set(tokenize(query)):
+            for doc_id, score in self.postings.get(token, ()):
+                scores[doc_id] = scores.get(doc_id, 0.0) + score
+        return sorted(scores, key=lambda doc_id: (-scores[doc_id], doc_id))[:top_k]
+
+
+def reciprocal_rank_fusion(rankings, k=60, top_k=None):
+    # rankings are lists of document ids, best first. ties go to the earlier ranking
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    fused = sorted(scores, key=lambda doc_id: -scores[doc_id])
+    return fused[:top_k] if top_k is not None else fused
@@ -0,0 +1,77 @@
+import threading
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient, Timeout, DEFAULT_CONNECTION_LIMITS
+from config import settings
+
+# httpx's Limits, taken from openai so it always matches the httpx build the client runs on
+Limits = type(DEFAULT_CONNECTION_LIMITS)
+
+
+def get_http_options():
+    http2 = settings.LLM_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            print("Error: LLM_HTTP2 needs the h2 package (pip install 'httpx[http2]'), using HTTP/1.1")
+            http2 = False
+    return {
+        "limits": Limits(
+            max_connections=settings.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": Timeout(settings.LLM_TIMEOUT, connect=settings.LLM_CONNECT_TIMEOUT),
+        "http2": http2,
+    }
+
+
+def create_llm_client():
+    return OpenAI(
+        api_key=settings.TOKEN,
+        base_url=settings.BASE_URL,
+        max_retries=settings.LLM_MAX_RETRIES,
+        http_client=DefaultHttpxClient(**get_http_options()),
+    )
+
+
+def create_async_llm_client():
+    return AsyncOpenAI(
+        api_key=settings.TOKEN,
+        base_url=settings.BASE_URL,
+        max_retries=settings.LLM_MAX_RETRIES,
+        http_client=DefaultAsyncHttpxClient(**get_http_options()),
+    )
+
+
+llm_client = None
+async_llm_client = None
+llm_client_lock = threading.Lock()
+
+
+def get_llm_client():
+    """One OpenAI client per process, every agent shares its connection pool to the llm server."""
+    global llm_client
+    with llm_client_lock:
+        if llm_client is None:
+            llm_client = create_llm_client()
+    return llm_client
+
+
+def get_async_llm_client():
+    # the async pool belongs to the event loop that first uses it, the api's loop
+    global async_llm_client
+    with llm_client_lock:
+        if async_llm_client is None:
+            async_llm_client = create_async_llm_client()
+    return async_llm_client
+
+
+async def aclose_llm_clients():
+    global llm_client, async_llm_client
+    with llm_client_lock:
+        client, async_client = llm_client, async_llm_client
+        llm_client = async_llm_client = None
+    if client is not None:
+        client.close()
+    if async_client is not None:
+        await async_client.close()
@@ -0,0 +1,53 @@
+import json
+import faiss
+import numpy as np
+
+
+class EmbeddingKNNClassifier:
+    """Labels a message by a similarity weighted vote of its nearest labelled examples.
+
+    Runs in microseconds on top of an embedding, so agents can skip their LLM call whenever the vote is clear.
+    """
+
+    def __init__(self, embeddings, labels, k=7, temperature=0.05):
+        self.labels = np.array(labels)
+        self.label_names = list(dict.fromkeys(labels))
+        self.k = min(k, len(labels))
+        self.temperature = temperature
+
+        # embeddings are normalised, so inner product is the cosine similarity
+        self.index = faiss.IndexFlatIP(embeddings.shape[1])
+        self.index.add(np.ascontiguousarray(embeddings, dtype=np.float32))
+
+    @classmethod
+    def from_examples(cls, embedding_service, examples, **kwargs):
+        # examples is a list of (text, label) pairs
+        texts = [text for text, _ in examples]
+        labels = [label for _, label in examples]
+        return cls(embedding_service.embed_many(texts), labels, **kwargs)
+
+    @classmethod
+    def from_json(cls, embedding_service, path, **kwargs):
+        # {"label": ["example", ...], ...}
+        with open(path) as f:
+            labelled = json.load(f)
+        examples = [(text, label) for label, texts in labelled.items() for text in texts]
+        return cls.from_examples(embedding_service, examples, **kwargs)
+
+    def scores(self, query_embedding):
+        # share of the vote per label, highest first
+        D, I = self.index.search(query_embedding, self.k)
+        similarities = D[0][I[0] >= 0]
+        neighbours = self.labels[I[0][I[0] >= 0]]
+        # sharpen the vote so the closest examples dominate
+        weights = np.exp((similarities - similarities.max()) / self.temperature)
+        totals = {label: float(weights[neighbours == label].sum()) for label in self.label_names}
+        total = sum(totals.values())
+        return dict(sorted(((label, value / total) for label, value in totals.items()), key=lambda item: -item[1]))
+
+    def predict(self, query_embedding):
+        # returns (label, confidence, margin over the runner up)
+        ranked = list(self.scores(query_embedding).items())
+        label, confidence = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        return label, confidence, confidence - runner_up
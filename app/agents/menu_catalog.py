@@ -0,0 +1,84 @@
+import json
+from decimal import Decimal
+
+
+def format_price(price):
+    return f"${price:.2f}"
+
+
+def normalize_name(name):
+    return " ".join(str(name).lower().split())
+
+
+class MenuCatalog:
+    """The menu and its prices. The order taking prompt lists it and orders are priced from it, never by the model."""
+
+    def __init__(self, items):
+        # items are {"name", "category", "price", "aliases", "recommendation_name"}, prices are strings so they stay exact.
+        # recommendation_name is the product name of the mined rules when the menu name differs from it
+        self.items = []
+        self.lookup = {}
+        for item in items:
+            item = {
+                "name": item["name"],
+                "category": item["category"],
+                "price": Decimal(str(item["price"])),
+                "aliases": item.get("aliases", []),
+                "recommendation_name": item.get("recommendation_name", item["name"]),
+            }
+            self.items.append(item)
+            for name in [item["name"]] + item["aliases"]:
+                self.lookup.setdefault(normalize_name(name), item)
+
+    @classmethod
+    def from_json(cls, path):
+        with open(path, "r") as f:
+            return cls(json.load(f))
+
+    def find(self, name):
+        return self.lookup.get(normalize_name(name))
+
+    def recommendation_name(self, name):
+        # the apriori rules only know the product names of the order history, e.g. "Dark chocolate"
+        item = self.find(name)
+        return item["recommendation_name"] if item is not None else name
+
+    def menu_text(self):
+        return "\n".join(f"{item['name']} - {format_price(item['price'])}" for item in self.items)
+
+    def price_order(self, order):
+        """Validates the items the model extracted and prices them.
+
+        Returns the order lines {"item", "quantity", "price"} with the line price as "$x.xx", the total as "$x.xx" and
+        the names that are not on the menu. Lines for the same item are merged, a quantity below 1 removes the item.
+        """
+        quantities = {}
+        unknown = []
+        for line in order or []:
+            if not isinstance(line, dict):
+                continue
+            name = line.get("item", "")
+            item = self.find(name)
+            if item is None:
+                unknown.append(name)
+                continue
+            # the old prompt spelled it "quanitity", orders saved before the catalog still have it
+            quantity = line.get("quantity", line.get("quanitity", 1))
+            try:
+                quantity = int(float(quantity))
+            except (TypeError, ValueError):
+                quantity = 1
+            quantities[item["name"]] = quantities.get(item["name"], 0) + quantity
+
+        lines = []
+        total = Decimal("0")
+        for name, quantity in quantities.items():
+            if quantity < 1:
+                continue
+            price = self.find(name)["price"] * quantity
+            total += price
+            lines.append({"item": name, "quantity": quantity, "price": format_price(price)})
+        return lines, format_price(total), unknown
+
+    def receipt(self, lines, total):
+        return "\n".join([f"- {line['quantity']} x {line['item']}: {line['price']}" for line in lines] + [f"Total: {total}"])
@@ -1,54 +1,122 @@
-from openai import OpenAI
+import asyncio
 import os
 import pandas as pd
 from copy import deepcopy
-from .utils import get_chat_response, double_check_json_output
+from .llm_client import get_llm_client, get_async_llm_client
+from .utils import get_chat_response, aget_chat_response, astream_chat_response, JsonFieldStreamer, ensure_json_output, aensure_json_output
+from .context_builder import ContextBuilder
+from .menu_catalog import MenuCatalog
+from .classification_agent import ORDER_CLOSING_STEP
 import json
 from config import settings
 
 
 class OrderTakingAgent:
-    def __init__(self,recommendation_agent):
-        self.client = OpenAI(
-            api_key=settings.TOKEN,
-            base_url=settings.BASE_URL,
-        )
+    def __init__(self,recommendation_agent, client=None, async_client=None):
+        # every agent shares the process wide pooled clients unless others are passed in
+        self.client = client or get_llm_client()
+        self.async_client = async_client or get_async_llm_client()
         self.model_name = settings.MODEL_NAME
         self.recommendation_agent = recommendation_agent
+        # the model only picks items and quantities, prices and totals come from the catalog
+        self.menu = MenuCatalog.from_json(settings.MENU_PATH)
+        self.context_builder = ContextBuilder(
+            token_budget=settings.ORDER_CONTEXT_TOKEN_BUDGET,
+            recent_messages=settings.ORDER_CONTEXT_RECENT_MESSAGES,
+            summary_batch=settings.ORDER_CONTEXT_SUMMARY_BATCH,
+        )
+
+    def get_response(self,messages,state=None):
+        messages = deepcopy(messages)
+        input_messages, asked_recommendation_before, summary = self.get_input_messages(messages, state)
 
-    
+        chatbot_output = get_chat_response(self.client,self.model_name,input_messages,agent="order_taking_agent",json_mode=True)
+        chatbot_output = ensure_json_output(self.client,self.model_name,chatbot_output)
+        summary = self.update_summary(messages,summary)
+
+        output = self.postprocess(chatbot_output,messages,asked_recommendation_before,summary)
+
+        return output
 
-    def get_response(self,messages):
+    async def aget_response(self,messages,state=None):
         messages = deepcopy(messages)
+        input_messages, asked_recommendation_before, summary = self.get_input_messages(messages, state)
+        # the summary is for the next turns, it is updated while this one is answered
+        summary_task = asyncio.create_task(self.aupdate_summary(messages,summary))
+        try:
+            chatbot_output = await aget_chat_response(self.async_client,self.model_name,input_messages,agent="order_taking_agent",json_mode=True)
+            chatbot_output = await aensure_json_output(self.async_client,self.model_name,chatbot_output)
+
+            output = self.parse_output(chatbot_output)
+            response = self.get_response_text(output)
+            if not asked_recommendation_before and len(output["order"])>0:
+                recommendation_output = await self.recommendation_agent.aget_recommendations_from_order(messages,output['order'])
+                response = recommendation_output['content']
+                asked_recommendation_before = True
+
+            return self.get_output_dict(output,response,asked_recommendation_before,await summary_task)
+        finally:
+            # a failed or cancelled turn saves no summary, its llm call is stopped
+            summary_task.cancel()
+
+    async def astream_response(self,messages,state=None):
+        # the model answers in json, only the "response" field is streamed to the user
+        messages = deepcopy(messages)
+        input_messages, asked_recommendation_before, summary = self.get_input_messages(messages, state)
+        summary_task = asyncio.create_task(self.aupdate_summary(messages,summary))
+        try:
+            field_streamer = JsonFieldStreamer("response")
+            chatbot_output = ""
+            streamed = ""
+            async for token in astream_chat_response(self.async_client,self.model_name,input_messages,json_mode=True):
+                chatbot_output += token
+                text = field_streamer.feed(token)
+                if text:
+                    streamed += text
+                    yield {"event": "token", "data": text}
+
+            chatbot_output = await aensure_json_output(self.async_client,self.model_name,chatbot_output)
+            output = self.parse_output(chatbot_output)
+
+            if not asked_recommendation_before and len(output["order"])>0:
+                # the recommendation replaces what was streamed so far
+                yield {"event": "reset", "data": ""}
+                async for event in self.recommendation_agent.astream_recommendations_from_order(messages,output['order']):
+                    if event["event"] == "done":
+                        response = event["data"]["content"]
+                    else:
+                        yield event
+                yield {"event": "done", "data": self.get_output_dict(output,response,True,await summary_task)}
+                return
+
+            response = output['response']
+            if response != streamed:
+                # the streamed text didn't survive json repair, send the final answer instead
+                yield {"event": "reset", "data": ""}
+                yield {"event": "token", "data": response}
+            response_text = self.get_response_text(output)
+            if response_text != response:
+                # the bill follows the streamed answer
+                yield {"event": "token", "data": response_text[len(response):]}
+                response = response_text
+            yield {"event": "done", "data": self.get_output_dict(output,response,asked_recommendation_before,await summary_task)}
+        finally:
+            # also when the caller stops reading the stream, e.g. a discarded speculative run
+            summary_task.cancel()
+
+    def get_input_messages(self,messages,state=None):
         system_prompt = """
             You are a customer support Bot for a coffee shop called "Merry's way"
 
             here is the menu for this coffee shop.
 
-            Cappuccino - $4.50
-            Jumbo Savory Scone - $3.25
-            Latte - $4.75
-            Chocolate Chip Biscotti - $2.50
-            Espresso shot - $2.00
-            Hazelnut Biscotti - $2.75
-            Chocolate Croissant - $3.75
-            Dark chocolate (Drinking Chocolate) - $5.00
-            Cranberry Scone - $3.50
-            Croissant - $3.25
-            Almond Croissant - $4.00
-            Ginger Biscotti - $2.50
-            Oatmeal Scone - $3.25
-            Ginger Scone - $3.50
-            Chocolate syrup - $1.50
-            Hazelnut syrup - $1.50
-            Carmel syrup - $1.50
-            Sugar Free Vanilla syrup - $1.50
-            Dark chocolate (Packaged Chocolate) - $3.00
+            """ + self.menu.menu_text() + """
 
             Things to NOT DO:
             * DON't ask how to pay by cash or Card.
             * Don't tell the user to go to the counter
             * Don't tell the user to go to place to get the order
+            * Don't calculate prices or totals, the itemized bill is added to your last response automatically
 
 
             You're task is as follows:
@@ -57,10 +125,7 @@ class OrderTakingAgent:
             3. if an item is not in the menu let the user and repeat back the remaining valid order
             4. Ask them if they need anything else from the menu.
             5. If they do then repeat starting from step 3
-            6. If they don't want anything else. Using the "order" object that is in the output. Make sure to hit all three points
-                1. list down all the items and their prices
-                2. calculate the total. 
-                3. Thank the user for the order and close the conversation with no more questions
+            6. If they don't want anything else. Thank the user for the order and close the conversation with no more questions
 
             The user message will contain a section called memory. This section will contain the following:
             "order"
@@ -72,66 +137,106 @@ class OrderTakingAgent:
             {
             "chain of thought": Write down your critical thinking about what is the maximum task number the user is on write now. Then write down your critical thinking about the user input and it's relation to the coffee shop process. Then write down your thinking about how you should respond in the response parameter taking into consideration the Things to NOT DO section. and Focus on the things that you should not do. 
             "step_number": Determine which task you are on based on the conversation.
-            "order": this is going to be a list of jsons like so. [{"item":put the item name, "quanitity": put the number that the user wants from this item default is 1, "price":put the total price of the item }]
+            "order": this is going to be a list of jsons like so. [{"item":put the item name exactly as in the menu, "quantity": put the number that the user wants from this item default is 1}]
             "response": write the a response to the user.
             }
         """
 
-        last_order_taking_status = ""
         asked_recommendation_before = False
-        message = None
-        for message_index in range(len(messages)-1,0,-1):
-            current_message = messages[message_index]
-            
-            if current_message["role"] == "assistant" and "memory" in current_message and current_message["memory"].get("agent", "") == "order_taking_agent":
-                step_number = current_message["memory"]["step_number"]
-                order = current_message["memory"]["order"]
-                asked_recommendation_before = current_message["memory"]["asked_recommendation_before"]
-                last_order_taking_status = f"""
-                step_number: {step_number}
+        summary = None
+        order_state = self.get_order_state(messages, state)
+        if order_state is not None:
+            asked_recommendation_before = order_state["asked_recommendation_before"]
+            summary = order_state.get("summary")
+            order = [{"item": line["item"], "quantity": line.get("quantity", line.get("quanitity", 1))} for line in order_state["order"]]
+            last_order_taking_status = f"""
+                step_number: {order_state["step_number"]}
                 order: {order}
                 """
-                message = current_message
-                break
-        
-        if message is None:    
             messages[-1]['content'] = last_order_taking_status + " \n "+ messages[-1]['content']
 
-        input_messages = [{"role": "system", "content": system_prompt}] + messages        
+        # long sessions keep the recent turns and a summary of the older ones within the token budget
+        input_messages = self.context_builder.build(system_prompt, messages, summary)
+        return input_messages, asked_recommendation_before, summary
 
-        chatbot_output = get_chat_response(self.client,self.model_name,input_messages)
+    def update_summary(self,messages,summary):
+        to_fold = self.context_builder.messages_to_fold(messages, summary)
+        if not to_fold:
+            return summary
+        try:
+            summary_messages = self.context_builder.get_summary_messages(summary, to_fold)
+            summary_text = get_chat_response(self.client,self.model_name,summary_messages,max_tokens=300,agent="order_summary",timeout=settings.LLM_ROUTING_TIMEOUT)
+            return self.context_builder.fold(to_fold, summary_text)
+        except Exception as e:
+            # the old summary is still valid, the messages are folded on a later turn
+            print(f"Error: could not update the order summary: {e}")
+            return summary
+
+    async def aupdate_summary(self,messages,summary):
+        to_fold = self.context_builder.messages_to_fold(messages, summary)
+        if not to_fold:
+            return summary
+        try:
+            summary_messages = self.context_builder.get_summary_messages(summary, to_fold)
+            summary_text = await aget_chat_response(self.async_client,self.model_name,summary_messages,max_tokens=300,agent="order_summary",timeout=settings.LLM_ROUTING_TIMEOUT)
+            return self.context_builder.fold(to_fold, summary_text)
+        except Exception as e:
+            print(f"Error: could not update the order summary: {e}")
+            return summary
 
-        output = self.postprocess(chatbot_output,messages,asked_recommendation_before)
 
-        return output
+    def get_order_state(self,messages,state):
+        # the state store answers directly, the history is only scanned when there is no store
+        if state is not None:
+            return state.get("order_taking_agent")
 
+        for current_message in reversed(messages):
+            if current_message["role"] == "assistant" and current_message.get("memory") and current_message["memory"].get("agent", "") == "order_taking_agent":
+                return current_message["memory"]
+        return None
 
-    def postprocess(self,response,messages,asked_recommendation_before):
+    def postprocess(self,response,messages,asked_recommendation_before,summary=None):
+        output = self.parse_output(response)
+
+        response = self.get_response_text(output)
+        if not asked_recommendation_before and len(output["order"])>0:
+            recommendation_output = self.recommendation_agent.get_recommendations_from_order(messages,output['order'])
+            response = recommendation_output['content']
+            asked_recommendation_before = True
+
+        return self.get_output_dict(output,response,asked_recommendation_before,summary)
+
+    def parse_output(self,response):
         print("order taking response is : ",response)
-        try:
-            output = json.loads(response)
-        except:
-            corrected_json = double_check_json_output(self.client,self.model_name,response)
-            output = json.loads(corrected_json)
+        # the callers run ensure_json_output first
+        output = json.loads(response)
 
         if type(output["order"]) == str:
             output["order"] = json.loads(output["order"])
 
+        output["order"], output["total"], unknown = self.menu.price_order(output["order"])
+        if unknown:
+            print(f"order items not on the menu were dropped: {unknown}")
+        return output
+
+    def get_response_text(self,output):
+        # the closing answer gets the bill computed from the catalog
         response = output['response']
-        if not asked_recommendation_before and len(output["order"])>0:
-            recommendation_output = self.recommendation_agent.get_recommendations_from_order(messages,output['order'])
-            response = recommendation_output['content']
-            asked_recommendation_before = True
+        if str(output["step_number"]).strip() == ORDER_CLOSING_STEP and len(output["order"])>0:
+            response = response + "\n\n" + self.menu.receipt(output["order"], output["total"])
+        return response
 
+    def get_output_dict(self,output,response,asked_recommendation_before,summary=None):
         dict_output = {
             "role": "assistant",
             "content": response ,
             "memory": {"agent":"order_taking_agent",
                        "step_number": output["step_number"],
                        "order": output["order"],
-                       "asked_recommendation_before": asked_recommendation_before
+                       "total": output["total"],
+                       "asked_recommendation_before": asked_recommendation_before,
+                       "summary": summary
                       }
         }
 
-        
         return dict_output
\ No newline at end of file
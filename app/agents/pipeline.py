@@ -0,0 +1,171 @@
+import asyncio
+import time
+from typing import Dict, Any, List, Optional
+from .agent_protocol import AgentProtocol
+from .state_store import StateStore
+from config import settings
+
+
+SPECULATIVE_MODES = ("off", "classification", "full")
+
+
+class AgentPipeline:
+    """Runs a message through the guard, the classifier and the chosen agent."""
+
+    def __init__(self, guard_agent: AgentProtocol, classification_agent: AgentProtocol, agent_dict: Dict[str, AgentProtocol], speculative_mode: str = None, state_store: Optional[StateStore] = None):
+        self.guard_agent = guard_agent
+        self.classification_agent = classification_agent
+        self.agent_dict = agent_dict
+        # without a store the agents rebuild their state from the chat history
+        self.state_store = state_store
+
+        if speculative_mode is None:
+            speculative_mode = settings.SPECULATIVE_EXECUTION
+        if speculative_mode not in SPECULATIVE_MODES:
+            raise ValueError(f"speculative_mode must be one of {SPECULATIVE_MODES}, got {speculative_mode!r}")
+        self.speculative_mode = speculative_mode
+
+        # how much speculative work was started and how much of it was thrown away
+        self.speculation_stats = {
+            "speculated": 0,
+            "wasted": 0,
+            "wasted_seconds": 0.0,
+        }
+
+    def stats(self):
+        # counters of this worker since it started, for GET /stats
+        speculated = self.speculation_stats["speculated"]
+        return dict(
+            self.speculation_stats,
+            mode=self.speculative_mode,
+            wasted_rate=self.speculation_stats["wasted"] / speculated if speculated else 0.0,
+        )
+
+    def get_response(self, messages: List[Dict[str, Any]], session_id=None) -> Dict[str, Any]:
+        state = self.load_state(messages, self.state_store.get(session_id)) if self.uses_state(session_id) else None
+
+        # Get Guard agent response
+        response = self.guard_agent.get_response(messages)
+        if response["memory"]["guard_decision"] != "allowed":
+            return response
+
+        # Get classification agent
+        response = self.classification_agent.get_response(messages, state=state)
+        chosen_agent = response["memory"]["classification_decision"]
+
+        # get the chosen agent's response
+        agent = self.agent_dict[chosen_agent]
+        response = self.with_route(agent.get_response(messages, state=state), response)
+        if self.uses_state(session_id):
+            self.state_store.set(session_id, self.next_state(state, response))
+        return response
+
+    async def aget_response(self, messages: List[Dict[str, Any]], session_id=None) -> Dict[str, Any]:
+        state = self.load_state(messages, await self.state_store.aget(session_id)) if self.uses_state(session_id) else None
+
+        # in "full" mode the routed agent is part of the speculative work too
+        run_agent = self.speculative_mode != "classification"
+        rejection, routed = await self.aguard_and_route(messages, run_agent=run_agent, state=state)
+        if rejection is not None:
+            return rejection
+        if not run_agent:
+            agent = self.agent_dict[routed["memory"]["classification_decision"]]
+            routed = self.with_route(await agent.aget_response(messages, state=state), routed)
+
+        if self.uses_state(session_id):
+            await self.state_store.aset(session_id, self.next_state(state, routed))
+        return routed
+
+    async def astream_response(self, messages: List[Dict[str, Any]], session_id=None):
+        # yields {"event": "token" | "reset" | "done", "data": ...} dicts, only the final agent is streamed
+        state = self.load_state(messages, await self.state_store.aget(session_id)) if self.uses_state(session_id) else None
+
+        rejection, routed = await self.aguard_and_route(messages, run_agent=False, state=state)
+        if rejection is not None:
+            yield {"event": "token", "data": rejection["content"]}
+            yield {"event": "done", "data": rejection}
+            return
+
+        agent = self.agent_dict[routed["memory"]["classification_decision"]]
+        async for event in agent.astream_response(messages, state=state):
+            if event["event"] == "done":
+                event = {**event, "data": self.with_route(event["data"], routed)}
+                if self.uses_state(session_id):
+                    await self.state_store.aset(session_id, self.next_state(state, event["data"]))
+            yield event
+
+    def uses_state(self, session_id):
+        return self.state_store is not None and session_id is not None
+
+    def load_state(self, messages, state):
+        if state is not None:
+            return state
+        # nothing stored for this user yet, or it expired: rebuild it once from the history
+        state = {}
+        for message in messages:
+            memory = message.get("memory") or {}
+            if message["role"] == "assistant" and memory.get("agent") in self.agent_dict:
+                state = self.next_state(state, message)
+        return state
+
+    def next_state(self, state, response):
+        # the answering agent's memory replaces its previous entry, e.g. the current order
+        memory = response.get("memory") or {}
+        state = dict(state or {})
+        state["last_agent"] = memory.get("agent")
+        if memory.get("agent"):
+            state[memory["agent"]] = memory
+        return state
+
+    async def aroute(self, messages, run_agent, state=None):
+        response = await self.classification_agent.aget_response(messages, state=state)
+        if not run_agent:
+            return response
+
+        chosen_agent = response["memory"]["classification_decision"]
+        agent = self.agent_dict[chosen_agent]
+        return self.with_route(await agent.aget_response(messages, state=state), response)
+
+    def with_route(self, response, routed):
+        # the stored reply records how it was routed, scripts/build_intent_examples.py only learns from llm decisions
+        source = (routed.get("memory") or {}).get("decision_source")
+        if source is None or response.get("memory") is None:
+            return response
+        return {**response, "memory": {**response["memory"], "routed_by": source}}
+
+    async def aguard_and_route(self, messages, run_agent, state=None):
+        # returns (guard response, None) when the guard rejects the message, (None, routed response) otherwise
+        if self.speculative_mode == "off":
+            response = await self.guard_agent.aget_response(messages)
+            if response["memory"]["guard_decision"] != "allowed":
+                return response, None
+            return None, await self.aroute(messages, run_agent=run_agent, state=state)
+
+        # guard rejections are rare, so start routing before the guard has answered
+        timing = {"started_at": time.perf_counter(), "finished_at": None}
+
+        async def speculate():
+            try:
+                return await self.aroute(messages, run_agent=run_agent, state=state)
+            finally:
+                timing["finished_at"] = time.perf_counter()
+
+        speculative_task = asyncio.create_task(speculate())
+        # a discarded task is never awaited, mark its exception as retrieved
+        speculative_task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        self.speculation_stats["speculated"] += 1
+
+        try:
+            response = await self.guard_agent.aget_response(messages)
+        except BaseException:
+            speculative_task.cancel()
+            raise
+
+        if response["memory"]["guard_decision"] != "allowed":
+            speculative_task.cancel()
+            finished_at = timing["finished_at"] or time.perf_counter()
+            self.speculation_stats["wasted"] += 1
+            self.speculation_stats["wasted_seconds"] += finished_at - timing["started_at"]
+            return response, None
+
+        return None, await speculative_task
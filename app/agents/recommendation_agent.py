@@ -1,84 +1,70 @@
-from openai import OpenAI
 import os
-import pandas as pd
 from copy import deepcopy
-from .utils import get_chat_response, double_check_json_output
+from .llm_client import get_llm_client, get_async_llm_client
+from .utils import get_chat_response, aget_chat_response, astream_chat_response, ensure_json_output, aensure_json_output
+from .recommendation_index import ReloadableRecommendationIndex
+from .menu_catalog import MenuCatalog
 import json
 from config import settings
 
 
 
 class RecommendationAgent:
-    def __init__(self,apriori_recommendation_path, popular_recommendation_path):
-        self.client = OpenAI(
-            api_key=settings.TOKEN,
-            base_url=settings.BASE_URL,
-        )
+    def __init__(self,apriori_recommendation_path, popular_recommendation_path, client=None, async_client=None):
+        # every agent shares the process wide pooled clients unless others are passed in
+        self.client = client or get_llm_client()
+        self.async_client = async_client or get_async_llm_client()
         self.model_name = settings.MODEL_NAME
 
-        with open(apriori_recommendation_path, "r") as f:
-            self.apriori_recommendation = json.load(f)
-        
-        self.popular_recommendation = pd.read_csv(popular_recommendation_path)
-
-        self.products = self.popular_recommendation["product"].tolist()
-        self.products_categories = list(set(self.popular_recommendation["product_category"].tolist()))
-    
-    def get_apriori_recommendation(self, products, top_k=5):
-        recommendation_list = []
-        
-
-        for product in products:
-            if product in self.apriori_recommendation:
-                recommendation_list.extend(self.apriori_recommendation[product])
-            
-        # sort recommendation list by confidence
-        recommendation_list = sorted(recommendation_list, key=lambda x: x['confidence'], reverse=True)
-
-        recommendations = []
-        recommendations_per_category = {}
-
-        for recommendation in recommendation_list:
-            if recommendation in recommendations:
-                continue
-
-            # limit 2 recommendation per category
-            product_category = recommendation["product_category"]
-
-            if product_category not in recommendations_per_category:
-                recommendations_per_category[product_category] = 0
+        # the static files are used until scripts/mine_recommendations.py publishes rules mined from the orders
+        self.recommendation_index = ReloadableRecommendationIndex(
+            apriori_recommendation_path,
+            popular_recommendation_path,
+            live_dir=settings.RECOMMENDATION_LIVE_DIR,
+            check_interval=settings.RECOMMENDATION_RELOAD_INTERVAL,
+        )
+        # orders carry the menu names, the rules are keyed by the names of the order history
+        self.menu = MenuCatalog.from_json(settings.MENU_PATH)
 
-            if recommendations_per_category[product_category] >=2:
-                continue
+    @property
+    def index(self):
+        return self.recommendation_index.index
 
-            recommendations_per_category[product_category] += 1
+    @property
+    def products(self):
+        return self.index.product_names
 
-            # add recommendation
-            recommendations.append(recommendation['product'])
-            if len(recommendations) >= top_k:
-                break
+    @property
+    def products_categories(self):
+        return self.index.category_names
+    
+    def get_apriori_recommendation(self, products, top_k=5):
+        # highest confidence rules first, limited to 2 recommendations per category
+        return self.index.apriori(products, top_k)
 
-        return recommendations
+    def get_popular_recommendation(self, product_category=None, top_k=5):
+        return self.index.popular_products(product_category, top_k)
 
 
-    def get_popular_recommendation(self, product_category=None, top_k=5):
-        popular_recommendation = self.popular_recommendation
+    def recommendation_classification(self,messages):
+        input_messages = self.get_classification_messages(messages)
 
-        if type(product_category) == str:
-            product_category = [product_category]
+        chatbot_output =get_chat_response(self.client,self.model_name,input_messages,agent="recommendation_classification",json_mode=True)
+        chatbot_output = ensure_json_output(self.client,self.model_name,chatbot_output)
 
-        if product_category is not None:
-            popular_recommendation = self.popular_recommendation[self.popular_recommendation["product_category"].isin(product_category)]
-        popular_recommendation = popular_recommendation.sort_values('count',ascending=False)
+        output = self.postprocess_classfication(chatbot_output)
+        return output
 
-        if popular_recommendation.shape[0]==0:
-            return []
+    async def arecommendation_classification(self,messages):
+        input_messages = self.get_classification_messages(messages)
 
-        popular_recommendation = popular_recommendation['product'].head(top_k).tolist()
-        return popular_recommendation
+        chatbot_output = await aget_chat_response(self.async_client,self.model_name,input_messages,agent="recommendation_classification",json_mode=True)
+        chatbot_output = await aensure_json_output(self.async_client,self.model_name,chatbot_output)
 
+        output = self.postprocess_classfication(chatbot_output)
+        return output
 
-    def recommendation_classification(self,messages):
+    def get_classification_messages(self,messages):
         system_prompt = """ You are a helpful AI assistant for a coffee shop application which serves drinks and pastries. We have 3 types of recommendations:
 
         1. Apriori Recommendations: These are recommendations based on the user's order history. We recommend items that are frequently bought together with the items in the user's order.
@@ -101,16 +87,62 @@ class RecommendationAgent:
         """
 
         input_messages = [{"role": "system", "content": system_prompt}] + messages[-3:]
+        return input_messages
+
+    def get_response(self,messages,state=None):
+        messages = deepcopy(messages)
+
+        recommendation_classification = self.recommendation_classification(messages)
+        recommendations = self.get_classified_recommendations(recommendation_classification)
+        if recommendations == []:
+            return {"role": "assistant", "content":"Sorry, I can't help with that. Can I help you with your order?"}
+
+        input_messages = self.get_response_messages(messages,recommendations)
+
+        chatbot_output =get_chat_response(self.client,self.model_name,input_messages,agent="recommendation_agent")
+        output = self.postprocess(chatbot_output)
 
-        chatbot_output =get_chat_response(self.client,self.model_name,input_messages)
-        
-        output = self.postprocess_classfication(chatbot_output)
         return output
 
-    def get_response(self,messages):
+    async def aget_response(self,messages,state=None):
         messages = deepcopy(messages)
 
-        recommendation_classification = self.recommendation_classification(messages)
+        recommendation_classification = await self.arecommendation_classification(messages)
+        recommendations = self.get_classified_recommendations(recommendation_classification)
+        if recommendations == []:
+            return {"role": "assistant", "content":"Sorry, I can't help with that. Can I help you with your order?"}
+
+        input_messages = self.get_response_messages(messages,recommendations)
+
+        chatbot_output = await aget_chat_response(self.async_client,self.model_name,input_messages,agent="recommendation_agent")
+        output = self.postprocess(chatbot_output)
+
+        return output
+
+    async def astream_response(self,messages,state=None):
+        messages = deepcopy(messages)
+
+        recommendation_classification = await self.arecommendation_classification(messages)
+        recommendations = self.get_classified_recommendations(recommendation_classification)
+        if recommendations == []:
+            output = {"role": "assistant", "content":"Sorry, I can't help with that. Can I help you with your order?"}
+            yield {"event": "token", "data": output["content"]}
+            yield {"event": "done", "data": output}
+            return
+
+        input_messages = self.get_response_messages(messages,recommendations)
+        async for event in self.astream_output(input_messages):
+            yield event
+
+    async def astream_output(self,input_messages):
+        chatbot_output = ""
+        async for token in astream_chat_response(self.async_client,self.model_name,input_messages):
+            chatbot_output += token
+            yield {"event": "token", "data": token}
+
+        yield {"event": "done", "data": self.postprocess(chatbot_output)}
+
+    def get_classified_recommendations(self,recommendation_classification):
         recommendation_type = recommendation_classification['recommendation_type']
         recommendations = []
         if recommendation_type == "apriori":
@@ -119,10 +151,9 @@ class RecommendationAgent:
             recommendations = self.get_popular_recommendation()
         elif recommendation_type == "popular by category":
             recommendations = self.get_popular_recommendation(recommendation_classification['parameters'])
-        
-        if recommendations == []:
-            return {"role": "assistant", "content":"Sorry, I can't help with that. Can I help you with your order?"}
-        
+        return recommendations
+
+    def get_response_messages(self,messages,recommendations):
         # Respond to User
         recommendations_str = ", ".join(recommendations)
         
@@ -141,19 +172,11 @@ class RecommendationAgent:
 
         messages[-1]['content'] = prompt
         input_messages = [{"role": "system", "content": system_prompt}] + messages[-3:]
-
-        chatbot_output =get_chat_response(self.client,self.model_name,input_messages)
-        output = self.postprocess(chatbot_output)
-
-        return output
+        return input_messages
 
 
     def postprocess_classfication(self,response):
-        try:
-            output = json.loads(response)
-        except:
-            corrected_json = double_check_json_output(self.client,self.model_name,response)
-            output = json.loads(corrected_json)
+        output = json.loads(response)
 
         dict_output = {
             "recommendation_type": output['recommendation_type'],
@@ -162,10 +185,31 @@ class RecommendationAgent:
         return dict_output
 
     def get_recommendations_from_order(self,messages,order):
+        input_messages = self.get_order_recommendation_messages(messages,order)
+
+        chatbot_output =get_chat_response(self.client,self.model_name,input_messages,agent="recommendation_agent")
+        output = self.postprocess(chatbot_output)
+
+        return output
+
+    async def aget_recommendations_from_order(self,messages,order):
+        input_messages = self.get_order_recommendation_messages(messages,order)
+
+        chatbot_output = await aget_chat_response(self.async_client,self.model_name,input_messages,agent="recommendation_agent")
+        output = self.postprocess(chatbot_output)
+
+        return output
+
+    async def astream_recommendations_from_order(self,messages,order):
+        input_messages = self.get_order_recommendation_messages(messages,order)
+        async for event in self.astream_output(input_messages):
+            yield event
+
+    def get_order_recommendation_messages(self,messages,order):
         messages = deepcopy(messages)
         products = []
         for product in order:
-            products.append(product['item'])
+            products.append(self.menu.recommendation_name(product['item']))
 
         recommendations = self.get_apriori_recommendation(products)
         recommendations_str = ", ".join(recommendations)
@@ -185,11 +229,7 @@ class RecommendationAgent:
 
         messages[-1]['content'] = prompt
         input_messages = [{"role": "system", "content": system_prompt}] + messages[-3:]
-
-        chatbot_output =get_chat_response(self.client,self.model_name,input_messages)
-        output = self.postprocess(chatbot_output)
-
-        return output
+        return input_messages
     
     def postprocess(self,output):
         print("the recommendation agent response : ",output)
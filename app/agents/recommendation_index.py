@@ -0,0 +1,180 @@
+import csv
+import heapq
+import json
+import os
+import threading
+import time
+from itertools import islice
+from operator import itemgetter
+
+# at most this many recommendations from one category in an apriori answer
+MAX_PER_CATEGORY = 2
+# below this many candidate rules sorting the presorted runs beats setting up a lazy heap merge
+HEAP_MERGE_MIN_RULES = 64
+
+# live artefacts written by scripts/mine_recommendations.py: <live dir>/versions/<version>/ holds a complete set of
+# files and <live dir>/CURRENT names the version to serve, it is replaced atomically once the version is complete
+CURRENT_FILE_NAME = "CURRENT"
+VERSIONS_DIR_NAME = "versions"
+APRIORI_FILE_NAME = "apriori_recommendation.json"
+POPULARITY_FILE_NAME = "popularity_recommendation.csv"
+
+
+class RecommendationIndex:
+    """Apriori rules and popularity counts compiled once into sorted arrays of interned product ids.
+
+    Every product and category is stored once, rules are (-confidence, product_id, category_id) tuples sorted per
+    antecedent and popularity is a list of product ids per category sorted by count. Queries merge the already sorted
+    lists with a heap and stop after top_k, so they never sort or scan the whole catalogue.
+    """
+
+    def __init__(self, apriori_rules, popularity):
+        # popularity is a list of (product, category, count). a name can be in two categories,
+        # "Dark chocolate" is both a drink and a packaged chocolate, so products are interned by (name, category)
+        self.products = []
+        self.product_category = []
+        self.product_ids = {}
+        self.categories = []
+        self.category_ids = {}
+
+        counts = {}
+        for product, category, count in popularity:
+            counts[self.intern_product(product, category)] = count
+        # the menu in file order, for the prompts
+        self.catalogue = list(counts)
+        self.product_names = [self.products[product_id] for product_id in self.catalogue]
+        self.category_names = list(dict.fromkeys(self.categories[self.product_category[product_id]] for product_id in self.catalogue))
+
+        self.popular = sorted(counts, key=lambda product_id: -counts[product_id])
+        self.popular_by_category = {}
+        for product_id in self.popular:
+            self.popular_by_category.setdefault(self.product_category[product_id], []).append((-counts[product_id], product_id))
+
+        # keyed by the ordered product's name, the order only carries names
+        self.rules = {}
+        for antecedent, rules in apriori_rules.items():
+            compiled = [
+                (-rule["confidence"], self.intern_product(rule["product"], rule["product_category"]), self.category_ids[rule["product_category"]])
+                for rule in rules
+            ]
+            compiled.sort(key=itemgetter(0))
+            self.rules[antecedent] = compiled
+
+    def intern_product(self, product, category):
+        key = (product, category)
+        product_id = self.product_ids.get(key)
+        if product_id is None:
+            category_id = self.category_ids.get(category)
+            if category_id is None:
+                category_id = self.category_ids[category] = len(self.categories)
+                self.categories.append(category)
+            product_id = self.product_ids[key] = len(self.products)
+            self.products.append(product)
+            self.product_category.append(category_id)
+        return product_id
+
+    @classmethod
+    def from_files(cls, apriori_recommendation_path, popular_recommendation_path):
+        with open(apriori_recommendation_path, "r") as f:
+            apriori_rules = json.load(f)
+        with open(popular_recommendation_path, "r", newline="") as f:
+            popularity = [(row["product"], row["product_category"], int(row["count"])) for row in csv.DictReader(f)]
+        return cls(apriori_rules, popularity)
+
+    def apriori(self, products, top_k=5):
+        rule_lists = [self.rules[product] for product in products if product in self.rules]
+        # both are stable, equal confidences keep the order of the ordered products like the old sort did
+        if sum(len(rules) for rules in rule_lists) >= HEAP_MERGE_MIN_RULES:
+            merged = heapq.merge(*rule_lists, key=itemgetter(0))
+        else:
+            merged = sorted([rule for rules in rule_lists for rule in rules], key=itemgetter(0))
+
+        recommendations = []
+        seen = set()
+        per_category = {}
+        for _, product_id, category_id in merged:
+            product = self.products[product_id]
+            if product in seen:
+                continue
+            seen.add(product)
+            if per_category.get(category_id, 0) >= MAX_PER_CATEGORY:
+                continue
+            per_category[category_id] = per_category.get(category_id, 0) + 1
+            recommendations.append(product)
+            if len(recommendations) >= top_k:
+                break
+        return recommendations
+
+    def popular_products(self, product_category=None, top_k=5):
+        if product_category is None:
+            return [self.products[product_id] for product_id in self.popular[:top_k]]
+
+        if type(product_category) == str:
+            product_category = [product_category]
+        category_ids = {self.category_ids[category] for category in product_category if category in self.category_ids}
+        lists = [self.popular_by_category[category_id] for category_id in category_ids if category_id in self.popular_by_category]
+        return [self.products[product_id] for _, product_id in islice(heapq.merge(*lists), top_k)]
+
+
+class ReloadableRecommendationIndex:
+    """Serves the newest published live version of the rules and swaps it in without a restart.
+
+    Falls back to the static files until a live version exists, and keeps the current index when a new one fails to load.
+    """
+
+    def __init__(self, apriori_recommendation_path, popular_recommendation_path, live_dir=None, check_interval=30.0):
+        self.apriori_recommendation_path = apriori_recommendation_path
+        self.popular_recommendation_path = popular_recommendation_path
+        self.live_dir = live_dir
+        self.check_interval = check_interval
+
+        self.reload_lock = threading.Lock()
+        self.last_check = time.monotonic()
+        # (index, version) is replaced as a whole
+        self.snapshot = (RecommendationIndex.from_files(apriori_recommendation_path, popular_recommendation_path), None)
+        try:
+            self.reload()
+        except Exception as e:
+            print(f"Error: could not load live recommendations, using the static files: {e}")
+
+    def get_version(self):
+        if not self.live_dir:
+            return None
+        try:
+            with open(os.path.join(self.live_dir, CURRENT_FILE_NAME)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def reload(self):
+        version = self.get_version()
+        if version is None or version == self.snapshot[1]:
+            return
+        version_dir = os.path.join(self.live_dir, VERSIONS_DIR_NAME, version)
+        index = RecommendationIndex.from_files(os.path.join(version_dir, APRIORI_FILE_NAME), os.path.join(version_dir, POPULARITY_FILE_NAME))
+        self.snapshot = (index, version)
+        print(f"loaded recommendation rules version {version}")
+
+    def maybe_reload(self):
+        now = time.monotonic()
+        if now - self.last_check < self.check_interval:
+            return
+        # only one thread checks, the others keep using the current snapshot
+        if not self.reload_lock.acquire(blocking=False):
+            return
+        try:
+            self.last_check = now
+            self.reload()
+        except Exception as e:
+            print(f"Error: could not reload recommendation rules, keeping the current ones: {e}")
+        finally:
+            self.reload_lock.release()
+
+    @property
+    def version(self):
+        return self.snapshot[1]
+
+    @property
+    def index(self):
+        self.maybe_reload()
+        return self.snapshot[0]
@@ -0,0 +1,60 @@
+import asyncio
+import threading
+import time
+
+
+class AgentRegistry:
+    """Builds the agent pipeline once, on the first request or in the warm up, whichever comes first.
+
+    The factory does the heavy work: importing the agents, loading the embedding model, the indexes and the
+    recommendation files. A failed build is reported by status() and retried on the next use.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.lock = threading.Lock()
+        self.pipeline = None
+        self.state = "cold"
+        self.error = None
+        self.build_seconds = None
+
+    def get_pipeline(self):
+        if self.pipeline is not None:
+            return self.pipeline
+        with self.lock:
+            if self.pipeline is None:
+                self.state = "warming"
+                start = time.perf_counter()
+                try:
+                    pipeline = self.factory()
+                except Exception as e:
+                    self.state = "failed"
+                    self.error = str(e)
+                    print(f"Error: could not build the agents: {e}")
+                    raise
+                self.build_seconds = time.perf_counter() - start
+                self.error = None
+                self.state = "ready"
+                self.pipeline = pipeline
+                print(f"agents ready in {self.build_seconds:.1f}s")
+        return self.pipeline
+
+    async def aget_pipeline(self):
+        # the build blocks for seconds, it runs in a worker thread so the event loop keeps serving
+        if self.pipeline is not None:
+            return self.pipeline
+        return await asyncio.to_thread(self.get_pipeline)
+
+    async def awarm_up(self):
+        try:
+            await self.aget_pipeline()
+        except Exception:
+            # already recorded in status(), the first request tries again
+            pass
+
+    @property
+    def ready(self):
+        return self.pipeline is not None
+
+    def status(self):
+        return {"state": self.state, "error": self.error, "build_seconds": self.build_seconds}
@@ -0,0 +1,87 @@
+import threading
+from collections import OrderedDict
+import faiss
+import numpy as np
+
+
+class SemanticCache:
+    """Caches details answers by question embedding.
+
+    A cached answer is reused when a new question is within the cosine threshold of a cached one, retrieval produced
+    the same context and the turns before the question, which the model also sees, are the same. A follow up like
+    "and how much is it?" is only answered from its own conversation. The whole cache is dropped when the product
+    index changes.
+    """
+
+    def __init__(self, threshold=0.95, max_size=512, neighbours=4):
+        self.threshold = threshold
+        self.max_size = max_size
+        self.neighbours = neighbours
+        self.lock = threading.Lock()
+
+        self.index = None
+        self.entries = OrderedDict()  # id -> (context, history, answer), oldest first
+        self.next_id = 0
+        self.version = None
+
+        self.hits = 0
+        self.misses = 0
+
+    def reset(self, version):
+        self.index = None
+        self.entries.clear()
+        self.version = version
+
+    def lookup(self, query_embedding, context, version, history=()):
+        if self.max_size <= 0:
+            return None
+        with self.lock:
+            if version != self.version:
+                # the product index or data.pkl changed, every cached answer may be stale
+                self.reset(version)
+            if self.index is None or not self.entries:
+                self.misses += 1
+                return None
+
+            # embeddings are normalised, so inner product is the cosine similarity
+            D, I = self.index.search(query_embedding, min(self.neighbours, len(self.entries)))
+            for similarity, entry_id in zip(D[0], I[0]):
+                if entry_id < 0 or similarity < self.threshold:
+                    continue
+                cached_context, cached_history, answer = self.entries[entry_id]
+                if cached_context == context and cached_history == history:
+                    self.entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return answer
+
+            self.misses += 1
+            return None
+
+    def add(self, query_embedding, context, answer, version, history=()):
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            if version != self.version:
+                # computed against an index that has been swapped since
+                return
+            if self.index is None:
+                self.index = faiss.IndexIDMap(faiss.IndexFlatIP(query_embedding.shape[1]))
+
+            entry_id = self.next_id
+            self.next_id += 1
+            self.index.add_with_ids(query_embedding, np.array([entry_id], dtype=np.int64))
+            self.entries[entry_id] = (context, history, answer)
+
+            # least recently used answers are evicted first
+            while len(self.entries) > self.max_size:
+                evicted_id, _ = self.entries.popitem(last=False)
+                self.index.remove_ids(np.array([evicted_id], dtype=np.int64))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,109 @@
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Protocol, Dict, Any, Optional
+from config import settings
+
+
+class StateStore(Protocol):
+    """Per user conversation state: the last agent that answered and each agent's memory, e.g. the current order."""
+
+    def get(self, session_id) -> Optional[Dict[str, Any]]:
+        ...
+
+    def set(self, session_id, state: Dict[str, Any]) -> None:
+        ...
+
+    def delete(self, session_id) -> None:
+        ...
+
+    async def aget(self, session_id) -> Optional[Dict[str, Any]]:
+        ...
+
+    async def aset(self, session_id, state: Dict[str, Any]) -> None:
+        ...
+
+
+class InMemoryStateStore:
+    """State kept in this process, expired after the ttl and capped at max_size users. Fine for a single replica."""
+
+    def __init__(self, ttl=86400.0, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, session_id):
+        with self.lock:
+            entry = self.entries.get(session_id)
+            if entry is None:
+                return None
+            if time.time() - entry[0] >= self.ttl:
+                del self.entries[session_id]
+                return None
+            self.entries.move_to_end(session_id)
+            # stored as json so callers can't mutate the shared copy
+            return json.loads(entry[1])
+
+    def set(self, session_id, state):
+        with self.lock:
+            self.entries[session_id] = (time.time(), json.dumps(state))
+            self.entries.move_to_end(session_id)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, session_id):
+        with self.lock:
+            self.entries.pop(session_id, None)
+
+    async def aget(self, session_id):
+        return self.get(session_id)
+
+    async def aset(self, session_id, state):
+        self.set(session_id, state)
+
+
+class RedisStateStore:
+    """State shared by every api replica, one json string per user with the ttl set by redis.
+
+    Takes any redis-py compatible client, so fakeredis can stand in for a server.
+    """
+
+    def __init__(self, client, ttl=86400.0, prefix="coffee:state:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def key(self, session_id):
+        return f"{self.prefix}{session_id}"
+
+    def get(self, session_id):
+        value = self.client.get(self.key(session_id))
+        if value is None:
+            return None
+        return json.loads(value)
+
+    def set(self, session_id, state):
+        self.client.set(self.key(session_id), json.dumps(state), px=int(self.ttl * 1000))
+
+    def delete(self, session_id):
+        self.client.delete(self.key(session_id))
+
+    # a round trip to redis is short, it runs in a worker thread so the event loop never waits on the socket
+    async def aget(self, session_id):
+        return await asyncio.to_thread(self.get, session_id)
+
+    async def aset(self, session_id, state):
+        await asyncio.to_thread(self.set, session_id, state)
+
+
+def create_state_store(backend=None):
+    backend = backend or settings.STATE_STORE
+    if backend == "memory":
+        return InMemoryStateStore(ttl=settings.STATE_TTL, max_size=settings.STATE_STORE_SIZE)
+    if backend == "redis":
+        import redis
+        return RedisStateStore(redis.Redis.from_url(settings.STATE_STORE_URL), ttl=settings.STATE_TTL)
+    raise ValueError(f"STATE_STORE must be 'memory' or 'redis', got {backend!r}")
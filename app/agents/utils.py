@@ -1,35 +1,241 @@
 from openai import OpenAI
+import json
+import re
 # from sentence_transformers import SentenceTransformer
 # from huggingface_hub import snapshot_download
 # import faiss
 import numpy as np
 from dotenv import load_dotenv
 load_dotenv()
+from config import settings
+from request_timing import timed
+from .completion_cache import completion_cache
+from .json_repair import repair_json, json_repair_stats
 
 
-def get_chat_response(client, model_name, messages, temprature=0.0, top_p=0.8, max_tokens=5000):
+def get_extra_args(json_mode):
+    # backends that support it are asked for a json object directly, see LLM_JSON_MODE
+    if json_mode and settings.LLM_JSON_MODE:
+        return {"response_format": {"type": "json_object"}}
+    return {}
+
+
+def get_timeout_args(timeout):
+    # a per call timeout in seconds overrides the shared client's LLM_TIMEOUT
+    if timeout is None:
+        return {}
+    return {"timeout": timeout}
+
+
+def get_chat_response(client, model_name, messages, temprature=0.0, top_p=0.8, max_tokens=5000, agent=None, json_mode=False, timeout=None):
+    input_messages = []
+    for message in messages:
+        input_messages.append({"role": message["role"], "content": message["content"]})
+
+    extra_args = get_extra_args(json_mode)
+
+    # agents that opted in get identical prompts answered from the cache
+    cache_key = None
+    if completion_cache.enabled_for(agent):
+        cache_key = completion_cache.make_key(model_name, input_messages, temprature, top_p, max_tokens, extra_args)
+        completion = completion_cache.get(agent, cache_key)
+        if completion is not None:
+            return completion
+
+    with timed("llm"):
+        response = client.chat.completions.create(
+            model=model_name,
+            messages=input_messages,
+            temperature=temprature,
+            top_p=top_p,
+            max_tokens=max_tokens,
+            **extra_args,
+            **get_timeout_args(timeout)
+        )
+
+    completion = response.choices[0].message.content
+    if cache_key is not None and completion is not None:
+        completion_cache.set(cache_key, completion)
+    return completion
+
+
+async def aget_chat_response(client, model_name, messages, temprature=0.0, top_p=0.8, max_tokens=5000, agent=None, json_mode=False, timeout=None):
+    # same as get_chat_response but awaits an AsyncOpenAI client so the event loop stays free
     input_messages = []
     for message in messages:
         input_messages.append({"role": message["role"], "content": message["content"]})
 
-    response = client.chat.completions.create(
-        model=model_name,
-        messages=input_messages,
-        temperature=temprature,
-        top_p=top_p,
-        max_tokens=max_tokens
-    )
+    extra_args = get_extra_args(json_mode)
+
+    # agents that opted in get identical prompts answered from the cache
+    cache_key = None
+    if completion_cache.enabled_for(agent):
+        cache_key = completion_cache.make_key(model_name, input_messages, temprature, top_p, max_tokens, extra_args)
+        completion = completion_cache.get(agent, cache_key)
+        if completion is not None:
+            return completion
+
+    with timed("llm"):
+        response = await client.chat.completions.create(
+            model=model_name,
+            messages=input_messages,
+            temperature=temprature,
+            top_p=top_p,
+            max_tokens=max_tokens,
+            **extra_args,
+            **get_timeout_args(timeout)
+        )
+
+    completion = response.choices[0].message.content
+    if cache_key is not None and completion is not None:
+        completion_cache.set(cache_key, completion)
+    return completion
+
+
+async def astream_chat_response(client, model_name, messages, temprature=0.0, top_p=0.8, max_tokens=5000, json_mode=False, timeout=None):
+    # yields the completion piece by piece as the server generates it
+    input_messages = []
+    for message in messages:
+        input_messages.append({"role": message["role"], "content": message["content"]})
+
+    # only until the first chunk, the rest overlaps with sending the answer
+    with timed("llm"):
+        stream = await client.chat.completions.create(
+            model=model_name,
+            messages=input_messages,
+            temperature=temprature,
+            top_p=top_p,
+            max_tokens=max_tokens,
+            stream=True,
+            **get_extra_args(json_mode),
+            **get_timeout_args(timeout)
+        )
+
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+JSON_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
 
-    return response.choices[0].message.content
+
+class JsonFieldStreamer:
+    """Decodes one string field of a JSON object while the object is still being generated."""
+
+    def __init__(self, field):
+        self.key_pattern = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        self.buffer = ""
+        self.position = None
+        self.finished = False
+
+    def feed(self, chunk):
+        # returns the newly decoded part of the field value, "" while nothing new is available
+        self.buffer += chunk
+        if self.finished:
+            return ""
+
+        if self.position is None:
+            match = self.key_pattern.search(self.buffer)
+            if match is None:
+                return ""
+            self.position = match.end()
+
+        decoded = []
+        i = self.position
+        while i < len(self.buffer):
+            char = self.buffer[i]
+            if char == "\\":
+                # wait for the rest of an escape sequence split across chunks
+                if i + 1 >= len(self.buffer):
+                    break
+                escape = self.buffer[i + 1]
+                if escape == "u":
+                    # \uXXXX, or a surrogate pair \uXXXX\uXXXX for characters outside the BMP
+                    length = 12 if self.buffer[i + 2:i + 3].lower() == "d" and self.buffer[i + 3:i + 4].lower() in "89ab" else 6
+                    if i + length > len(self.buffer):
+                        break
+                    try:
+                        decoded.append(json.loads('"' + self.buffer[i:i + length] + '"'))
+                    except ValueError:
+                        decoded.append(self.buffer[i:i + length])
+                    i += length
+                    continue
+                decoded.append(JSON_ESCAPES.get(escape, escape))
+                i += 2
+                continue
+            if char == '"':
+                self.finished = True
+                i += 1
+                break
+            decoded.append(char)
+            i += 1
+
+        self.position = i
+        return "".join(decoded)
 
 
 def get_embedding(model,text_input):
+    # uncached single query, the agents embed through EmbeddingService which owns the cache
     embedding = model.encode([text_input], normalize_embeddings=True)
     embedding = np.array(embedding, dtype=np.float32).reshape(1, -1)
     return embedding
 
 
 def double_check_json_output(client,model_name,json_string):
+    messages = get_double_check_messages(json_string)
+
+    response = get_chat_response(client,model_name,messages,json_mode=True)
+
+    return response
+
+
+async def adouble_check_json_output(client,model_name,json_string):
+    messages = get_double_check_messages(json_string)
+
+    response = await aget_chat_response(client,model_name,messages,json_mode=True)
+
+    return response
+
+
+def repair_json_output(json_string):
+    # the local part of ensure_json_output, returns None when only the llm fixer can help.
+    # every outcome is counted in json_repair_stats, GET /stats reports them
+    output, path = repair_json(json_string)
+    if output is None:
+        return None
+    json_repair_stats.record(path)
+    if path == "valid":
+        return json_string
+    return json.dumps(output, ensure_ascii=False)
+
+
+def llm_fixed_json_output(fixed_string):
+    # the fixer's answer gets the same local clean up, it is returned as is when even that fails
+    output, _ = repair_json(fixed_string)
+    if output is None:
+        json_repair_stats.record("failed")
+        return fixed_string
+    json_repair_stats.record("llm")
+    return json.dumps(output, ensure_ascii=False)
+
+
+def ensure_json_output(client,model_name,json_string):
+    # returns a string that json.loads accepts, asking the llm to fix it only as a last resort
+    repaired = repair_json_output(json_string)
+    if repaired is not None:
+        return repaired
+    return llm_fixed_json_output(double_check_json_output(client,model_name,json_string))
+
+
+async def aensure_json_output(client,model_name,json_string):
+    # returns a string that json.loads accepts, asking the llm to fix it only as a last resort
+    repaired = repair_json_output(json_string)
+    if repaired is not None:
+        return repaired
+    return llm_fixed_json_output(await adouble_check_json_output(client,model_name,json_string))
+
+
+def get_double_check_messages(json_string):
     prompt = f"""
             You are a JSON validator and fixer.
 
@@ -53,8 +259,4 @@ def double_check_json_output(client,model_name,json_string):
         before or after curly brackets of the json object.
 """
 
-    messages = [{"role": "user", "content": prompt}]
-
-    response = get_chat_response(client,model_name,messages)
-
-    return response
\ No newline at end of file
+    return [{"role": "user", "content": prompt}]
\ No newline at end of file
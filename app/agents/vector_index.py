@@ -0,0 +1,239 @@
+import os
+import pickle
+import threading
+import time
+import faiss
+import numpy as np
+from .lexical_index import BM25Index, reciprocal_rank_fusion
+
+
+class ReloadableIndex:
+    """Keeps the FAISS index and its documents in memory and swaps them when the files change on disk."""
+
+    def __init__(self, index_file_name, data_file_name, mmap=False, check_interval=5.0, lexical=False, section_chars=0, embed=None):
+        self.index_file_name = index_file_name
+        self.data_file_name = data_file_name
+        self.mmap = mmap
+        self.check_interval = check_interval
+        # also build a BM25 index over the documents for hybrid_search
+        self.lexical = lexical
+        # documents longer than section_chars are split with split_sections when they are loaded and their sections
+        # embedded with embed(texts) -> (n, dim) array. indexes built by scripts/build_product_index.py are already split
+        self.section_chars = section_chars
+        self.embed = embed
+
+        self.reload_lock = threading.Lock()
+        self.reload_thread = None
+        self.last_check = time.monotonic()
+        # (index, documents, version, lexical index) is replaced as a whole so readers never see a half reloaded pair
+        self.snapshot = self.load()
+
+    def get_version(self):
+        index_stat = os.stat(self.index_file_name)
+        data_stat = os.stat(self.data_file_name)
+        return (index_stat.st_mtime_ns, index_stat.st_size, data_stat.st_mtime_ns, data_stat.st_size)
+
+    def load(self):
+        version = self.get_version()
+        flags = faiss.IO_FLAG_MMAP if self.mmap else 0
+        index = faiss.read_index(self.index_file_name, flags)
+        with open(self.data_file_name, "rb") as f:
+            data = pickle.load(f)
+        if self.section_chars and self.embed is not None:
+            index, data = self.split_long_documents(index, data)
+        lexical_index = BM25Index(data) if self.lexical else None
+        print(f"loaded faiss index {self.index_file_name} with {index.ntotal} vectors")
+        return index, data, version, lexical_index
+
+    def split_long_documents(self, index, data):
+        # a flat index of the sections, the vectors of the documents that stay whole are reused
+        units = [split_sections(document, self.section_chars) for document in data]
+        if all(len(sections) == 1 for sections in units):
+            return index, data
+        try:
+            vectors = index.reconstruct_n(0, index.ntotal)
+        except RuntimeError:
+            # the index type does not keep its vectors, every unit is embedded
+            vectors = None
+
+        documents = [unit for sections in units for unit in sections]
+        new_units = [unit for sections in units if len(sections) > 1 or vectors is None for unit in sections]
+        new_vectors = iter(np.asarray(self.embed(new_units), dtype=np.float32).reshape(len(new_units), -1))
+        embeddings = np.stack([
+            vectors[i] if vectors is not None and len(sections) == 1 else next(new_vectors)
+            for i, sections in enumerate(units)
+            for _ in sections
+        ])
+        sectioned = faiss.IndexFlatL2(embeddings.shape[1])
+        sectioned.add(embeddings)
+        print(f"split {len(data)} documents into {len(documents)} sections of at most {self.section_chars} characters")
+        return sectioned, documents
+
+    def maybe_reload(self):
+        # called on every search, only stats the files. a changed version is loaded in a background thread, reading
+        # the index, the documents and building BM25 would otherwise hold up the request and the event loop
+        now = time.monotonic()
+        if now - self.last_check < self.check_interval:
+            return
+        # only one thread checks, the others keep using the current snapshot. a running reload keeps the lock
+        if not self.reload_lock.acquire(blocking=False):
+            return
+        try:
+            self.last_check = now
+            version = self.get_version()
+            if version != self.snapshot[2]:
+                self.reload_thread = threading.Thread(target=self.reload, daemon=True)
+                self.reload_thread.start()
+                return
+        except OSError:
+            # the file is being replaced, try again on the next check
+            pass
+        except Exception as e:
+            print(f"Error: could not reload faiss index, keeping the current one: {e}")
+        self.reload_lock.release()
+
+    def reload(self):
+        # runs with reload_lock held by maybe_reload, the new snapshot replaces the old one in a single assignment
+        try:
+            self.snapshot = self.load()
+        except Exception as e:
+            print(f"Error: could not reload faiss index, keeping the current one: {e}")
+        finally:
+            self.reload_lock.release()
+
+    @property
+    def version(self):
+        # changes whenever a new index or data file has been swapped in
+        return self.snapshot[2]
+
+    def search(self, query_embedding, top_k=1):
+        self.maybe_reload()
+        index, data, _, _ = self.snapshot
+        D, I = index.search(query_embedding, top_k)
+        return [data[i] for i in I[0] if i >= 0]
+
+    def hybrid_search(self, query, query_embedding, top_k=1, candidates=10, rrf_k=60):
+        """Fuses the dense and the BM25 rankings with reciprocal rank fusion.
+
+        Exact names and prices the embedding misses are found by their terms, each retriever contributes its first
+        candidates.
+        """
+        self.maybe_reload()
+        index, data, _, lexical_index = self.snapshot
+        if lexical_index is None:
+            raise ValueError("hybrid_search needs the index to be created with lexical=True")
+        D, I = index.search(query_embedding, candidates)
+        dense = [int(i) for i in I[0] if i >= 0]
+        # BM25 goes first, an exact name match wins a tie with the nearest embedding
+        fused = reciprocal_rank_fusion([lexical_index.search(query, candidates), dense], k=rrf_k, top_k=top_k)
+        return [data[i] for i in fused]
+
+
+def build_context(documents, max_chars=0):
+    # best first and repeated documents once. documents are never cut: the best one is always kept and the others
+    # only while they fit in max_chars, 0 is no limit
+    context = []
+    seen = set()
+    remaining = max_chars
+    for document in documents:
+        key = " ".join(document.lower().split())
+        if key in seen:
+            continue
+        seen.add(key)
+        if max_chars and context and len(document) > remaining:
+            continue
+        context.append(document)
+        remaining -= len(document) + 1
+    return "\n".join(context)
+
+
+def is_section_header(line):
+    # "Working Hours" or "Delivery & Locations Served", not "Monday to Friday: 7 AM - 8 PM"
+    line = line.strip()
+    return 0 < len(line) <= 40 and line[-1] not in ".:!?" and ":" not in line and not any(c.isdigit() for c in line)
+
+
+def split_sections(document, max_chars=800):
+    """Splits a long document into retrieval units of at most max_chars at its sections and paragraphs.
+
+    Each unit starts with the document's title ("... about section :") so it still says what it belongs to. A
+    paragraph longer than max_chars is kept whole, documents are never cut inside a paragraph.
+    """
+    if not max_chars or len(document) <= max_chars:
+        return [document]
+    title, separator, body = document.partition(" : ")
+    prefix = f"{title}{separator}" if separator else ""
+    if not separator:
+        body = document
+
+    # paragraphs grouped into sections, a section starts at a paragraph whose first line is a header
+    sections = []
+    for paragraph in body.split("\n\n"):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        lines = paragraph.split("\n")
+        if not sections or (len(lines) > 1 and is_section_header(lines[0])):
+            sections.append([paragraph])
+        else:
+            sections[-1].append(paragraph)
+
+    units = []
+    for paragraphs in sections:
+        unit = prefix
+        for paragraph in paragraphs:
+            if unit != prefix and len(unit) + 2 + len(paragraph) > max_chars:
+                units.append(unit)
+                unit = prefix
+            unit = f"{unit}\n\n{paragraph}" if unit != prefix else f"{prefix}{paragraph}"
+        units.append(unit)
+    return units
+
+
+INDEX_TYPES = ("flat", "hnsw", "ivfpq")
+INDEX_FILE_NAME = "index.faiss"
+DOCUMENTS_FILE_NAME = "documents.pkl"
+MANIFEST_FILE_NAME = "manifest.json"
+
+
+def get_index_files(version="", index_dir="./index_and_data/indexes"):
+    # no version is the prebuilt index shipped with the app, otherwise one built by scripts/build_product_index.py
+    if not version:
+        return "./index_and_data/faiss_product.index", "./index_and_data/data.pkl"
+    version_dir = os.path.join(index_dir, version)
+    return os.path.join(version_dir, INDEX_FILE_NAME), os.path.join(version_dir, DOCUMENTS_FILE_NAME)
+
+
+def build_faiss_index(embeddings, index_type="flat", hnsw_m=32, ef_construction=200, ef_search=64, nlist=None, nprobe=8, pq_m=48, pq_bits=8):
+    """Builds an L2 index over normalized embeddings, the same metric as the prebuilt one.
+
+    Returns the index and the parameters actually used, IVF-PQ is scaled down for catalogues too small to train it.
+    """
+    count, dimension = embeddings.shape
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dimension)
+        params = {}
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, hnsw_m)
+        index.hnsw.efConstruction = ef_construction
+        # efSearch is saved with the index, DetailsAgent searches with it
+        index.hnsw.efSearch = ef_search
+        params = {"m": hnsw_m, "ef_construction": ef_construction, "ef_search": ef_search}
+    elif index_type == "ivfpq":
+        # faiss wants about 39 training points per centroid, both the lists and the code books have to fit
+        nlist = max(1, min(nlist or int(np.sqrt(count)), count // 39))
+        pq_bits = max(1, min(pq_bits, int(np.log2(count))))
+        if dimension % pq_m != 0:
+            raise ValueError(f"pq_m must divide the embedding dimension {dimension}, got {pq_m}")
+        quantizer = faiss.IndexFlatL2(dimension)
+        index = faiss.IndexIVFPQ(quantizer, dimension, nlist, pq_m, pq_bits)
+        index.cp.min_points_per_centroid = 1
+        index.pq.cp.min_points_per_centroid = 1
+        index.train(embeddings)
+        index.nprobe = min(nprobe, nlist)
+        params = {"nlist": nlist, "nprobe": index.nprobe, "pq_m": pq_m, "pq_bits": pq_bits}
+    else:
+        raise ValueError(f"index_type must be one of {INDEX_TYPES}, got {index_type!r}")
+
+    index.add(embeddings)
+    return index, params
@@ -0,0 +1,70 @@
+# compares the blocking agent pipeline with the async one against the local stub llm.
+# run from the app directory: python benchmarks/bench_async_pipeline.py --conversations 200
+import argparse
+import asyncio
+import time
+
+from common import ROOT_DIR, setup_env
+from stub_llm import StubLLMServer
+
+
+def build_pipeline():
+    from agents import GuardAgent, ClassificationAgent, RecommendationAgent, OrderTakingAgent, AgentPipeline
+
+    recommendation_agent = RecommendationAgent(
+        str(ROOT_DIR / "recommendation_objects/apriori_recommendation.json"),
+        str(ROOT_DIR / "recommendation_objects/popularity_recommendation.csv"),
+    )
+    agent_dict = {
+        "order_taking_agent": OrderTakingAgent(recommendation_agent),
+        "recommendation_agent": recommendation_agent,
+    }
+    return AgentPipeline(GuardAgent(), ClassificationAgent(), agent_dict)
+
+
+def get_conversation(i):
+    prompt = "what do you recommend?" if i % 2 else "one latte please"
+    return [{"role": "user", "content": prompt, "memory": {}}]
+
+
+async def run_blocking(pipeline, conversations):
+    # what ask_model used to do: sync agent calls inside an async endpoint
+    async def handle(messages):
+        return pipeline.get_response(messages)
+
+    return await asyncio.gather(*[handle(messages) for messages in conversations])
+
+
+async def run_async(pipeline, conversations):
+    return await asyncio.gather(*[pipeline.aget_response(messages) for messages in conversations])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.2, help="stub llm latency in seconds")
+    parser.add_argument("--skip-blocking", action="store_true", help="only run the async pipeline")
+    args = parser.parse_args()
+
+    server = StubLLMServer(latency=args.latency).start()
+    setup_env(server.base_url)
+    pipeline = build_pipeline()
+    conversations = [get_conversation(i) for i in range(args.conversations)]
+
+    results = {}
+    modes = [("async", run_async)] if args.skip_blocking else [("blocking", run_blocking), ("async", run_async)]
+    for name, runner in modes:
+        start = time.perf_counter()
+        asyncio.run(runner(pipeline, conversations))
+        elapsed = time.perf_counter() - start
+        results[name] = elapsed
+        print(f"{name:>9}: {len(conversations)} conversations in {elapsed:.2f}s "
+              f"({len(conversations) / elapsed:.1f} conversations/s)")
+
+    if "blocking" in results:
+        print(f"speedup: {results['blocking'] / results['async']:.1f}x")
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
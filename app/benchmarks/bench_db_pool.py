@@ -0,0 +1,114 @@
+# database time per /chats/ask turn and pool saturation under concurrency, against the configured postgres.
+# the turn does what ask_model does: read the history window, then save the prompt and the answer together,
+# with an optional sleep standing in for the agents.
+# run from the app directory with the database settings in the environment or .env:
+#   python benchmarks/bench_db_pool.py --concurrency 64 --turns 2000 --pool-size 10 --max-overflow 20
+import argparse
+import asyncio
+import os
+import statistics
+import time
+import uuid
+
+from common import setup_env
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--turns", type=int, default=2000)
+    parser.add_argument("--pool-size", type=int, default=10)
+    parser.add_argument("--max-overflow", type=int, default=20)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds between reading the history and saving the answer")
+    parser.add_argument("--history-window", type=int, default=20)
+    args = parser.parse_args()
+
+    os.environ["DB_POOL_SIZE"] = str(args.pool_size)
+    os.environ["DB_MAX_OVERFLOW"] = str(args.max_overflow)
+    setup_env()
+    from sqlalchemy import delete, desc, select
+    import models
+    from database import AsyncSessionLocal, async_engine
+    from persistence import save_turn
+
+    async with AsyncSessionLocal() as db:
+        user = models.User(email=f"bench-{uuid.uuid4().hex[:8]}@example.com", password="benchmark")
+        db.add(user)
+        await db.commit()
+        user_id = user.id
+
+    db_times = []
+    wait_times = []
+    errors = 0
+    samples = []
+
+    async def turn(i):
+        nonlocal errors
+        try:
+            async with AsyncSessionLocal() as db:
+                start = time.perf_counter()
+                await db.connection()
+                wait_times.append(time.perf_counter() - start)
+
+                result = await db.execute(
+                    select(models.Chats.role, models.Chats.content, models.Chats.memory)
+                    .where(models.Chats.user_id == user_id)
+                    .order_by(desc(models.Chats.created_at), desc(models.Chats.id))
+                    .limit(args.history_window - 1)
+                )
+                result.all()
+                await db.commit()
+                elapsed = time.perf_counter() - start
+
+                await asyncio.sleep(args.llm_latency)
+
+                start = time.perf_counter()
+                response = {"role": "assistant", "content": "One Latte. Anything else?", "memory": {"agent": "order_taking_agent"}}
+                await save_turn(db, user_id, f"one latte please {i}", response)
+                db_times.append(elapsed + time.perf_counter() - start)
+        except Exception as e:
+            errors += 1
+            print(f"Error: turn failed: {e}")
+
+    async def sample_pool(stop):
+        while not stop.is_set():
+            samples.append((async_engine.pool.checkedout(), async_engine.pool.overflow()))
+            await asyncio.sleep(0.01)
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def limited(i):
+        async with semaphore:
+            await turn(i)
+
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_pool(stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(limited(i) for i in range(args.turns)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await sampler
+
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(models.User).where(models.User.id == user_id))
+        await db.commit()
+    await async_engine.dispose()
+
+    print(f"{args.turns} turns, concurrency {args.concurrency}, pool {args.pool_size}+{args.max_overflow}: {args.turns / elapsed:.0f} turns/s, {errors} errors")
+    print(f"db time per turn: p50 {percentile(db_times, 0.5) * 1e3:.1f}ms  p95 {percentile(db_times, 0.95) * 1e3:.1f}ms  p99 {percentile(db_times, 0.99) * 1e3:.1f}ms")
+    print(f"connection wait: p50 {percentile(wait_times, 0.5) * 1e3:.1f}ms  p95 {percentile(wait_times, 0.95) * 1e3:.1f}ms")
+    checked_out = [checked for checked, _ in samples]
+    capacity = args.pool_size + args.max_overflow
+    print(
+        f"pool: mean {statistics.mean(checked_out):.1f} / max {max(checked_out)} of {capacity} connections checked out, "
+        f"saturated {sum(checked >= capacity for checked in checked_out) / len(checked_out):.0%} of the time"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,117 @@
+# details agent retrieval: the dense top-1 search over whole documents it used to run vs hybrid BM25 + vector search
+# over the sectioned documents with a capped context. reports how often the asked about item is in the context, the
+# context and whole prompt tokens and the search latency, with the query embeddings computed up front.
+# run from the app directory: python benchmarks/bench_details_retrieval.py --top-k 2 --max-chars 600
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+from common import ROOT_DIR, setup_env
+setup_env()
+from sentence_transformers import SentenceTransformer
+from config import settings
+from agents.vector_index import ReloadableIndex, build_context
+from agents.context_builder import count_tokens, count_message_tokens
+from agents.details_agent import DetailsAgent
+
+MODEL_PATH = str(ROOT_DIR / "index_and_data/bge-small-en")
+INDEX_FILE = str(ROOT_DIR / "index_and_data/faiss_product.index")
+DATA_FILE = str(ROOT_DIR / "index_and_data/data.pkl")
+
+# question and the text the right document starts with
+QUESTIONS = [
+    ("how much is a cappuccino?", "Cappuccino :"),
+    ("what's in the latte", "Latte :"),
+    ("price of the Jumbo Savory Scone", "Jumbo Savory Scone :"),
+    ("do you have chocolate chip biscotti", "Chocolate Chip Biscotti :"),
+    ("how much does an espresso shot cost", "Espresso shot :"),
+    ("what are the ingredients of the hazelnut biscotti", "Hazelnut Biscotti :"),
+    ("is the chocolate croissant good?", "Chocolate Croissant :"),
+    ("tell me about the drinking chocolate", "Dark chocolate : Rich"),
+    ("cranberry scone price", "Cranberry Scone :"),
+    ("what is in a plain croissant", "Croissant :"),
+    ("almond croissant rating", "Almond Croissant :"),
+    ("ginger biscotti ingredients", "Ginger Biscotti :"),
+    ("how much for an oatmeal scone", "Oatmeal Scone :"),
+    ("do you sell ginger scones", "Ginger Scone :"),
+    ("chocolate syrup price", "Chocolate syrup :"),
+    ("is there hazelnut syrup", "Hazelnut syrup :"),
+    ("caramel syrup", "Carmel syrup :"),
+    ("do you have sugar free vanilla syrup", "Sugar Free Vanilla syrup :"),
+    ("packaged dark chocolate bar", "Dark chocolate :"),
+    ("where is the shop and when was it founded", "coffe shop merry's way about section :"),
+    ("what's on the menu", "Menu Items :"),
+    ("anything for $1.50", "Menu Items :"),
+]
+
+
+def dense_context(product_index, question, embedding, top_k, max_chars):
+    return build_context(product_index.search(embedding, top_k), max_chars)
+
+
+def hybrid_context(product_index, question, embedding, top_k, max_chars):
+    return build_context(product_index.hybrid_search(question, embedding, top_k), max_chars)
+
+
+def prompt_tokens(question, context):
+    # what the details agent sends for a first question, the system prompt and the query template included
+    agent = DetailsAgent.__new__(DetailsAgent)
+    return count_message_tokens(agent.get_input_messages([{"role": "user", "content": question}], context))
+
+
+def run(name, get_context, product_index, embeddings, top_k, max_chars, repeat):
+    hits = 0
+    tokens = []
+    prompts = []
+    for (question, expected), embedding in zip(QUESTIONS, embeddings):
+        context = get_context(product_index, question, embedding, top_k, max_chars)
+        # at the start of a document, "Croissant :" is also the end of "Chocolate Croissant :"
+        hits += context.startswith(expected) or f"\n{expected}" in context
+        tokens.append(count_tokens(context))
+        prompts.append(prompt_tokens(question, context))
+
+    timings = []
+    for _ in range(repeat):
+        for (question, _), embedding in zip(QUESTIONS, embeddings):
+            start = time.perf_counter()
+            get_context(product_index, question, embedding, top_k, max_chars)
+            timings.append(time.perf_counter() - start)
+    timings.sort()
+    p50 = statistics.median(timings) * 1e6
+    p99 = timings[int(len(timings) * 0.99) - 1] * 1e6
+    print(
+        f"{name:>24}: hit rate {hits / len(QUESTIONS):5.0%}   context tokens {statistics.mean(tokens):6.1f} (max {max(tokens):4d})"
+        f"   prompt tokens {statistics.mean(prompts):6.1f}   p50 {p50:7.1f} us   p99 {p99:7.1f} us"
+    )
+    return statistics.mean(prompts)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--top-k", type=int, default=settings.DETAILS_TOP_K)
+    parser.add_argument("--max-chars", type=int, default=settings.DETAILS_CONTEXT_MAX_CHARS, help="context limit for the documents after the best one, 0 is none")
+    parser.add_argument("--section-chars", type=int, default=settings.DETAILS_SECTION_CHARS, help="split longer documents at load time, 0 keeps them whole")
+    parser.add_argument("--repeat", type=int, default=100)
+    args = parser.parse_args()
+
+    model = SentenceTransformer(MODEL_PATH)
+    embeddings = np.array(model.encode([question for question, _ in QUESTIONS], normalize_embeddings=True), dtype=np.float32)
+    embeddings = [embedding.reshape(1, -1) for embedding in embeddings]
+
+    def embed(texts):
+        return np.array(model.encode(list(texts), normalize_embeddings=True), dtype=np.float32)
+
+    # before: whole documents, the about page included. after: the same files split into sections when loaded
+    whole = ReloadableIndex(INDEX_FILE, DATA_FILE)
+    sectioned = ReloadableIndex(INDEX_FILE, DATA_FILE, lexical=True, section_chars=args.section_chars, embed=embed)
+
+    before = run("dense top-1, whole docs", dense_context, whole, embeddings, 1, 0, args.repeat)
+    run(f"dense top-{args.top_k}, sections", dense_context, sectioned, embeddings, args.top_k, args.max_chars, args.repeat)
+    after = run(f"hybrid top-{args.top_k}, sections", hybrid_context, sectioned, embeddings, args.top_k, args.max_chars, args.repeat)
+    print(f"prompt tokens per details answer vs dense top-1: {after / before:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+# embeddings per second under concurrent load: one encode call per request vs the batching service.
+# run from the app directory: python benchmarks/bench_embedding_service.py --concurrency 32 --requests 2000
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import ROOT_DIR, setup_env
+setup_env()
+from sentence_transformers import SentenceTransformer
+from agents.utils import get_embedding
+from agents.embedding_service import EmbeddingService
+
+MODEL_PATH = str(ROOT_DIR / "index_and_data/bge-small-en")
+
+
+def get_questions(count):
+    # distinct texts so neither path is helped by a cache
+    return [f"do you have anything with hazelnut or caramel, question {i}?" for i in range(count)]
+
+
+def run(name, embed, questions, concurrency):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(embed, questions))
+    elapsed = time.perf_counter() - start
+    rate = len(questions) / elapsed
+    print(f"{name:>12}: {len(questions)} embeddings in {elapsed:.2f}s ({rate:.0f} embeddings/s)")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--window", type=float, default=0.005, help="batch window in seconds")
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    model = SentenceTransformer(MODEL_PATH)
+    questions = get_questions(args.requests)
+    # warm up both paths
+    get_embedding(model, "warm up")
+
+    per_call = run("per call", lambda text: get_embedding(model, text), questions, args.concurrency)
+
+    service = EmbeddingService(model, batch_window=args.window, max_batch_size=args.batch_size)
+    batched = run("batched", service.embed, questions, args.concurrency)
+
+    print(f"average batch size: {service.encoded / service.batches:.1f}")
+    print(f"speedup: {batched / per_call:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# search latency of reading the faiss index per query (old DetailsAgent) vs the resident index.
+# run from the app directory: python benchmarks/bench_faiss_index.py --queries 2000
+import argparse
+import pickle
+import statistics
+import time
+
+import faiss
+import numpy as np
+
+from common import ROOT_DIR, setup_env
+setup_env()
+from agents.vector_index import ReloadableIndex
+
+INDEX_FILE = str(ROOT_DIR / "index_and_data/faiss_product.index")
+DATA_FILE = str(ROOT_DIR / "index_and_data/data.pkl")
+
+
+def random_queries(count, dimension):
+    queries = np.random.RandomState(0).rand(count, dimension).astype(np.float32)
+    faiss.normalize_L2(queries)
+    return queries
+
+
+def report(name, timings):
+    timings = sorted(timings)
+    p50 = statistics.median(timings) * 1e6
+    p99 = timings[int(len(timings) * 0.99) - 1] * 1e6
+    print(f"{name:>22}: p50 {p50:8.1f} us   p99 {p99:8.1f} us")
+    return p50
+
+
+def bench_read_per_query(queries, top_k):
+    with open(DATA_FILE, "rb") as f:
+        data = pickle.load(f)
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        index = faiss.read_index(INDEX_FILE)
+        D, I = index.search(query.reshape(1, -1), top_k)
+        [data[i] for i in I[0] if i >= 0]
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def bench_resident(queries, top_k, mmap):
+    product_index = ReloadableIndex(INDEX_FILE, DATA_FILE, mmap=mmap)
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        product_index.search(query.reshape(1, -1), top_k)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--top-k", type=int, default=1)
+    args = parser.parse_args()
+
+    dimension = faiss.read_index(INDEX_FILE).d
+    queries = random_queries(args.queries, dimension)
+
+    before = report("read_index per query", bench_read_per_query(queries, args.top_k))
+    after = report("resident index", bench_resident(queries, args.top_k, mmap=False))
+    report("resident index (mmap)", bench_resident(queries, args.top_k, mmap=True))
+    print(f"speedup (p50): {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
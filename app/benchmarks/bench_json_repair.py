@@ -0,0 +1,60 @@
+# which path fixes typical malformed agent outputs and what it costs: local repair vs a second llm call.
+# run from the app directory: python benchmarks/bench_json_repair.py --latency 0.5
+import argparse
+import time
+
+from common import setup_env
+setup_env()
+from stub_llm import StubLLMServer
+
+SAMPLES = [
+    # valid
+    '{"chain of thought": "ordering", "decision": "allowed", "message": ""}',
+    # prose and code fences around the object
+    'Sure! Here is the output:\n```json\n{"decision": "details_agent", "message": ""}\n```',
+    # two objects back to back
+    '{"decision": "allowed", "message": ""}{"decision": "allowed", "message": ""}',
+    # single quotes and a trailing comma
+    "{'decision': 'not allowed', 'message': \"Sorry, I can't help with that.\",}",
+    # missing comma between fields
+    '{"step_number": 2\n"order": [{"item": "Latte", "quanitity": 1, "price": 4.75}]\n"response": "Anything else?"}',
+    # python literals and an unquoted key
+    '{recommendation_type: "popular", "parameters": [], "done": True}',
+    # raw newline inside a string
+    '{"decision": "allowed", "message": "line one\nline two"}',
+    # cut off before the closing brace
+    '{"chain of thought": "the user wants a latte", "decision": "order_taking_agent", "message": ""',
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per stub llm call")
+    parser.add_argument("--repeat", type=int, default=1000)
+    args = parser.parse_args()
+
+    from agents.json_repair import repair_json, JsonRepairStats
+    from agents.utils import double_check_json_output
+    from openai import OpenAI
+
+    stats = JsonRepairStats()
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for sample in SAMPLES:
+            stats.record(repair_json(sample)[1])
+    local = (time.perf_counter() - start) / (args.repeat * len(SAMPLES))
+
+    for path, value in stats.stats().items():
+        print(f"{path:>10}: {value['rate']:.0%}")
+    print(f"local repair: {local * 1e6:.0f}us per output")
+
+    server = StubLLMServer(latency=args.latency).start()
+    client = OpenAI(api_key="stub", base_url=server.base_url)
+    start = time.perf_counter()
+    double_check_json_output(client, "stub", SAMPLES[3])
+    print(f"llm fixer: {(time.perf_counter() - start) * 1e3:.0f}ms per output")
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# llm connections and per turn latency with one client per agent (as before) vs the shared pooled client.
+# a turn calls three agents like guard, classification and the routed agent. the stub charges
+# --connection-latency for every new connection, standing in for the tcp and tls handshakes with a remote server.
+# run from the app directory: python benchmarks/bench_llm_client.py --concurrency 32 --turns 600
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from common import setup_env
+setup_env()
+from stub_llm import StubLLMServer
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run(clients, args):
+    from agents.utils import aget_chat_response
+
+    messages = [{"role": "system", "content": "what agent should handle the user input"}, {"role": "user", "content": "one latte please"}]
+    latencies = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def turn():
+        async with semaphore:
+            start = time.perf_counter()
+            for client in clients:
+                await aget_chat_response(client, "stub", messages)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(turn() for _ in range(args.turns)))
+    return latencies, time.perf_counter() - start
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--turns", type=int, default=600)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per stub llm call")
+    parser.add_argument("--connection-latency", type=float, default=0.03, help="seconds per new connection")
+    parser.add_argument("--agents", type=int, default=5, help="agents that had their own client")
+    args = parser.parse_args()
+
+    from openai import AsyncOpenAI
+    from agents.llm_client import create_async_llm_client
+
+    for name in ("client per agent", "shared pooled client"):
+        server = StubLLMServer(latency=args.latency, connection_latency=args.connection_latency).start()
+        os.environ["BASE_URL"] = server.base_url
+        if name == "client per agent":
+            # what every agent built in its __init__, the turn goes through three of them
+            clients = [AsyncOpenAI(api_key="stub", base_url=server.base_url) for _ in range(args.agents)][:3]
+        else:
+            from config import settings
+            settings.BASE_URL = server.base_url
+            clients = [create_async_llm_client()] * 3
+
+        latencies, elapsed = await run(clients, args)
+        print(
+            f"{name:>20}: {server.connections} connections, {args.turns / elapsed:.0f} turns/s, "
+            f"p50 {percentile(latencies, 0.5) * 1e3:.0f}ms  p95 {percentile(latencies, 0.95) * 1e3:.0f}ms  p99 {percentile(latencies, 0.99) * 1e3:.0f}ms"
+        )
+        for client in set(clients):
+            await client.close()
+        server.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
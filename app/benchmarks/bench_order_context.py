@@ -0,0 +1,81 @@
+# prompt size and latency of the order taking agent over a long session, full history vs the context builder.
+# the stub charges --prompt-token-latency per prompt token to model prefill.
+# run from the app directory: python benchmarks/bench_order_context.py --turns 60 --prompt-token-latency 0.0002
+import argparse
+import asyncio
+import statistics
+import time
+
+from common import ROOT_DIR, setup_env
+setup_env()
+from stub_llm import StubLLMServer
+
+USER_MESSAGES = [
+    "Hi, I'd like to order a latte please",
+    "Can you make it with oat milk? Also what pastries do you have today?",
+    "I'll take a chocolate croissant as well, and do you have anything without gluten?",
+    "Actually make that two lattes, my friend is joining me in a few minutes",
+    "What is in the hazelnut biscotti, is it very sweet or more on the dry side?",
+    "Add one hazelnut biscotti then, and a sugar free vanilla syrup in one of the lattes",
+]
+
+
+async def run_session(agent, turns):
+    from agents.context_builder import count_message_tokens
+
+    messages = []
+    prompt_tokens = []
+    latencies = []
+    for turn in range(turns):
+        # ids stand in for the chat rows' ids, the summary marks how far it got with them
+        messages.append({"id": len(messages), "role": "user", "content": f"{USER_MESSAGES[turn % len(USER_MESSAGES)]} (turn {turn})"})
+        input_messages = agent.get_input_messages([dict(message) for message in messages])[0]
+        prompt_tokens.append(count_message_tokens(input_messages))
+
+        start = time.perf_counter()
+        response = await agent.aget_response(messages)
+        latencies.append(time.perf_counter() - start)
+        messages.append({"id": len(messages), **response})
+    return prompt_tokens, latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=60)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per stub llm call")
+    parser.add_argument("--prompt-token-latency", type=float, default=0.0002)
+    parser.add_argument("--token-budget", type=int, default=3000)
+    parser.add_argument("--recent-messages", type=int, default=6)
+    parser.add_argument("--summary-batch", type=int, default=6)
+    args = parser.parse_args()
+
+    server = StubLLMServer(port=8010, latency=args.latency, prompt_token_latency=args.prompt_token_latency).start()
+    from agents.context_builder import ContextBuilder
+    from agents import OrderTakingAgent, RecommendationAgent
+
+    recommendation_agent = RecommendationAgent(
+        str(ROOT_DIR / "recommendation_objects/apriori_recommendation.json"),
+        str(ROOT_DIR / "recommendation_objects/popularity_recommendation.csv"),
+    )
+    agent = OrderTakingAgent(recommendation_agent)
+    builders = {
+        # everything is sent, as before the context builder
+        "full history": ContextBuilder(token_budget=10**9, recent_messages=10**9),
+        "context builder": ContextBuilder(args.token_budget, args.recent_messages, args.summary_batch),
+    }
+    checkpoints = [turn for turn in (5, 10, 20, 40, 80, 160) if turn <= args.turns]
+
+    for name, builder in builders.items():
+        agent.context_builder = builder
+        prompt_tokens, latencies = await run_session(agent, args.turns)
+        print(f"{name}:")
+        for turn in checkpoints:
+            window = latencies[max(0, turn - 5):turn]
+            print(f"  turn {turn:>3}: {prompt_tokens[turn - 1]:>6} prompt tokens, {statistics.mean(window) * 1e3:.0f}ms per turn")
+        print(f"  mean over {args.turns} turns: {statistics.mean(prompt_tokens):.0f} prompt tokens, {statistics.mean(latencies) * 1e3:.0f}ms per turn")
+
+    server.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,115 @@
+# recommendation queries: the old per call pandas filtering and sorting vs the precompiled index,
+# on the shipped rules and on a synthetic catalogue.
+# run from the app directory: python benchmarks/bench_recommendations.py --products 5000 --categories 50
+import argparse
+import random
+import time
+
+import pandas as pd
+
+from common import ROOT_DIR, setup_env
+setup_env()
+
+
+def pandas_apriori(apriori_recommendation, products, top_k=5):
+    # the implementation before the index, kept here as the baseline
+    recommendation_list = []
+    for product in products:
+        if product in apriori_recommendation:
+            recommendation_list.extend(apriori_recommendation[product])
+    recommendation_list = sorted(recommendation_list, key=lambda x: x['confidence'], reverse=True)
+
+    recommendations = []
+    recommendations_per_category = {}
+    for recommendation in recommendation_list:
+        if recommendation in recommendations:
+            continue
+        product_category = recommendation["product_category"]
+        if recommendations_per_category.get(product_category, 0) >= 2:
+            continue
+        recommendations_per_category[product_category] = recommendations_per_category.get(product_category, 0) + 1
+        recommendations.append(recommendation['product'])
+        if len(recommendations) >= top_k:
+            break
+    return recommendations
+
+
+def pandas_popular(popular_recommendation, product_category=None, top_k=5):
+    if type(product_category) == str:
+        product_category = [product_category]
+    if product_category is not None:
+        popular_recommendation = popular_recommendation[popular_recommendation["product_category"].isin(product_category)]
+    popular_recommendation = popular_recommendation.sort_values('count', ascending=False)
+    return popular_recommendation['product'].head(top_k).tolist()
+
+
+def synthetic_catalogue(products, categories, rules_per_product, seed=0):
+    rng = random.Random(seed)
+    names = [f"product {i}" for i in range(products)]
+    category_of = {name: f"category {rng.randrange(categories)}" for name in names}
+    popularity = [(name, category_of[name], rng.randrange(1, 100000)) for name in names]
+    apriori = {
+        name: [
+            {"product": other, "product_category": category_of[other], "confidence": rng.random()}
+            for other in rng.sample(names, rules_per_product)
+        ]
+        for name in names
+    }
+    return apriori, popularity
+
+
+def timed(fn, queries, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for query in queries:
+            fn(*query)
+    return (time.perf_counter() - start) / (repeat * len(queries))
+
+
+def compare(name, apriori, popularity, repeat, rng):
+    from agents.recommendation_index import RecommendationIndex
+
+    start = time.perf_counter()
+    index = RecommendationIndex(apriori, popularity)
+    build = time.perf_counter() - start
+    frame = pd.DataFrame(popularity, columns=["product", "product_category", "count"])
+
+    products = list(apriori)
+    categories = sorted({category for _, category, _ in popularity})
+    apriori_queries = [(rng.sample(products, min(3, len(products))),) for _ in range(200)]
+    category_queries = [(rng.sample(categories, min(2, len(categories))),) for _ in range(200)]
+
+    print(f"{name}: {len(popularity)} products, {len(categories)} categories, index built in {build * 1e3:.1f}ms")
+    rows = [
+        ("apriori", lambda query: pandas_apriori(apriori, query), index.apriori, apriori_queries),
+        ("popular", lambda: pandas_popular(frame), index.popular_products, [()]),
+        ("popular by category", lambda query: pandas_popular(frame, query), index.popular_products, category_queries),
+    ]
+    for label, before, after, queries in rows:
+        before_time = timed(before, queries, repeat)
+        after_time = timed(after, queries, repeat)
+        print(f"  {label:>20}: pandas {before_time * 1e6:8.1f}us  index {after_time * 1e6:6.1f}us  ({before_time / after_time:.1f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--categories", type=int, default=50)
+    parser.add_argument("--rules-per-product", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    import json
+    rng = random.Random(0)
+    with open(ROOT_DIR / "recommendation_objects/apriori_recommendation.json") as f:
+        apriori = json.load(f)
+    frame = pd.read_csv(ROOT_DIR / "recommendation_objects/popularity_recommendation.csv")
+    popularity = list(frame[["product", "product_category", "count"]].itertuples(index=False, name=None))
+    compare("shipped rules", apriori, popularity, args.repeat, rng)
+
+    apriori, popularity = synthetic_catalogue(args.products, args.categories, args.rules_per_product)
+    compare("synthetic catalogue", apriori, popularity, args.repeat, rng)
+
+
+if __name__ == "__main__":
+    main()
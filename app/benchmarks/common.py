@@ -0,0 +1,25 @@
+# shared setup for the benchmark scripts, they run against stub settings instead of a .env file
+import os
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent  # Goes up one level from 'benchmarks'
+sys.path.insert(0, str(ROOT_DIR))
+
+
+def setup_env(base_url="http://127.0.0.1:8010/v1"):
+    defaults = {
+        "DATABASE_HOSTNAME": "localhost",
+        "DATABASE_PORT": "5432",
+        "DATABASE_PASSWORD": "password",
+        "DATABASE_USERNAME": "postgres",
+        "DATABASE_NAME": "coffee",
+        "SECRET_KEY": "benchmark",
+        "ALGORITHM": "HS256",
+        "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+        "TOKEN": "stub",
+        "MODEL_NAME": "stub",
+    }
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+    os.environ["BASE_URL"] = base_url
@@ -0,0 +1,139 @@
+# offline evaluation of the local guard pre-classifier: how many llm calls it saves per margin and how many messages
+# it lets through that the reference rejects. only clearly allowed messages are decided locally, each of their
+# sentences has to be voted allowed. the local "not allowed" vote the first version also used is reported for
+# comparison, along with the whole message vote it was taken on.
+# run from the app directory.
+#   leave-one-out over the labelled examples and over messages mixing an allowed and a rejected example, no llm needed:
+#     python benchmarks/eval_guard.py
+#   against the llm guard on logged messages, one {"text": ...} object per line:
+#     python benchmarks/eval_guard.py --dataset messages.jsonl --base-url https://...
+#   against labels stored in the dataset ({"text": ..., "label": "allowed" | "not allowed"}):
+#     python benchmarks/eval_guard.py --dataset labelled.jsonl --reference labels
+import argparse
+import json
+import os
+
+import numpy as np
+
+from common import ROOT_DIR, setup_env
+
+MARGINS = (0.2, 0.4, 0.6, 0.8, 0.9, 0.95, 0.98)
+
+
+def load_dataset(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def join_messages(first, second):
+    separator = " " if first.rstrip()[-1:] in ".!?" else ". "
+    return f"{first.rstrip()}{separator}{second}"
+
+
+def mixed_messages(examples):
+    # an on topic request with an off topic one before or after it, the llm guard rejects these
+    allowed = [i for i, (_, label) in enumerate(examples) if label == "allowed"]
+    rejected = [i for i, (_, label) in enumerate(examples) if label != "allowed"]
+    messages = []
+    for i, j in zip(allowed, rejected):
+        messages.append((join_messages(examples[i][0], examples[j][0]), "not allowed", (i, j)))
+        messages.append((join_messages(examples[j][0], examples[i][0]), "not allowed", (i, j)))
+    return messages
+
+
+def get_llm_decisions(texts):
+    from agents import GuardAgent
+    from config import settings
+    settings.GUARD_LOCAL_CLASSIFIER = False
+    guard_agent = GuardAgent()
+    decisions = []
+    for text in texts:
+        output = guard_agent.get_response([{"role": "user", "content": text}])
+        decisions.append(output["memory"]["guard_decision"])
+    return decisions
+
+
+def share(count, total):
+    return f"{count / total:.1%}" if total else "n/a"
+
+
+def report(segment_predictions, whole_predictions, reference):
+    from agents.guard_agent import is_clearly_allowed
+
+    total = len(reference)
+    rejected = sum(expected != "allowed" for expected in reference)
+    print(f"{total} messages, {rejected} rejected by the reference")
+    print(
+        f"{'margin':>6} {'local':>6} {'calls saved':>11} {'allowed precision':>17} {'let through':>11}"
+        f" {'whole message let through':>25} {'not allowed precision':>21}"
+    )
+    for margin in MARGINS:
+        local = [expected for predictions, expected in zip(segment_predictions, reference) if is_clearly_allowed(predictions, margin)]
+        let_through = sum(expected != "allowed" for expected in local)
+        # the first version: one vote on the whole message, both labels decided locally
+        whole_allowed = [expected for (label, _, vote_margin), expected in zip(whole_predictions, reference) if label == "allowed" and vote_margin >= margin]
+        whole_rejected = [expected for (label, _, vote_margin), expected in zip(whole_predictions, reference) if label != "allowed" and vote_margin >= margin]
+        print(
+            f"{margin:>6.2f} {len(local):>6} {share(len(local), total):>11} {share(len(local) - let_through, len(local)):>17}"
+            f" {let_through:>11} {sum(expected != 'allowed' for expected in whole_allowed):>25}"
+            f" {share(sum(expected != 'allowed' for expected in whole_rejected), len(whole_rejected)):>21}"
+        )
+
+
+def predict(EmbeddingKNNClassifier, split_segments, embed, messages, examples, example_embeddings):
+    # (per sentence votes, whole message vote) of every message, leaving out the examples a message was built from
+    segment_predictions, whole_predictions = [], []
+    for text, _, sources in messages:
+        keep = np.array([i not in sources for i in range(len(examples))])
+        classifier = EmbeddingKNNClassifier(example_embeddings[keep], [label for i, (_, label) in enumerate(examples) if keep[i]])
+        segment_predictions.append([classifier.predict(embed(segment)) for segment in split_segments(text)])
+        whole_predictions.append(classifier.predict(embed(text)))
+    return segment_predictions, whole_predictions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--examples", default=str(ROOT_DIR / "index_and_data/guard_examples.json"))
+    parser.add_argument("--dataset", help="jsonl file of messages, defaults to leave-one-out over the examples")
+    parser.add_argument("--reference", choices=["llm", "labels"], default="llm")
+    parser.add_argument("--base-url", help="llm used as the reference guard")
+    args = parser.parse_args()
+
+    setup_env(args.base_url or os.environ.get("BASE_URL", "http://127.0.0.1:8010/v1"))
+    # the model and index paths are relative to the app directory
+    os.chdir(ROOT_DIR)
+    from agents.embedding_service import get_embedding_service
+    from agents.local_classifier import EmbeddingKNNClassifier
+    from agents.guard_agent import split_segments
+
+    embedding_service = get_embedding_service()
+    with open(args.examples) as f:
+        labelled = json.load(f)
+    examples = [(text, label) for label, texts in labelled.items() for text in texts]
+    example_embeddings = embedding_service.embed_many([text for text, _ in examples])
+
+    if args.dataset is None:
+        messages = [(text, label, (i,)) for i, (text, label) in enumerate(examples)] + mixed_messages(examples)
+    else:
+        rows = load_dataset(args.dataset)
+        known = {text for text, _ in examples}
+        overlap = sum(row["text"] in known for row in rows)
+        if overlap:
+            print(f"warning: {overlap} messages are also labelled examples, agreement will be optimistic")
+        messages = [(row["text"], row.get("label"), ()) for row in rows]
+
+    texts = list(dict.fromkeys([text for text, _, _ in messages] + [segment for text, _, _ in messages for segment in split_segments(text)]))
+    embeddings = dict(zip(texts, embedding_service.embed_many(texts)))
+    segment_predictions, whole_predictions = predict(
+        EmbeddingKNNClassifier, split_segments, lambda text: embeddings[text].reshape(1, -1), messages, examples, example_embeddings
+    )
+
+    if args.dataset is None or args.reference == "labels":
+        reference = [label for _, label, _ in messages]
+    else:
+        reference = get_llm_decisions([text for text, _, _ in messages])
+    report(segment_predictions, whole_predictions, reference)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+# end to end load test of /chats/ask: simulated users replay the conversations of a jsonl file against the app, the
+# llm is the local stub server. reports latency percentiles, turns per second and the db and llm time of each turn
+# from the Server-Timing header.
+# run from the app directory, the app needs its database:
+#   python benchmarks/load_test.py --users 50 --duration 60
+#   python benchmarks/load_test.py --users 50 --save load_baseline.json
+#   python benchmarks/load_test.py --users 50 --baseline load_baseline.json       # after a change, same arguments
+#   python benchmarks/load_test.py --distribution lognormal --latency 0.4 --kind-latency guard=0.1 classification=0.1
+# by default the stub llm and the app (uvicorn) run inside this process. to load a separately started app, run
+# stub_llm.py, start the app with BASE_URL pointing at it and SERVER_TIMING=true, and pass --url.
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import threading
+import time
+import uuid
+
+import httpx
+
+from common import ROOT_DIR, setup_env
+from stub_llm import StubLLMServer, LATENCY_DISTRIBUTIONS, REQUEST_KINDS, parse_kind_latencies
+from request_timing import parse_server_timing
+
+CONVERSATIONS_FILE = str(ROOT_DIR / "benchmarks/conversations.jsonl")
+PASSWORD = "load-test-password"
+
+
+def read_conversations(path):
+    # one {"conversation_id", "turns": [prompt, ...]} per line
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(p / 100 * len(values))) - 1))]
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_app(port):
+    # uvicorn in a thread, the app is imported after setup_env so it reads the stub settings
+    import uvicorn
+
+    os.chdir(ROOT_DIR)
+    server = uvicorn.Server(uvicorn.Config("main:app", host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise SystemExit("the app did not start")
+        time.sleep(0.05)
+    return server, thread
+
+
+async def wait_until_ready(client, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/ready")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise SystemExit(f"the app was not ready after {timeout}s")
+
+
+async def create_user(client, run_id, i, semaphore):
+    # password hashing is slow on purpose, a few sign ups at a time
+    email = f"load-{run_id}-{i}@example.com"
+    async with semaphore:
+        response = await client.post("/users/", json={"email": email, "password": PASSWORD})
+        response.raise_for_status()
+        response = await client.post("/auth/login", data={"username": email, "password": PASSWORD})
+        response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def simulate_user(client, headers, conversations, offset, deadline, iterations, think_time, results):
+    # each user goes through the conversations in turn, starting at its own offset
+    done = 0
+    while time.monotonic() < deadline and (iterations is None or done < iterations):
+        conversation = conversations[(offset + done) % len(conversations)]
+        for prompt in conversation["turns"]:
+            if time.monotonic() >= deadline:
+                return
+            start = time.perf_counter()
+            try:
+                response = await client.post("/chats/ask", json={"prompt": prompt}, headers=headers)
+                status = response.status_code
+                timings = parse_server_timing(response.headers.get("server-timing", ""))
+            except httpx.HTTPError as e:
+                status, timings = type(e).__name__, {}
+            results.append({
+                "latency": (time.perf_counter() - start) * 1e3,
+                "status": status,
+                "db": timings.get("db"),
+                "llm": timings.get("llm"),
+                "total": timings.get("total"),
+            })
+            if think_time:
+                await asyncio.sleep(think_time)
+        done += 1
+
+
+def summarize(results, elapsed):
+    ok = [result for result in results if result["status"] in (200, 201)]
+    latencies = [result["latency"] for result in ok]
+    summary = {
+        "turns": len(results),
+        "errors": len(results) - len(ok),
+        "seconds": elapsed,
+        "rps": len(ok) / elapsed if elapsed else 0.0,
+    }
+    for p in (50, 95, 99):
+        summary[f"latency_p{p}_ms"] = percentile(latencies, p)
+    summary["latency_max_ms"] = max(latencies) if latencies else None
+    # the db and llm time of a turn, and what the app spent outside of both
+    for name in ("db", "llm"):
+        values = [result[name] or 0.0 for result in ok if result["total"] is not None]
+        summary[f"{name}_mean_ms"] = statistics.mean(values) if values else None
+        summary[f"{name}_p95_ms"] = percentile(values, 95)
+    app_times = [result["total"] - (result["db"] or 0.0) - (result["llm"] or 0.0) for result in ok if result["total"] is not None]
+    summary["app_mean_ms"] = statistics.mean(app_times) if app_times else None
+    return summary
+
+
+def format_value(value):
+    return "n/a" if value is None else f"{value:.1f}"
+
+
+def report(summary, baseline=None):
+    print(f"{summary['turns']} turns, {summary['errors']} errors in {summary['seconds']:.1f}s")
+    if summary["db_mean_ms"] is None:
+        print("no Server-Timing header, start the app with SERVER_TIMING=true for the db and llm time")
+    for key, value in summary.items():
+        if key in ("turns", "errors", "seconds"):
+            continue
+        line = f"{key:>16}: {format_value(value):>9}"
+        previous = (baseline or {}).get(key)
+        if value is not None and previous:
+            line += f"   baseline {format_value(previous):>9} ({(value - previous) / previous:+.1%})"
+        print(line)
+
+
+async def run(args):
+    conversations = read_conversations(args.conversations)
+    limits = httpx.Limits(max_connections=args.users + 10, max_keepalive_connections=args.users + 10)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        await wait_until_ready(client, args.ready_timeout)
+
+        run_id = uuid.uuid4().hex[:8]
+        semaphore = asyncio.Semaphore(8)
+        users = await asyncio.gather(*[create_user(client, run_id, i, semaphore) for i in range(args.users)])
+        print(f"{args.users} users signed in, replaying {len(conversations)} conversations")
+
+        results = []
+        start = time.perf_counter()
+        deadline = time.monotonic() + args.duration
+        await asyncio.gather(*[
+            simulate_user(client, headers, conversations, i, deadline, args.iterations, args.think_time, results)
+            for i, headers in enumerate(users)
+        ])
+        return summarize(results, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20, help="simulated users sending turns at the same time")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to run")
+    parser.add_argument("--iterations", type=int, help="conversations per user, stops before --duration when reached")
+    parser.add_argument("--think-time", type=float, default=0.0, help="seconds a user waits between turns")
+    parser.add_argument("--conversations", default=CONVERSATIONS_FILE)
+    parser.add_argument("--url", help="an app that is already running, instead of starting one in this process")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--ready-timeout", type=float, default=300.0, help="seconds to wait for the agents to load")
+    parser.add_argument("--latency", type=float, default=0.2, help="stub llm latency in seconds")
+    parser.add_argument("--distribution", choices=LATENCY_DISTRIBUTIONS, default="lognormal")
+    parser.add_argument("--spread", type=float, default=0.5, help="uniform: +- fraction of the latency, lognormal: sigma")
+    parser.add_argument("--kind-latency", nargs="*", default=[], metavar="KIND=SECONDS", help=f"latency per request kind, kinds are {', '.join(REQUEST_KINDS)}")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="write the results to this json file")
+    parser.add_argument("--baseline", help="compare with results saved by --save")
+    args = parser.parse_args()
+
+    server = None
+    if args.url is None:
+        stub = StubLLMServer(
+            latency=args.latency,
+            latency_distribution=args.distribution,
+            latency_spread=args.spread,
+            kind_latencies=parse_kind_latencies(args.kind_latency),
+            seed=args.seed,
+        ).start()
+        setup_env(stub.base_url)
+        os.environ["SERVER_TIMING"] = "true"
+        port = get_free_port()
+        server, _ = start_app(port)
+        args.url = f"http://127.0.0.1:{port}"
+
+    try:
+        summary = asyncio.run(run(args))
+    finally:
+        if server is not None:
+            server.should_exit = True
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["summary"]
+    report(summary, baseline)
+
+    if args.save:
+        config = {key: value for key, value in vars(args).items() if key not in ("save", "baseline")}
+        with open(args.save, "w") as f:
+            json.dump({"config": config, "summary": summary}, f, indent=2)
+        print(f"saved to {args.save}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+# local stand-in for an OpenAI compatible /v1/chat/completions server.
+# point settings.BASE_URL at http://127.0.0.1:<port>/v1 to run the agents without a real model.
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def pick_decision(user_message):
+    user_message = user_message.lower()
+    if "recommend" in user_message or "suggest" in user_message:
+        return "recommendation_agent"
+    if "order" in user_message or "want" in user_message or "please" in user_message:
+        return "order_taking_agent"
+    return "details_agent"
+
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "lognormal", "exponential")
+# what a request is for, each kind can have its own latency
+REQUEST_KINDS = ("guard", "classification", "recommendation_type", "order_taking", "answer")
+
+
+def get_request_kind(messages):
+    system_prompt = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+    if "relevant to the coffee shop or not" in system_prompt:
+        return "guard"
+    if "what agent should handle the user input" in system_prompt:
+        return "classification"
+    if "We have 3 types of recommendations" in system_prompt:
+        return "recommendation_type"
+    if "customer support Bot" in system_prompt:
+        return "order_taking"
+    return "answer"
+
+
+def canned_response(messages):
+    kind = get_request_kind(messages)
+    user_message = messages[-1]["content"] if messages else ""
+
+    if kind == "guard":
+        if "weather" in user_message.lower():
+            return json.dumps({"chain of thought": "stub", "decision": "not allowed",
+                               "message": "Sorry, I can't help with that. Can I help you with your order?"})
+        return json.dumps({"chain of thought": "stub", "decision": "allowed", "message": ""})
+    if kind == "classification":
+        return json.dumps({"chain of thought": "stub", "decision": pick_decision(user_message), "message": ""})
+    if kind == "recommendation_type":
+        return json.dumps({"chain of thought": "stub", "recommendation_type": "popular", "parameters": []})
+    if kind == "order_taking":
+        return json.dumps({
+            "chain of thought": "stub",
+            "step_number": "3",
+            "order": [{"item": "Latte", "quantity": 1}],
+            "response": "One Latte. Anything else?",
+        })
+    return "Here is a stub answer from the local test server."
+
+
+def parse_kind_latencies(values):
+    # ["guard=0.05", "answer=0.8"] from the command line
+    kind_latencies = {}
+    for value in values:
+        kind, _, seconds = value.partition("=")
+        if kind not in REQUEST_KINDS:
+            raise ValueError(f"request kind must be one of {REQUEST_KINDS}, got {kind!r}")
+        kind_latencies[kind] = float(seconds)
+    return kind_latencies
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        # called once per connection, the latency stands in for the tcp and tls handshakes with a remote server
+        with self.server.connections_lock:
+            self.server.connections += 1
+        time.sleep(self.server.connection_latency)
+        super().setup()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        request = json.loads(body)
+
+        # prefill grows with the prompt, about four characters per token
+        prompt_tokens = sum(len(message["content"]) for message in request["messages"]) // 4
+        time.sleep(self.server.sample_latency(get_request_kind(request["messages"])) + prompt_tokens * self.server.prompt_token_latency)
+        content = canned_response(request["messages"])
+
+        if request.get("stream"):
+            self.send_stream(request, content)
+            return
+
+        payload = json.dumps({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4, "total_tokens": prompt_tokens + len(content) // 4},
+        }).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_stream(self, request, content):
+        # server-sent events, a few characters per chunk, the connection is closed at the end
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        for i in range(0, len(content), 8):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.get("model", "stub"),
+                "choices": [{"index": 0, "delta": {"content": content[i:i + 8]}, "finish_reason": None}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+            time.sleep(self.server.token_latency)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+class StubLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.2, token_latency=0.01, prompt_token_latency=0.0, connection_latency=0.0,
+                 latency_distribution="fixed", latency_spread=0.5, kind_latencies=None, seed=None):
+        super().__init__((host, port), StubLLMHandler)
+        if latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"latency_distribution must be one of {LATENCY_DISTRIBUTIONS}, got {latency_distribution!r}")
+        # latency is the median for lognormal and the mean otherwise, kind_latencies replace it for some request kinds
+        self.latency = latency
+        self.latency_distribution = latency_distribution
+        # uniform: +- this fraction of the latency, lognormal: sigma of the log
+        self.latency_spread = latency_spread
+        self.kind_latencies = kind_latencies or {}
+        self.random = random.Random(seed)
+        self.token_latency = token_latency
+        self.prompt_token_latency = prompt_token_latency
+        self.connection_latency = connection_latency
+        # connections accepted so far, to see how well clients reuse them
+        self.connections = 0
+        self.connections_lock = threading.Lock()
+
+    def sample_latency(self, kind):
+        latency = self.kind_latencies.get(kind, self.latency)
+        if latency <= 0 or self.latency_distribution == "fixed":
+            return max(latency, 0.0)
+        if self.latency_distribution == "uniform":
+            return max(0.0, self.random.uniform(latency * (1 - self.latency_spread), latency * (1 + self.latency_spread)))
+        if self.latency_distribution == "lognormal":
+            return latency * math.exp(self.random.gauss(0.0, self.latency_spread))
+        return self.random.expovariate(1.0 / latency)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="OpenAI compatible stub server")
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds to wait before answering")
+    parser.add_argument("--prompt-token-latency", type=float, default=0.0, help="extra seconds per prompt token")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="seconds between streamed chunks")
+    parser.add_argument("--distribution", choices=LATENCY_DISTRIBUTIONS, default="fixed")
+    parser.add_argument("--spread", type=float, default=0.5, help="uniform: +- fraction of the latency, lognormal: sigma")
+    parser.add_argument("--kind-latency", nargs="*", default=[], metavar="KIND=SECONDS", help=f"latency per request kind, kinds are {', '.join(REQUEST_KINDS)}")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    server = StubLLMServer(
+        port=args.port,
+        latency=args.latency,
+        token_latency=args.token_latency,
+        prompt_token_latency=args.prompt_token_latency,
+        latency_distribution=args.distribution,
+        latency_spread=args.spread,
+        kind_latencies=parse_kind_latencies(args.kind_latency),
+        seed=args.seed,
+    )
+    print(f"stub llm listening on {server.base_url}")
+    server.serve_forever()
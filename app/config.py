@@ -13,6 +13,94 @@ class Settings(BaseSettings):
     TOKEN: str
     MODEL_NAME: str
     BASE_URL: str
+    # "off", "classification" (run guard and classification together) or "full" (also the routed agent)
+    SPECULATIVE_EXECUTION: str = "off"
+    # details agent retrieval
+    DETAILS_TOP_K: int = 2
+    # fuse BM25 with the vector search, each retriever's candidates are merged with reciprocal rank fusion
+    DETAILS_HYBRID_SEARCH: bool = True
+    DETAILS_RETRIEVAL_CANDIDATES: int = 10
+    DETAILS_RRF_K: int = 60
+    # documents longer than this are split into their sections, at load time for the prebuilt index and at build time
+    # by scripts/build_product_index.py, so a question about the hours gets the hours section, not the whole about page
+    DETAILS_SECTION_CHARS: int = 800
+    # documents after the best one are only added while the context stays under this many characters, 0 is no
+    # limit. documents are never cut, the best one is always kept whole
+    DETAILS_CONTEXT_MAX_CHARS: int = 600
+    DETAILS_INDEX_MMAP: bool = False
+    DETAILS_INDEX_VERSION: str = ""
+    DETAILS_INDEX_DIR: str = "./index_and_data/indexes"
+    INDEX_RELOAD_INTERVAL: float = 5.0
+    # query embedding cache, an empty path keeps it in memory only
+    EMBEDDING_CACHE_SIZE: int = 2048
+    EMBEDDING_CACHE_TTL: float = 86400.0
+    EMBEDDING_CACHE_PATH: str = ""
+    # rows kept in the sqlite file, the oldest are deleted on write
+    EMBEDDING_CACHE_DISK_SIZE: int = 100000
+    # embedding requests arriving within the window are encoded as one batch
+    EMBEDDING_BATCH_WINDOW: float = 0.005
+    EMBEDDING_BATCH_SIZE: int = 32
+    # details answers reused for near identical questions, a size of 0 disables the cache
+    DETAILS_ANSWER_CACHE_THRESHOLD: float = 0.95
+    DETAILS_ANSWER_CACHE_SIZE: int = 512
+    # one pooled http client per process shared by every agent, timeouts are in seconds.
+    # the routing timeout covers the short guard, classification and summary calls
+    LLM_MAX_CONNECTIONS: int = 100
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = 50
+    LLM_KEEPALIVE_EXPIRY: float = 30.0
+    LLM_HTTP2: bool = False
+    LLM_TIMEOUT: float = 120.0
+    LLM_CONNECT_TIMEOUT: float = 5.0
+    LLM_ROUTING_TIMEOUT: float = 20.0
+    LLM_MAX_RETRIES: int = 2
+    # exact match llm completion cache, only used for the agents listed here
+    LLM_CACHE_AGENTS: str = "guard_agent,classification_agent"
+    LLM_CACHE_SIZE: int = 4096
+    LLM_CACHE_TTL: float = 3600.0
+    LLM_CACHE_PATH: str = ""
+    # rows kept in the sqlite file, the oldest are deleted on write
+    LLM_CACHE_DISK_SIZE: int = 100000
+    # local guard pre-classifier, a message is allowed without the llm guard only when every sentence is voted allowed
+    # by at least the margin, everything else goes to the llm. the margin is the lowest one that lets no rejected
+    # message through in benchmarks/eval_guard.py, rerun it after changing the examples or the embedding model
+    GUARD_LOCAL_CLASSIFIER: bool = True
+    GUARD_LOCAL_MARGIN: float = 0.95
+    GUARD_EXAMPLES_PATH: str = "./index_and_data/guard_examples.json"
+    # local intent router, the llm classifier is only called when the top two agents are closer than the margin
+    CLASSIFICATION_LOCAL_ROUTER: bool = True
+    CLASSIFICATION_LOCAL_MARGIN: float = 0.5
+    CLASSIFICATION_EXAMPLES_PATH: str = "./index_and_data/intent_examples.json"
+    # ask for response_format json_object on the json agents, only for backends that support it
+    LLM_JSON_MODE: bool = False
+    # number of most recent chat rows given to the agents
+    HISTORY_WINDOW: int = 20
+    # load the agents in the background at startup instead of on the first chat request
+    AGENT_WARM_UP: bool = True
+    # add a Server-Timing header with the db and llm time of each request, for benchmarks/load_test.py
+    SERVER_TIMING: bool = False
+    # recommendation rules mined from the orders by scripts/mine_recommendations.py, workers check for new versions
+    RECOMMENDATION_LIVE_DIR: str = "./recommendation_objects/live"
+    RECOMMENDATION_RELOAD_INTERVAL: float = 30.0
+    # menu and prices, the order taking agent prices orders from it
+    MENU_PATH: str = "./index_and_data/menu.json"
+    # order taking prompt: recent messages are sent as is, older ones are folded into a summary in batches
+    ORDER_CONTEXT_TOKEN_BUDGET: int = 3000
+    ORDER_CONTEXT_RECENT_MESSAGES: int = 6
+    ORDER_CONTEXT_SUMMARY_BATCH: int = 6
+    # async database pool, the statement timeout is in milliseconds
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_TIMEOUT_MS: int = 5000
+    # write each chat turn after the response has been sent, the next request may not see it yet
+    CHAT_PERSIST_IN_BACKGROUND: bool = False
+    # per user conversation state, "memory" for a single replica or "redis" to share it between replicas
+    STATE_STORE: str = "memory"
+    STATE_STORE_URL: str = "redis://localhost:6379/0"
+    STATE_TTL: float = 86400.0
+    STATE_STORE_SIZE: int = 10000
     class Config:
         env_file = ".env"
 
@@ -1,13 +1,49 @@
-from fastapi import FastAPI
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Response, status
 import models
-from database import engine
+from database import engine, async_engine
 from routers import users, auth, chats
-from agents import AgentProtocol
+from routers.chats import agent_registry
+from config import settings
+from request_timing import start_request_timing, format_server_timing
+from agents.json_repair import json_repair_stats
 import os
 
 
-models.Base.metadata.create_all(bind=engine)
-app = FastAPI()
+def create_tables():
+    # a new database gets its tables and their indexes. indexes added to existing tables are built by
+    # scripts/migrate.py before the deploy, never here where they would lock writes to chats while the app starts
+    models.Base.metadata.create_all(bind=engine)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await asyncio.to_thread(create_tables)
+    # the agents load in the background, / and /ready answer meanwhile and /chats requests wait for them
+    warm_up = asyncio.create_task(agent_registry.awarm_up()) if settings.AGENT_WARM_UP else None
+    yield
+    if warm_up is not None:
+        warm_up.cancel()
+    # openai is only imported by then, not at startup
+    from agents.llm_client import aclose_llm_clients
+    await aclose_llm_clients()
+    await async_engine.dispose()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+if settings.SERVER_TIMING:
+    @app.middleware("http")
+    async def server_timing(request: Request, call_next):
+        # time until the response starts, a streamed body and background tasks come after it
+        timings = start_request_timing()
+        start = time.perf_counter()
+        response = await call_next(request)
+        response.headers["Server-Timing"] = format_server_timing(timings, time.perf_counter() - start)
+        return response
 
 app.include_router(users.router)
 app.include_router(auth.router)
@@ -18,3 +54,20 @@ app.include_router(chats.router)
 async def root():
     return {"message": "hey there"}
 
+
+@app.get("/ready")
+async def ready(response: Response):
+    # for readiness probes, 503 until the agents are loaded
+    if not agent_registry.ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return agent_registry.status()
+
+
+@app.get("/stats")
+async def stats():
+    # counters of this worker since it started, speculation is null until the agents are loaded
+    pipeline = agent_registry.pipeline
+    return {
+        "speculation": pipeline.stats() if pipeline is not None else None,
+        "json_repair": json_repair_stats.stats(),
+    }
@@ -0,0 +1,3 @@
+-- composite index behind the per user history window (GET /chats/history and the agents' context).
+-- built without blocking writes by scripts/migrate.py, which runs before the api (the migrate service in docker-compose).
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_chats_user_id_created_at ON chats (user_id, created_at, id);
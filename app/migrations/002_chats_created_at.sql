@@ -0,0 +1,4 @@
+-- index behind the recommendation miner's watermark (scripts/mine_recommendations.py), it reads only the rows
+-- saved since its last run instead of scanning the table.
+-- built without blocking writes by scripts/migrate.py, which runs before the api (the migrate service in docker-compose).
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_chats_created_at ON chats (created_at, id);
@@ -1,5 +1,5 @@
 from database import Base
-from sqlalchemy import Column, Integer, String, Boolean, TIMESTAMP, text, ForeignKey, Text, JSON
+from sqlalchemy import Column, Integer, String, Boolean, TIMESTAMP, text, ForeignKey, Text, JSON, Index
 from sqlalchemy.orm import Relationship
 
 
@@ -21,3 +21,9 @@ class Chats(Base):
     memory = Column(JSON)
     created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
 
+    # serves the per user history window, id breaks ties between rows saved in the same instant.
+    # the second one serves the recommendation miner's watermark
+    __table_args__ = (
+        Index("ix_chats_user_id_created_at", "user_id", "created_at", "id"),
+        Index("ix_chats_created_at", "created_at", "id"),
+    )
@@ -7,7 +7,8 @@ from jwt import PyJWTError
 from fastapi.security import OAuth2PasswordBearer
 import database
 import models
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from config import settings
 
 
@@ -48,7 +49,10 @@ def verify_token(token: str):
     return token_data
 
 # get current user
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(database.get_db)):
     token = verify_token(token)
-    user = db.query(models.User).filter(models.User.id == token.id).first()
+    result = await db.execute(select(models.User).where(models.User.id == int(token.id)))
+    user = result.scalars().first()
+    # end the read transaction, the request may hold this session for a long llm call
+    await db.commit()
     return user
\ No newline at end of file
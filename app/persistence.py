@@ -0,0 +1,37 @@
+# writes a whole chat turn, the user's prompt and the assistant's answer, in one transaction
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+import models
+from database import AsyncSessionLocal
+
+
+async def save_turn(db: AsyncSession, user_id: int, prompt: str, response: dict):
+    """Inserts both rows with a single INSERT .. RETURNING and returns the assistant row as a dict.
+
+    Nothing is written when the agents failed before producing an answer, so a turn is either complete or absent.
+    """
+    rows = [
+        {"user_id": user_id, "role": "user", "content": prompt, "memory": {}},
+        {"user_id": user_id, "role": response["role"], "content": response["content"], "memory": response.get("memory")},
+    ]
+    # both rows share the transaction's now(), id keeps the prompt before the answer
+    result = await db.execute(
+        insert(models.Chats).returning(
+            models.Chats.id, models.Chats.role, models.Chats.content, models.Chats.created_at,
+            sort_by_parameter_order=True,
+        ),
+        rows,
+    )
+    saved = [dict(row) for row in result.mappings().all()]
+    await db.commit()
+    return saved[-1]
+
+
+async def save_turn_in_new_session(user_id: int, prompt: str, response: dict):
+    # for writes after the request's own session is gone: streaming responses and background tasks
+    async with AsyncSessionLocal() as db:
+        try:
+            return await save_turn(db, user_id, prompt, response)
+        except Exception as e:
+            print(f"Error: could not save chat turn for user {user_id}: {e}")
+            raise
@@ -0,0 +1,46 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# phase name -> seconds spent in it by the request being handled, None outside of a timed request.
+# tasks and threads started by the request copy the context, so they add to the same dict
+request_timings: ContextVar = ContextVar("request_timings", default=None)
+
+
+def start_request_timing():
+    timings = {}
+    request_timings.set(timings)
+    return timings
+
+
+def add_timing(name, seconds):
+    timings = request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def timed(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_timing(name, time.perf_counter() - start)
+
+
+def format_server_timing(timings, total):
+    # Server-Timing header, durations in milliseconds. concurrent llm calls overlap, their sum can exceed the total
+    metrics = [f"{name};dur={seconds * 1e3:.1f}" for name, seconds in sorted(timings.items())]
+    return ", ".join(metrics + [f"total;dur={total * 1e3:.1f}"])
+
+
+def parse_server_timing(header):
+    # {name: milliseconds}, for clients such as the load test
+    timings = {}
+    for metric in header.split(","):
+        name, _, params = metric.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur":
+                timings[name] = float(value)
+    return timings
@@ -1,6 +1,7 @@
 from fastapi import status, HTTPException, Depends, APIRouter
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 import sys
 from pathlib import Path
 
@@ -21,10 +22,11 @@ router = APIRouter(
 
 @router.post("/login", response_model=schemas.Token)
 async def login(user_credentials: OAuth2PasswordRequestForm = Depends(), 
-                db: Session = Depends(database.get_db)):
+                db: AsyncSession = Depends(database.get_db)):
     # we use username insted of email because OAuth2PasswordRequestForm uses username instead of email
     # now it accepet form data instead of json for security
-    user = db.query(models.User).filter(models.User.email == user_credentials.username).first()
+    result = await db.execute(select(models.User).where(models.User.email == user_credentials.username))
+    user = result.scalars().first()
     if not user:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, 
                             detail=f"user not found")
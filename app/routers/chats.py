@@ -1,84 +1,101 @@
-from fastapi import FastAPI, status, HTTPException, APIRouter
-from sqlalchemy.orm import Session
+from fastapi import FastAPI, status, HTTPException, APIRouter, Query, Request, Response, BackgroundTasks
+from fastapi.responses import StreamingResponse, ORJSONResponse
+from starlette.background import BackgroundTask
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Depends
 from typing import List, Optional
 # At the top of your routers/user.py:
 import sys
 from pathlib import Path
 import ast
-from sqlalchemy import desc
+import base64
+import hashlib
+import json
+from datetime import datetime
+from sqlalchemy import desc, select, tuple_
 
 # This line gets the absolute path to your root directory
 ROOT_DIR = Path(__file__).parent.parent  # Goes up one level from 'routers'
 sys.path.insert(0, str(ROOT_DIR))
 import schemas
 import models
-from database import engine, get_db
+from database import get_db
+from persistence import save_turn, save_turn_in_new_session
+from config import settings
 import oauth2
-from agents import AgentProtocol
-from agents import (GuardAgent,
-                    ClassificationAgent,
-                    DetailsAgent,
-                    RecommendationAgent,
-                    OrderTakingAgent
-                    )
-guard_agent = GuardAgent()
-classification_agent = ClassificationAgent()
-recommendation_agent = RecommendationAgent("./recommendation_objects/apriori_recommendation.json","./recommendation_objects/popularity_recommendation.csv")
-agent_dict: dict[str, AgentProtocol] = {
-    "details_agent": DetailsAgent(),
-    "order_taking_agent": OrderTakingAgent(recommendation_agent),
-    "recommendation_agent": recommendation_agent
-}
+from agents import AgentProtocol, AgentRegistry
 
 
+def build_agent_pipeline():
+    # imported here, the agents load torch, the embedding model and the indexes
+    from agents import (GuardAgent,
+                        ClassificationAgent,
+                        DetailsAgent,
+                        RecommendationAgent,
+                        OrderTakingAgent,
+                        AgentPipeline,
+                        create_state_store
+                        )
+    guard_agent = GuardAgent()
+    classification_agent = ClassificationAgent()
+    recommendation_agent = RecommendationAgent("./recommendation_objects/apriori_recommendation.json","./recommendation_objects/popularity_recommendation.csv")
+    agent_dict: dict[str, AgentProtocol] = {
+        "details_agent": DetailsAgent(),
+        "order_taking_agent": OrderTakingAgent(recommendation_agent),
+        "recommendation_agent": recommendation_agent
+    }
+    return AgentPipeline(guard_agent, classification_agent, agent_dict, state_store=create_state_store())
+
+
+# built on the first request or by the warm up in main.py's lifespan
+agent_registry = AgentRegistry(build_agent_pipeline)
+
 router = APIRouter(
     prefix="/chats",
     tags=["chats"],
 )
 
-@router.post("/ask", status_code=status.HTTP_201_CREATED, response_model=schemas.ChatResponse)
-async def ask_model( data: schemas.PromptRequest,db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
-    
-    # save the user prompt in the db
-    db_chat = models.Chats(
-                    user_id=current_user.id,
-                    role="user",
-                    content=data.prompt,
-                    memory={},
-                )
-    db.add(db_chat)
-    db.commit()
-    db.refresh(db_chat)
-
-    # fetch the previous messages
-    last_chats = (
-        db.query(models.Chats)
-        .filter(models.Chats.user_id == current_user.id)
-        .order_by(desc(models.Chats.created_at))
-        .all()
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+
+
+async def get_user_chats(db: AsyncSession, user_id: int, limit: int):
+    # newest first, only the columns the agents read
+    result = await db.execute(
+        select(models.Chats.id, models.Chats.role, models.Chats.content, models.Chats.memory)
+        .where(models.Chats.user_id == user_id)
+        .order_by(desc(models.Chats.created_at), desc(models.Chats.id))
+        .limit(limit)
     )
+    return result.all()
+
+
+async def get_prompt_messages(db: AsyncSession, user_id: int, user_prompt: str):
+    # the prompt is only saved together with the answer, it takes the last place in the window
+    last_chats = await get_user_chats(db, user_id, max(settings.HISTORY_WINDOW - 1, 0))
+    # end the read transaction so the connection goes back to the pool while the agents run
+    await db.commit()
 
-    # format the last three messages
     formatted_chats = []
     for chat in reversed(last_chats):  # Reverse to maintain chronological order
-        formatted_chats.append({"role": chat.role, "content": chat.content, "memory": chat.memory})
-    
-    # print("\n\n\nformatted chats : ",formatted_chats)
+        # the id marks how far the order taking agent's summary got
+        formatted_chats.append({"id": chat.id, "role": chat.role, "content": chat.content, "memory": chat.memory})
 
-    # added the user prompt with the last three messages
-    prompt = [{"role": "user", "content": data.prompt}] + formatted_chats
+    return formatted_chats + [{"role": "user", "content": user_prompt, "memory": {}}]
 
-    # Get Guard agent response
-    response = guard_agent.get_response(prompt)
-    if response["memory"]["guard_decision"] == "allowed":
-        # Get classification agent
-        response = classification_agent.get_response(prompt)
-        chosen_agent = response["memory"]["classification_decision"]
 
-        # get the chosen agent's response
-        agent = agent_dict[chosen_agent]
-        response = agent.get_response(prompt)
+def format_sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/ask", status_code=status.HTTP_201_CREATED, response_model=schemas.ChatResponse)
+async def ask_model( data: schemas.PromptRequest, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
+    
+    prompt = await get_prompt_messages(db, current_user.id, data.prompt)
+
+    # run guard, classification and the chosen agent without blocking the event loop
+    agent_pipeline = await agent_registry.aget_pipeline()
+    response = await agent_pipeline.aget_response(prompt, session_id=current_user.id)
 
     # parse the response
     parsed_response = None
@@ -100,16 +117,12 @@ async def ask_model( data: schemas.PromptRequest,db: Session = Depends(get_db),
             memory = parsed_response.get("memory")
 
             if role and content is not None: # content can be an empty string but not None
-                db_chat = models.Chats(
-                    user_id=current_user.id,
-                    role=role,
-                    content=content,
-                    memory=memory
-                )
-                db.add(db_chat)
-                db.commit()
-                db.refresh(db_chat)
-                return db_chat
+                turn = {"role": role, "content": content, "memory": memory}
+                if settings.CHAT_PERSIST_IN_BACKGROUND:
+                    # answer first, the turn is written once the response has been sent
+                    background_tasks.add_task(save_turn_in_new_session, current_user.id, data.prompt, turn)
+                    return turn
+                return await save_turn(db, current_user.id, data.prompt, turn)
             else:
                 print(f"Error: 'role' or 'content' missing in parsed response: {parsed_response}")
                 return {"error": "Invalid response from guard agent (missing fields)"}
@@ -123,8 +136,128 @@ async def ask_model( data: schemas.PromptRequest,db: Session = Depends(get_db),
     return {"error": "Failed to process the guard agent's response"}
 
 
+@router.post("/ask/stream")
+async def ask_model_stream(data: schemas.PromptRequest, db: AsyncSession = Depends(get_db), current_user: models.User = Depends(oauth2.get_current_user)):
+    """Streams the final agent's answer as server-sent events and saves it once it is complete."""
+    prompt = await get_prompt_messages(db, current_user.id, data.prompt)
+    agent_pipeline = await agent_registry.aget_pipeline()
+    user_id = current_user.id
+    # filled in by the stream when the turn is left to the background task
+    pending_turn = {}
+
+    async def event_stream():
+        try:
+            async for event in agent_pipeline.astream_response(prompt, session_id=user_id):
+                if event["event"] != "done":
+                    yield format_sse(event["event"], event["data"])
+                    continue
+
+                response = event["data"]
+                role = response.get("role")
+                content = response.get("content")
+                if role and content is not None:
+                    turn = {"role": role, "content": content, "memory": response.get("memory")}
+                    if settings.CHAT_PERSIST_IN_BACKGROUND:
+                        pending_turn["turn"] = turn
+                    else:
+                        # the request session is closed once the streaming response starts, use a fresh one
+                        await save_turn_in_new_session(user_id, data.prompt, turn)
+                yield format_sse("done", {"role": role, "content": content})
+        except Exception as e:
+            print(f"Error: streaming response failed: {e}")
+            yield format_sse("error", {"detail": "Failed to process the agent's response"})
+
+    async def save_pending_turn():
+        if "turn" in pending_turn:
+            await save_turn_in_new_session(user_id, data.prompt, pending_turn["turn"])
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(save_pending_turn),
+    )
+
+
+def encode_cursor(created_at: datetime, chat_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{chat_id}".encode()).decode()
+
+
+def decode_cursor(cursor: Optional[str]):
+    if cursor is None:
+        return None
+    try:
+        created_at, chat_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(chat_id)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid history cursor")
+
+
+async def get_latest_chat_key(db: AsyncSession, user_id: int):
+    # one index lookup, a new message is the only thing that changes a user's history
+    result = await db.execute(
+        select(models.Chats.created_at, models.Chats.id)
+        .where(models.Chats.user_id == user_id)
+        .order_by(desc(models.Chats.created_at), desc(models.Chats.id))
+        .limit(1)
+    )
+    return result.first()
+
+
+async def get_history_page(db: AsyncSession, user_id: int, limit: int, before=None, since=None):
+    # keyset pagination on (created_at, id), returns the page in chronological order
+    key = tuple_(models.Chats.created_at, models.Chats.id)
+    query = select(
+        models.Chats.id, models.Chats.role, models.Chats.content, models.Chats.memory, models.Chats.created_at
+    ).where(models.Chats.user_id == user_id)
+
+    if since is not None:
+        # the oldest messages after the cursor, so a client catching up never skips any
+        query = query.where(key > tuple_(*since)).order_by(models.Chats.created_at, models.Chats.id)
+        result = await db.execute(query.limit(limit))
+        return result.all()
+
+    if before is not None:
+        query = query.where(key < tuple_(*before))
+    result = await db.execute(query.order_by(desc(models.Chats.created_at), desc(models.Chats.id)).limit(limit))
+    return list(reversed(result.all()))
+
+
 @router.get("/history", response_model=List[schemas.ChatHistory])
-async def get_chat_history(db: Session = Depends(get_db), current_user: models.User = Depends(oauth2.get_current_user)):
-    """Retrieves the chat history for the current user."""
-    chats = db.query(models.Chats).filter(models.Chats.user_id == current_user.id).order_by(models.Chats.created_at).all()
-    return chats
\ No newline at end of file
+async def get_chat_history(
+    request: Request,
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    before: Optional[str] = Query(None, description="cursor of the oldest message already loaded, returns older ones"),
+    since: Optional[str] = Query(None, description="cursor of the newest message already loaded, returns newer ones"),
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(oauth2.get_current_user),
+):
+    """Retrieves a page of the chat history for the current user, the latest messages by default.
+
+    X-Prev-Cursor is set when older messages may exist and goes in `before`, X-Latest-Cursor goes in `since`.
+    """
+    before_key = decode_cursor(before)
+    since_key = decode_cursor(since)
+    if before_key is not None and since_key is not None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Use either before or since, not both")
+
+    latest = await get_latest_chat_key(db, current_user.id)
+    latest_cursor = encode_cursor(*latest) if latest is not None else ""
+    # the version of the user's history, not of the query: a client polling with a newer `since` and the previous
+    # ETag gets a 304 as long as nothing was added
+    etag = 'W/"%s"' % hashlib.sha1(f"{current_user.id}|{latest_cursor}".encode()).hexdigest()
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    chats = await get_history_page(db, current_user.id, limit, before_key, since_key)
+
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if chats:
+        headers["X-Latest-Cursor"] = encode_cursor(chats[-1].created_at, chats[-1].id)
+        if since_key is None and len(chats) == limit:
+            headers["X-Prev-Cursor"] = encode_cursor(chats[0].created_at, chats[0].id)
+    elif since is not None:
+        headers["X-Latest-Cursor"] = since
+
+    content = [{"role": chat.role, "content": chat.content, "memory": chat.memory} for chat in chats]
+    return ORJSONResponse(content=content, headers=headers)
\ No newline at end of file
@@ -1,5 +1,6 @@
 from fastapi import FastAPI, status, HTTPException, APIRouter
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Depends
 from typing import List
 # At the top of your routers/user.py:
@@ -22,21 +23,22 @@ router = APIRouter(
 
 # routes for users
 @router.post("/", status_code=status.HTTP_201_CREATED, response_model=schemas.UserResponse)
-async def createuser(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def createuser(user: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
     # hashing the password
     hashed_password = utils.hash(user.password)
     user.password = hashed_password
     db_user = models.User(**user.dict())
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 
 # get users using id
 @router.get("/{id}", response_model=schemas.UserResponse)
-async def getuser(id: int, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.id == id).first()
+async def getuser(id: int, db: AsyncSession = Depends(get_db)):
+    result = await db.execute(select(models.User).where(models.User.id == id))
+    user = result.scalars().first()
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, 
                             detail=f"user with id: {id} was not found")
@@ -0,0 +1,108 @@
+# builds the labelled utterances used by the local intent router from logged traffic.
+# run from the app directory:
+#   python scripts/build_intent_examples.py --jsonl logged_turns.jsonl
+#   python scripts/build_intent_examples.py --from-db --merge
+# jsonl lines are {"text": ..., "label": ...} and should hold reviewed labels. the database source pairs every user
+# message with the agent that answered it, but only for turns the classification llm routed: turns the local router
+# or the order state decided would feed the router's own picks back to it as labels, mistakes included.
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent  # Goes up one level from 'scripts'
+sys.path.insert(0, str(ROOT_DIR))
+
+LABELS = ("details_agent", "order_taking_agent", "recommendation_agent")
+
+
+def read_jsonl(path):
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                yield row["text"], row["label"]
+
+
+def read_database(skipped):
+    # the assistant reply stores the agent that produced it and how it was routed in its memory
+    import models
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        chats = db.query(models.Chats.user_id, models.Chats.role, models.Chats.content, models.Chats.memory)\
+            .order_by(models.Chats.user_id, models.Chats.created_at, models.Chats.id).all()
+    finally:
+        db.close()
+    return labelled_turns(chats, skipped)
+
+
+def labelled_turns(chats, skipped):
+    for previous, current in zip(chats, chats[1:]):
+        if previous.user_id != current.user_id or previous.role != "user" or current.role != "assistant":
+            continue
+        memory = current.memory or {}
+        if memory.get("agent") not in LABELS:
+            continue
+        # replies saved before the source was recorded can't be told apart from local decisions
+        if memory.get("routed_by") != "llm":
+            skipped[memory.get("routed_by") or "unknown"] += 1
+            continue
+        yield previous.content, memory["agent"]
+
+
+def normalize(text):
+    return " ".join(text.lower().split())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jsonl", action="append", default=[], help="logged turns, can be given more than once")
+    parser.add_argument("--from-db", action="store_true", help="read answered turns from the chats table")
+    parser.add_argument("--merge", action="store_true", help="keep the examples already in the output file")
+    parser.add_argument("--max-per-label", type=int, default=500)
+    parser.add_argument("--output", default=str(ROOT_DIR / "index_and_data/intent_examples.json"))
+    args = parser.parse_args()
+
+    if not args.jsonl and not args.from_db:
+        parser.error("give at least one --jsonl file or --from-db")
+
+    examples = {label: [] for label in LABELS}
+    if args.merge and os.path.exists(args.output):
+        with open(args.output) as f:
+            for label, texts in json.load(f).items():
+                examples.setdefault(label, []).extend(texts)
+
+    sources = [read_jsonl(path) for path in args.jsonl]
+    skipped = Counter()
+    if args.from_db:
+        sources.append(read_database(skipped))
+
+    # the most frequent label wins when the same utterance was routed differently over time
+    votes = {}
+    for source in sources:
+        for text, label in source:
+            if label in LABELS and text.strip():
+                votes.setdefault(normalize(text), Counter())[label] += 1
+
+    seen = {normalize(text) for texts in examples.values() for text in texts}
+    for text, counter in votes.items():
+        if text not in seen:
+            examples[counter.most_common(1)[0][0]].append(text)
+
+    for label in examples:
+        examples[label] = examples[label][:args.max_per_label]
+
+    with open(args.output, "w") as f:
+        json.dump(examples, f, indent=2)
+        f.write("\n")
+    print(", ".join(f"{label}: {len(texts)}" for label, texts in examples.items()))
+    if skipped:
+        print("skipped turns not routed by the llm: " + ", ".join(f"{source}: {count}" for source, count in skipped.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+# builds the details agent's product index from a source catalogue and reports how each index type performs.
+# the catalogue is a .jsonl or .csv file, each row either has a "text" field with the whole document or the fields
+# name, description, ingredients, price and rating that make up one.
+# run from the app directory:
+#   python scripts/build_product_index.py                                  # flat index of index_and_data/products.jsonl
+#   python scripts/build_product_index.py --index-type flat hnsw ivfpq --queries questions.txt
+#   python scripts/build_product_index.py --source new_menu.csv --version 2026-10-menu --index-type hnsw
+# documents longer than --section-chars are split at their sections, so the about page's working hours and delivery
+# areas are retrieved on their own.
+# every index type is written to <index dir>/<version>-<type>/, set DETAILS_INDEX_VERSION to that name to serve it.
+import argparse
+import csv
+import json
+import os
+import pickle
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+ROOT_DIR = Path(__file__).parent.parent  # Goes up one level from 'scripts'
+sys.path.insert(0, str(ROOT_DIR))
+
+from config import settings
+from agents.vector_index import split_sections, INDEX_TYPES, INDEX_FILE_NAME, DOCUMENTS_FILE_NAME, MANIFEST_FILE_NAME, build_faiss_index
+
+
+def format_document(row):
+    # the layout of the prebuilt data.pkl documents
+    if row.get("text"):
+        return row["text"]
+    ingredients = row.get("ingredients", [])
+    if isinstance(ingredients, str):
+        ingredients = [item.strip() for item in ingredients.split(",") if item.strip()]
+    return f"{row['name']} : {row.get('description', '')} -- Ingredients: {ingredients} -- Price: {row.get('price', '')} -- Rating: {row.get('rating', '')}"
+
+
+def read_catalogue(path):
+    if path.endswith(".jsonl"):
+        with open(path) as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    elif path.endswith(".csv"):
+        with open(path, newline="") as f:
+            rows = list(csv.DictReader(f))
+    else:
+        raise SystemExit(f"the catalogue must be a .jsonl or .csv file, got {path}")
+    return [format_document(row) for row in rows]
+
+
+def embed_documents(documents, batch_size):
+    from agents.embedding_service import load_embedding_model
+
+    model = load_embedding_model()
+    batches = []
+    for start in range(0, len(documents), batch_size):
+        batch = documents[start:start + batch_size]
+        embeddings = model.encode(batch, normalize_embeddings=True, batch_size=batch_size)
+        batches.append(np.array(embeddings, dtype=np.float32).reshape(len(batch), -1))
+        print(f"embedded {min(start + batch_size, len(documents))}/{len(documents)} documents", end="\r")
+    print()
+    return np.concatenate(batches)
+
+
+def get_queries(query_file, embeddings, count, batch_size):
+    # real questions when given, otherwise the documents themselves with a little noise
+    if query_file:
+        with open(query_file) as f:
+            questions = [line.strip() for line in f if line.strip()]
+        return embed_documents(questions, batch_size)
+    rng = np.random.RandomState(0)
+    queries = embeddings[rng.randint(0, len(embeddings), count)] + rng.normal(0, 0.02, (count, embeddings.shape[1])).astype(np.float32)
+    faiss.normalize_L2(queries)
+    return queries
+
+
+def evaluate(index, queries, truth, top_k):
+    found = index.search(queries, top_k)[1]
+    recall = np.mean([len(set(found[i]) & set(truth[i])) / len(truth[i]) for i in range(len(queries))])
+
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query.reshape(1, -1), top_k)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return recall, statistics.median(timings), timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+
+
+def write_version(version_dir, index, documents, manifest):
+    # the directory gets its name only once every file is in it
+    tmp_dir = f"{version_dir}.tmp"
+    os.makedirs(tmp_dir)
+    faiss.write_index(index, os.path.join(tmp_dir, INDEX_FILE_NAME))
+    with open(os.path.join(tmp_dir, DOCUMENTS_FILE_NAME), "wb") as f:
+        pickle.dump(documents, f)
+    with open(os.path.join(tmp_dir, MANIFEST_FILE_NAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.rename(tmp_dir, version_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", default=str(ROOT_DIR / "index_and_data/products.jsonl"))
+    parser.add_argument("--index-type", nargs="+", choices=INDEX_TYPES, default=["flat"])
+    parser.add_argument("--version", default=datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ"))
+    parser.add_argument("--index-dir", default=settings.DETAILS_INDEX_DIR)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--queries", help="questions to evaluate with, one per line")
+    parser.add_argument("--query-count", type=int, default=500, help="generated queries when --queries isn't given")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--ef-construction", type=int, default=200)
+    parser.add_argument("--ef-search", type=int, default=64)
+    parser.add_argument("--nlist", type=int, help="IVF lists, default sqrt of the document count")
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--pq-m", type=int, default=48)
+    parser.add_argument("--pq-bits", type=int, default=8)
+    parser.add_argument("--section-chars", type=int, default=settings.DETAILS_SECTION_CHARS, help="split longer documents at their sections, 0 keeps them whole")
+    parser.add_argument("--no-write", action="store_true", help="only report")
+    args = parser.parse_args()
+
+    documents = [unit for document in read_catalogue(args.source) for unit in split_sections(document, args.section_chars)]
+    start = time.perf_counter()
+    embeddings = embed_documents(documents, args.batch_size)
+    print(f"{len(documents)} documents embedded in {time.perf_counter() - start:.1f}s")
+
+    queries = get_queries(args.queries, embeddings, args.query_count, args.batch_size)
+    top_k = min(args.top_k, len(documents))
+    exact = faiss.IndexFlatL2(embeddings.shape[1])
+    exact.add(embeddings)
+    truth = exact.search(queries, top_k)[1]
+
+    results = []
+    for index_type in args.index_type:
+        start = time.perf_counter()
+        index, params = build_faiss_index(
+            embeddings, index_type,
+            hnsw_m=args.hnsw_m, ef_construction=args.ef_construction, ef_search=args.ef_search,
+            nlist=args.nlist, nprobe=args.nprobe, pq_m=args.pq_m, pq_bits=args.pq_bits,
+        )
+        build_seconds = time.perf_counter() - start
+        size = faiss.serialize_index(index).nbytes
+        recall, p50, p99 = evaluate(index, queries, truth, top_k)
+        results.append((index_type, build_seconds, size, recall, p50, p99))
+
+        version = f"{args.version}-{index_type}"
+        if not args.no_write:
+            write_version(os.path.join(args.index_dir, version), index, documents, {
+                "version": version,
+                "index_type": index_type,
+                "params": params,
+                "source": os.path.abspath(args.source),
+                "documents": len(documents),
+                "section_chars": args.section_chars,
+                "dimension": int(embeddings.shape[1]),
+                "built_at": datetime.now(timezone.utc).isoformat(),
+                "build_seconds": build_seconds,
+                "index_bytes": size,
+                f"recall_at_{top_k}": recall,
+                "query_p50_ms": p50 * 1e3,
+                "query_p99_ms": p99 * 1e3,
+            })
+            print(f"wrote {version}, serve it with DETAILS_INDEX_VERSION={version}")
+
+    print(f"{'index':>8} {'build':>9} {'size':>10} {f'recall@{top_k}':>10} {'p50':>9} {'p99':>9}")
+    for index_type, build_seconds, size, recall, p50, p99 in results:
+        print(f"{index_type:>8} {build_seconds * 1e3:7.1f}ms {size / 1024:8.1f}KB {recall:10.3f} {p50 * 1e6:7.1f}us {p99 * 1e6:7.1f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+# creates the tables of a new database and applies the sql files in migrations/ in name order, as a step of its own
+# before the api starts. the api never builds indexes itself: a plain CREATE INDEX on a populated chats table locks
+# writes while it runs, the migrations build them with CREATE INDEX CONCURRENTLY. every file is idempotent, so the
+# whole directory is applied on each run.
+# run from the app directory (docker-compose runs it as the migrate service):
+#   python scripts/migrate.py
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent  # Goes up one level from 'scripts'
+sys.path.insert(0, str(ROOT_DIR))
+
+import models
+from database import engine
+
+MIGRATIONS_DIR = ROOT_DIR / "migrations"
+
+
+def read_statements(path):
+    # one statement per ";", comment lines dropped. CONCURRENTLY can't run inside a transaction, so each statement is
+    # sent on its own instead of the file as one multi statement string
+    lines = [line for line in path.read_text().splitlines() if not line.strip().startswith("--")]
+    return [statement.strip() for statement in "\n".join(lines).split(";") if statement.strip()]
+
+
+def invalid_indexes(connection):
+    # a CONCURRENTLY build that failed leaves an invalid index behind, IF NOT EXISTS would then skip it for good
+    rows = connection.exec_driver_sql("SELECT indexrelid::regclass::text FROM pg_index WHERE NOT indisvalid")
+    return [row[0] for row in rows]
+
+
+def main():
+    # a new database gets its tables with their indexes, create_all leaves existing tables alone
+    models.Base.metadata.create_all(bind=engine)
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        for path in sorted(MIGRATIONS_DIR.glob("*.sql")):
+            print(f"applying {path.name}")
+            for statement in read_statements(path):
+                connection.exec_driver_sql(statement)
+
+        invalid = invalid_indexes(connection)
+    if invalid:
+        raise SystemExit(f"Error: invalid indexes left by a failed build, drop them and run again: {', '.join(invalid)}")
+    print("migrations applied")
+
+
+if __name__ == "__main__":
+    main()
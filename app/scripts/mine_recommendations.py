@@ -0,0 +1,238 @@
+# mines recommendation rules and popularity counts from the orders saved in the chats table and publishes them as a
+# new version under RECOMMENDATION_LIVE_DIR, running workers swap it in on their next check.
+# each run only reads the rows saved after the previous version's watermark, the counts behind the rules are carried
+# from version to version so nothing is recomputed from scratch.
+# run from the app directory, e.g. every few minutes from cron:
+#   python scripts/mine_recommendations.py
+#   python scripts/mine_recommendations.py --rebuild    # drop the carried counts and read every order again
+import argparse
+import csv
+import json
+import os
+import shutil
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent  # Goes up one level from 'scripts'
+sys.path.insert(0, str(ROOT_DIR))
+
+from config import settings
+from agents.recommendation_index import CURRENT_FILE_NAME, VERSIONS_DIR_NAME, APRIORI_FILE_NAME, POPULARITY_FILE_NAME
+
+STATE_FILE_NAME = "state.json"
+# same as the classification agent, the order taking agent's last step
+ORDER_CLOSING_STEP = "6"
+
+
+def empty_state():
+    return {
+        "watermark": None,
+        "orders": 0,
+        # keyed by "product|category"
+        "item_orders": {},
+        "quantities": {},
+        "pairs": {},
+        # users whose latest order taking answer closed an order, the model can repeat the closing step
+        "last_closed": {},
+    }
+
+
+def read_catalogue(path):
+    # what can be recommended, the menu names the model may use map back to (product, category)
+    rows = []
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            rows.append((row["product"], row["product_category"], int(row["count"])))
+
+    lookup = {}
+    for product, category, count in sorted(rows, key=lambda row: -row[2]):
+        lookup.setdefault(product.lower(), (product, category))
+        lookup[f"{product} ({category})".lower()] = (product, category)
+    return rows, lookup
+
+
+def read_current_state(live_dir):
+    try:
+        with open(os.path.join(live_dir, CURRENT_FILE_NAME)) as f:
+            version = f.read().strip()
+        with open(os.path.join(live_dir, VERSIONS_DIR_NAME, version, STATE_FILE_NAME)) as f:
+            return version, json.load(f)
+    except FileNotFoundError:
+        return None, empty_state()
+
+
+def read_new_rows(watermark, settle_seconds, batch_size):
+    # keyset pages over (created_at, id). rows younger than the settle time are left for the next run, a turn's
+    # created_at is its transaction's start so a slow transaction can commit after younger rows
+    from sqlalchemy import select, tuple_
+    import models
+    from database import SessionLocal
+
+    until = datetime.now(timezone.utc) - timedelta(seconds=settle_seconds)
+    db = SessionLocal()
+    try:
+        while True:
+            query = select(models.Chats.id, models.Chats.user_id, models.Chats.created_at, models.Chats.memory)\
+                .where(models.Chats.role == "assistant")\
+                .where(models.Chats.memory["agent"].as_string() == "order_taking_agent")\
+                .where(models.Chats.created_at < until)
+            if watermark is not None:
+                query = query.where(tuple_(models.Chats.created_at, models.Chats.id) > (datetime.fromisoformat(watermark[0]), watermark[1]))
+            rows = db.execute(query.order_by(models.Chats.created_at, models.Chats.id).limit(batch_size)).all()
+            if not rows:
+                return
+            for row in rows:
+                yield row
+            watermark = (rows[-1].created_at.isoformat(), rows[-1].id)
+    finally:
+        db.close()
+
+
+def get_order_items(order, lookup):
+    items = {}
+    for line in order or []:
+        if not isinstance(line, dict):
+            continue
+        match = lookup.get(str(line.get("item", "")).strip().lower())
+        if match is None:
+            continue
+        # the prompt spells it "quanitity"
+        quantity = line.get("quantity", line.get("quanitity", 1))
+        try:
+            quantity = max(1, int(float(quantity)))
+        except (TypeError, ValueError):
+            quantity = 1
+        key = f"{match[0]}|{match[1]}"
+        items[key] = items.get(key, 0) + quantity
+    return items
+
+
+def count_order(state, items):
+    state["orders"] += 1
+    for key, quantity in items.items():
+        state["item_orders"][key] = state["item_orders"].get(key, 0) + 1
+        state["quantities"][key] = state["quantities"].get(key, 0) + quantity
+        pairs = state["pairs"].setdefault(key, {})
+        for other in items:
+            if other != key:
+                pairs[other] = pairs.get(other, 0) + 1
+
+
+def update_state(state, rows, lookup):
+    new_orders = 0
+    for row in rows:
+        memory = row.memory or {}
+        user_id = str(row.user_id)
+        state["watermark"] = (row.created_at.isoformat(), row.id)
+
+        if str(memory.get("step_number", "")).strip() != ORDER_CLOSING_STEP:
+            state["last_closed"].pop(user_id, None)
+            continue
+        items = get_order_items(memory.get("order"), lookup)
+        if not items:
+            continue
+        signature = json.dumps(items, sort_keys=True)
+        if state["last_closed"].get(user_id) == signature:
+            continue
+        state["last_closed"][user_id] = signature
+        count_order(state, items)
+        new_orders += 1
+    return new_orders
+
+
+def build_rules(state, static_rules, min_orders, min_confidence, max_rules):
+    # antecedents with enough live orders get mined rules, the others keep the static ones
+    rules = dict(static_rules)
+    best = {}
+    for key, orders in state["item_orders"].items():
+        product = key.split("|", 1)[0]
+        if orders >= min_orders and orders > best.get(product, (0, None))[0]:
+            best[product] = (orders, key)
+
+    for product, (orders, key) in best.items():
+        mined = []
+        for other, together in state["pairs"].get(key, {}).items():
+            confidence = together / orders
+            if confidence >= min_confidence:
+                other_product, other_category = other.split("|", 1)
+                mined.append({"product": other_product, "product_category": other_category, "confidence": confidence})
+        if mined:
+            mined.sort(key=lambda rule: -rule["confidence"])
+            rules[product] = mined[:max_rules]
+    return rules
+
+
+def build_popularity(state, catalogue):
+    return [(product, category, count + state["quantities"].get(f"{product}|{category}", 0)) for product, category, count in catalogue]
+
+
+def publish(live_dir, rules, popularity, state, keep):
+    versions_dir = os.path.join(live_dir, VERSIONS_DIR_NAME)
+    os.makedirs(versions_dir, exist_ok=True)
+    version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+
+    # the version directory is complete before it gets its name, and CURRENT is replaced in one rename
+    tmp_dir = os.path.join(versions_dir, f".tmp-{version}")
+    os.makedirs(tmp_dir)
+    with open(os.path.join(tmp_dir, APRIORI_FILE_NAME), "w") as f:
+        json.dump(rules, f)
+    with open(os.path.join(tmp_dir, POPULARITY_FILE_NAME), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["product", "product_category", "count"])
+        writer.writerows(popularity)
+    with open(os.path.join(tmp_dir, STATE_FILE_NAME), "w") as f:
+        json.dump(state, f)
+    os.rename(tmp_dir, os.path.join(versions_dir, version))
+
+    current_tmp = os.path.join(live_dir, f".{CURRENT_FILE_NAME}.tmp")
+    with open(current_tmp, "w") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(current_tmp, os.path.join(live_dir, CURRENT_FILE_NAME))
+
+    # workers that are still loading an older version keep their current rules and retry on the next check
+    for old in sorted(name for name in os.listdir(versions_dir) if not name.startswith("."))[:-keep]:
+        shutil.rmtree(os.path.join(versions_dir, old), ignore_errors=True)
+    return version
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--live-dir", default=settings.RECOMMENDATION_LIVE_DIR)
+    parser.add_argument("--apriori", default=str(ROOT_DIR / "recommendation_objects" / APRIORI_FILE_NAME), help="static rules used until an item has enough orders")
+    parser.add_argument("--popularity", default=str(ROOT_DIR / "recommendation_objects" / POPULARITY_FILE_NAME), help="catalogue and base popularity counts")
+    parser.add_argument("--min-orders", type=int, default=20, help="live orders of an item before its rules replace the static ones")
+    parser.add_argument("--min-confidence", type=float, default=0.05)
+    parser.add_argument("--max-rules", type=int, default=10)
+    parser.add_argument("--settle-seconds", type=float, default=60.0)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--keep", type=int, default=5, help="published versions to keep")
+    parser.add_argument("--rebuild", action="store_true")
+    parser.add_argument("--force", action="store_true", help="publish even when there are no new orders")
+    args = parser.parse_args()
+
+    previous_version, state = read_current_state(args.live_dir)
+    if args.rebuild:
+        state = empty_state()
+
+    catalogue, lookup = read_catalogue(args.popularity)
+    with open(args.apriori) as f:
+        static_rules = json.load(f)
+
+    watermark = state["watermark"]
+    new_orders = update_state(state, read_new_rows(watermark, args.settle_seconds, args.batch_size), lookup)
+    if state["watermark"] == watermark and not args.force and not args.rebuild:
+        print(f"no new orders since {watermark}, version {previous_version} stays current")
+        return
+
+    rules = build_rules(state, static_rules, args.min_orders, args.min_confidence, args.max_rules)
+    popularity = build_popularity(state, catalogue)
+    version = publish(args.live_dir, rules, popularity, state, args.keep)
+    mined = sum(orders >= args.min_orders for orders in state["item_orders"].values())
+    print(f"published version {version}: {new_orders} new orders, {state['orders']} in total, {mined} items with mined rules, watermark {state['watermark']}")
+
+
+if __name__ == "__main__":
+    main()
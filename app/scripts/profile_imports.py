@@ -0,0 +1,63 @@
+# import time profile of the api, from python -X importtime, for tracking startup regressions.
+# run from the app directory:
+#   python scripts/profile_imports.py                          # slowest modules and the total
+#   python scripts/profile_imports.py --module agents.guard_agent --top 30
+#   python scripts/profile_imports.py --json importtime.json --budget-ms 1500
+# the import runs in a fresh interpreter with the current environment, main needs the database settings but doesn't
+# connect at import time. exits with 1 when the total is over --budget-ms.
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent  # Goes up one level from 'scripts'
+
+
+def profile(module):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_DIR, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    # lines look like "import time:   self [us] | cumulative | imported package", nesting is the indentation
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append({"module": name.strip(), "self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000, "depth": depth})
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--json", help="write the whole profile to this file")
+    parser.add_argument("--budget-ms", type=float, help="fail when the total import time is over this")
+    args = parser.parse_args()
+
+    modules = profile(args.module)
+    total_ms = sum(module["cumulative_ms"] for module in modules if module["depth"] == 0)
+
+    # top level packages by cumulative time, that's where to look first
+    print(f"import {args.module}: {total_ms:.0f}ms, {len(modules)} modules")
+    print(f"{'cumulative':>12} {'self':>9}  module")
+    for module in sorted(modules, key=lambda module: -module["cumulative_ms"])[:args.top]:
+        print(f"{module['cumulative_ms']:10.1f}ms {module['self_ms']:7.1f}ms  {'  ' * module['depth']}{module['module']}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"module": args.module, "total_ms": total_ms, "modules": modules}, f, indent=2)
+
+    if args.budget_ms is not None and total_ms > args.budget_ms:
+        print(f"Error: import {args.module} took {total_ms:.0f}ms, over the {args.budget_ms:.0f}ms budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
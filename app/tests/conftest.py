@@ -0,0 +1,24 @@
+# the tests run from the app directory like the api, against stub settings instead of a .env file.
+# run from the app directory: pip install -r requirements-dev.txt && python -m pytest -q
+import os
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent  # Goes up one level from 'tests'
+sys.path.insert(0, str(ROOT_DIR))
+os.chdir(ROOT_DIR)
+
+for key, value in {
+    "DATABASE_HOSTNAME": "localhost",
+    "DATABASE_PORT": "5432",
+    "DATABASE_PASSWORD": "password",
+    "DATABASE_USERNAME": "postgres",
+    "DATABASE_NAME": "coffee",
+    "SECRET_KEY": "test",
+    "ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+    "BASE_URL": "http://127.0.0.1:8010/v1",
+    "TOKEN": "test",
+    "MODEL_NAME": "test",
+}.items():
+    os.environ.setdefault(key, value)
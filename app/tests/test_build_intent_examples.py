@@ -0,0 +1,25 @@
+from collections import Counter, namedtuple
+
+from scripts.build_intent_examples import labelled_turns
+
+Chat = namedtuple("Chat", "user_id role content memory")
+
+
+def test_only_llm_routed_turns_become_labels():
+    chats = [
+        Chat(1, "user", "what are your hours?", {}),
+        Chat(1, "assistant", "we open at 7", {"agent": "details_agent", "routed_by": "llm"}),
+        Chat(1, "user", "a latte please", {}),
+        Chat(1, "assistant", "anything else?", {"agent": "order_taking_agent", "routed_by": "local"}),
+        Chat(1, "user", "and a croissant", {}),
+        Chat(1, "assistant", "anything else?", {"agent": "order_taking_agent", "routed_by": "state"}),
+        # saved before the routing source was recorded
+        Chat(2, "user", "what goes with a mocha?", {}),
+        Chat(2, "assistant", "try a croissant", {"agent": "recommendation_agent"}),
+        Chat(3, "user", "write me a poem", {}),
+        Chat(3, "assistant", "sorry, I can't help with that", {"agent": "guard_agent"}),
+    ]
+    skipped = Counter()
+
+    assert list(labelled_turns(chats, skipped)) == [("what are your hours?", "details_agent")]
+    assert skipped == {"local": 1, "state": 1, "unknown": 1}
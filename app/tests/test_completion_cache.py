@@ -0,0 +1,36 @@
+from agents import completion_cache as completion_cache_module
+from agents.completion_cache import CompletionCache
+
+
+def disk_keys(cache):
+    return [row[0] for row in cache.disk.execute("SELECT key FROM completions ORDER BY created_at")]
+
+
+def test_disk_tier_keeps_the_newest_rows_up_to_the_cap(tmp_path, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(completion_cache_module.time, "time", lambda: clock[0])
+    cache = CompletionCache(max_size=2, ttl=3600.0, disk_path=str(tmp_path / "completions.sqlite"), agents=["guard_agent"], disk_max_size=5)
+
+    for i in range(12):
+        clock[0] += 1
+        cache.set(f"key-{i}", f"completion {i}")
+
+    assert disk_keys(cache) == [f"key-{i}" for i in range(7, 12)]
+    # a key trimmed from both tiers is a miss, a key only on disk is still served
+    assert cache.get("guard_agent", "key-6") is None
+    assert cache.get("guard_agent", "key-7") == "completion 7"
+
+
+def test_disk_tier_deletes_expired_rows_on_write(tmp_path, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(completion_cache_module.time, "time", lambda: clock[0])
+    cache = CompletionCache(ttl=60.0, disk_path=str(tmp_path / "completions.sqlite"), agents=["guard_agent"])
+
+    cache.set("old-1", "a")
+    cache.set("old-2", "b")
+    clock[0] += 30
+    cache.set("recent", "c")
+    clock[0] += 31
+    cache.set("new", "d")
+
+    assert disk_keys(cache) == ["recent", "new"]
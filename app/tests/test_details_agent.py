@@ -0,0 +1,123 @@
+import pickle
+
+import faiss
+import numpy as np
+import pytest
+
+from config import settings
+from agents import details_agent
+from agents.vector_index import build_context, split_sections, build_faiss_index, INDEX_FILE_NAME, DOCUMENTS_FILE_NAME
+
+HOURS = "Monday to Friday: 7 AM – 8 PM"
+DELIVERY = "Greenwich Village, SoHo, West Village, and Lower Manhattan"
+
+
+def read_documents():
+    with open("index_and_data/data.pkl", "rb") as f:
+        return pickle.load(f)
+
+
+class FakeEmbeddingService:
+    # no model in the tests, a fixed unrelated vector so only the BM25 half of the search knows the answer
+    model = None
+
+    def embed(self, text_input):
+        vector = np.random.RandomState(0).rand(1, 384).astype(np.float32)
+        faiss.normalize_L2(vector)
+        return vector
+
+    def embed_many(self, texts):
+        vectors = np.random.RandomState(len(texts)).rand(len(texts), 384).astype(np.float32)
+        faiss.normalize_L2(vectors)
+        return vectors
+
+
+@pytest.fixture
+def prompts(monkeypatch):
+    sent = []
+
+    def get_chat_response(client, model_name, messages, **kwargs):
+        sent.append(messages)
+        return "stub answer"
+
+    monkeypatch.setattr(details_agent, "get_embedding_service", FakeEmbeddingService)
+    monkeypatch.setattr(details_agent, "get_chat_response", get_chat_response)
+    return sent
+
+
+def ask(question):
+    agent = details_agent.DetailsAgent(client=object(), async_client=object())
+    agent.get_response([{"role": "user", "content": question}])
+
+
+@pytest.mark.parametrize("question, answer", [("What are your working hours?", HOURS), ("Do you deliver to SoHo?", DELIVERY)])
+def test_about_sections_reach_the_prompt(prompts, question, answer):
+    ask(question)
+    assert answer in prompts[-1][-1]["content"]
+
+
+def test_about_sections_reach_the_prompt_from_a_sectioned_index(prompts, monkeypatch, tmp_path):
+    documents = [unit for document in read_documents() for unit in split_sections(document, 800)]
+    embeddings = np.random.RandomState(1).rand(len(documents), 384).astype(np.float32)
+    faiss.normalize_L2(embeddings)
+    index, _ = build_faiss_index(embeddings, "flat")
+    (tmp_path / "v1").mkdir()
+    faiss.write_index(index, str(tmp_path / "v1" / INDEX_FILE_NAME))
+    with open(tmp_path / "v1" / DOCUMENTS_FILE_NAME, "wb") as f:
+        pickle.dump(documents, f)
+
+    monkeypatch.setattr(settings, "DETAILS_INDEX_VERSION", "v1")
+    monkeypatch.setattr(settings, "DETAILS_INDEX_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "DETAILS_CONTEXT_MAX_CHARS", 800)
+    ask("What are your working hours?")
+    assert HOURS in prompts[-1][-1]["content"]
+
+
+def test_split_sections_keeps_sections_whole():
+    about = next(document for document in read_documents() if document.startswith("coffe shop merry's way about section"))
+    units = split_sections(about, 800)
+    assert all(len(unit) <= 800 for unit in units)
+    assert all(unit.startswith("coffe shop merry's way about section : ") for unit in units)
+    hours = [unit for unit in units if HOURS in unit]
+    assert len(hours) == 1 and "Sunday: 8 AM – 6 PM" in hours[0]
+    assert split_sections("Latte : short", 800) == ["Latte : short"]
+
+
+def test_build_context_never_cuts_documents():
+    long_document, short_document = "a " * 600, "Latte : creamy"
+    # the best document is kept whole even past the limit, the others only while they fit
+    assert build_context([long_document, short_document, long_document], 800) == long_document
+    assert build_context([short_document, long_document, short_document + "!"], 800) == f"{short_document}\n{short_document}!"
+    assert build_context([short_document, long_document], 0) == f"{short_document}\n{long_document}"
+
+
+def test_follow_ups_are_only_answered_from_their_own_conversation(prompts):
+    agent = details_agent.DetailsAgent(client=object(), async_client=object())
+    latte = [{"role": "user", "content": "tell me about the latte"}, {"role": "assistant", "content": "it is creamy"}]
+    scone = [{"role": "user", "content": "tell me about the cranberry scone"}, {"role": "assistant", "content": "it is sweet"}]
+    follow_up = {"role": "user", "content": "and how much is it?"}
+
+    agent.get_response(latte + [follow_up])
+    agent.get_response(scone + [follow_up])
+    assert len(prompts) == 2
+    # the same conversation asking again is served from the cache
+    agent.get_response(latte + [follow_up])
+    assert len(prompts) == 2
+    assert agent.answer_cache.stats()["hits"] == 1
+
+
+def test_the_prebuilt_about_page_is_split_at_load_time(prompts):
+    agent = details_agent.DetailsAgent(client=object(), async_client=object())
+    documents = read_documents()
+    index, data, _, _ = agent.product_index.snapshot
+    assert index.ntotal == len(data) > len(documents)
+    assert all(len(document) <= settings.DETAILS_SECTION_CHARS for document in data)
+    # the documents that stay whole keep their prebuilt vectors
+    whole = faiss.read_index("index_and_data/faiss_product.index")
+    latte = documents.index(next(document for document in documents if document.startswith("Latte :")))
+    assert np.array_equal(index.reconstruct(data.index(documents[latte])), whole.reconstruct(latte))
+
+    agent.get_response([{"role": "user", "content": "What are your working hours?"}])
+    context = prompts[-1][-1]["content"]
+    assert HOURS in context
+    assert DELIVERY not in context
@@ -0,0 +1,42 @@
+import numpy as np
+
+from agents import embedding_cache as embedding_cache_module
+from agents.embedding_cache import EmbeddingCache
+
+
+def test_disk_hit_keeps_the_stored_created_at(tmp_path, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(embedding_cache_module.time, "time", lambda: clock[0])
+    path = str(tmp_path / "embeddings.sqlite")
+    embedding = np.ones((1, 4), dtype=np.float32)
+
+    EmbeddingCache(ttl=100.0, disk_path=path).set("What are your hours?", embedding)
+
+    # a restarted worker reads the entry from disk, close to its expiry
+    cache = EmbeddingCache(ttl=100.0, disk_path=path)
+    clock[0] = 1090.0
+    assert np.array_equal(cache.get("what are your hours"), embedding)
+    assert cache.disk_hits == 1
+
+    # the memory tier does not extend the ttl of a key that keeps being asked for
+    clock[0] = 1101.0
+    assert cache.get("what are your hours") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_disk_tier_is_purged_and_capped_on_write(tmp_path, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(embedding_cache_module.time, "time", lambda: clock[0])
+    cache = EmbeddingCache(max_size=2, ttl=100.0, disk_path=str(tmp_path / "embeddings.sqlite"), disk_max_size=3)
+    embedding = np.ones((1, 4), dtype=np.float32)
+
+    for i in range(6):
+        clock[0] += 1
+        cache.set(f"question {i}", embedding)
+    keys = [row[0] for row in cache.disk.execute("SELECT key FROM embeddings ORDER BY created_at")]
+    assert keys == ["bge-small-en:question 3", "bge-small-en:question 4", "bge-small-en:question 5"]
+
+    # the rows written before the ttl are deleted by the next write
+    clock[0] += 100
+    cache.set("question 6", embedding)
+    assert cache.disk.execute("SELECT count(*) FROM embeddings").fetchone()[0] == 1
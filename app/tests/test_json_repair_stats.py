@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from config import settings
+from agents import guard_agent
+from agents.json_repair import json_repair_stats
+
+OUTPUTS = [
+    '{"chain of thought": "coffee", "decision": "allowed", "message": ""}',
+    "{'decision': 'allowed', 'message': '',}",
+]
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    monkeypatch.setattr(settings, "GUARD_LOCAL_CLASSIFIER", False)
+    outputs = iter(OUTPUTS * 2)
+
+    def get_chat_response(*args, **kwargs):
+        return next(outputs)
+
+    async def aget_chat_response(*args, **kwargs):
+        return next(outputs)
+
+    monkeypatch.setattr(guard_agent, "get_chat_response", get_chat_response)
+    monkeypatch.setattr(guard_agent, "aget_chat_response", aget_chat_response)
+    return guard_agent.GuardAgent(client=object(), async_client=object())
+
+
+def count_paths(run):
+    before = {path: value["count"] for path, value in json_repair_stats.stats().items()}
+    run()
+    return {path: value["count"] - before[path] for path, value in json_repair_stats.stats().items()}
+
+
+def test_sync_and_async_paths_record_the_same_outcomes(agent):
+    messages = [{"role": "user", "content": "a latte please"}]
+
+    def run_sync():
+        for _ in OUTPUTS:
+            agent.get_response(messages)
+
+    def run_async():
+        for _ in OUTPUTS:
+            asyncio.run(agent.aget_response(messages))
+
+    sync_paths = count_paths(run_sync)
+    assert sync_paths["valid"] == 1 and sync_paths["repaired"] == 1
+    assert count_paths(run_async) == sync_paths
+
+
+def test_stats_endpoint_reports_the_repair_outcomes(agent):
+    before = json_repair_stats.stats()["repaired"]["count"]
+    agent.get_response([{"role": "user", "content": "a latte please"}])
+    agent.get_response([{"role": "user", "content": "a latte please"}])
+
+    response = TestClient(main.app).get("/stats")
+    assert response.json()["json_repair"]["repaired"]["count"] == before + 1
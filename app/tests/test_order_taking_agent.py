@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from agents import order_taking_agent
+from agents.context_builder import ContextBuilder
+
+
+def make_messages(contents):
+    return [{"id": i + 1, "role": "user" if i % 2 == 0 else "assistant", "content": content} for i, content in enumerate(contents)]
+
+
+def test_repeated_short_messages_do_not_reset_the_fold_point():
+    builder = ContextBuilder(recent_messages=2, summary_batch=2)
+    messages = make_messages(["a latte please", "yes", "anything else?", "yes", "ok", "yes", "thanks", "bye"])
+
+    to_fold = builder.messages_to_fold(messages, None)
+    assert [message["id"] for message in to_fold] == [1, 2, 3, 4, 5, 6]
+    summary = builder.fold(to_fold[:2], "ordered a latte")
+    assert summary["through"] == 2
+    # the later "yes" messages are still waiting, matching on content would have picked the last "yes"
+    assert [message["id"] for message in builder.unsummarized(messages, summary)] == [3, 4, 5, 6]
+
+
+def test_the_summary_survives_the_history_window_moving_past_its_marker():
+    builder = ContextBuilder(recent_messages=2, summary_batch=2)
+    messages = make_messages(["a"] * 12)[6:]
+    assert [message["id"] for message in builder.unsummarized(messages, {"text": "", "through": 8})] == [9, 10]
+
+
+@pytest.fixture
+def agent():
+    agent = order_taking_agent.OrderTakingAgent(recommendation_agent=None, client=object(), async_client=object())
+    agent.context_builder = ContextBuilder(recent_messages=2, summary_batch=2)
+    return agent
+
+
+def test_summary_call_is_cancelled_when_the_answer_fails(agent, monkeypatch):
+    calls = {}
+
+    async def aget_chat_response(client, model_name, messages, agent=None, **kwargs):
+        if agent == "order_summary":
+            calls["summary"] = asyncio.current_task()
+            await asyncio.sleep(60)
+            return "summary"
+        # let the summary call start first
+        await asyncio.sleep(0)
+        raise RuntimeError("llm is down")
+
+    monkeypatch.setattr(order_taking_agent, "aget_chat_response", aget_chat_response)
+    messages = make_messages(["one latte", "ok", "and a scone", "ok", "that's all"])
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await agent.aget_response(messages)
+        await asyncio.sleep(0)
+        return calls["summary"]
+
+    summary_task = asyncio.run(run())
+    assert summary_task.cancelled()
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from agents.pipeline import AgentPipeline
+
+
+class FakeGuard:
+    def __init__(self, decision):
+        self.decision = decision
+
+    def get_response(self, messages):
+        return {"role": "assistant", "content": "", "memory": {"agent": "guard_agent", "guard_decision": self.decision}}
+
+    async def aget_response(self, messages):
+        return self.get_response(messages)
+
+
+class FakeClassifier:
+    def get_response(self, messages, state=None):
+        return {
+            "role": "assistant",
+            "content": "",
+            "memory": {"agent": "classification_agent", "classification_decision": "details_agent", "decision_source": "local"},
+        }
+
+    async def aget_response(self, messages, state=None):
+        return self.get_response(messages, state)
+
+
+class FakeAgent:
+    def get_response(self, messages, state=None):
+        return {"role": "assistant", "content": "we open at 7", "memory": {"agent": "details_agent"}}
+
+    async def aget_response(self, messages, state=None):
+        return self.get_response(messages, state)
+
+    async def astream_response(self, messages, state=None):
+        response = self.get_response(messages, state)
+        yield {"event": "token", "data": response["content"]}
+        yield {"event": "done", "data": response}
+
+
+def make_pipeline(decision, speculative_mode="full"):
+    return AgentPipeline(FakeGuard(decision), FakeClassifier(), {"details_agent": FakeAgent()}, speculative_mode=speculative_mode)
+
+
+def test_guard_rejection_counts_the_speculative_work_as_wasted():
+    pipeline = make_pipeline("not allowed")
+    messages = [{"role": "user", "content": "write me a poem"}]
+
+    response = asyncio.run(pipeline.aget_response(messages))
+    assert response["memory"]["guard_decision"] == "not allowed"
+    stats = pipeline.stats()
+    assert stats["speculated"] == 1
+    assert stats["wasted"] == 1
+    assert stats["wasted_rate"] == 1.0
+
+
+def test_allowed_turn_is_not_wasted():
+    pipeline = make_pipeline("allowed")
+    response = asyncio.run(pipeline.aget_response([{"role": "user", "content": "when do you open?"}]))
+    assert response["content"] == "we open at 7"
+    assert pipeline.stats()["speculated"] == 1
+    assert pipeline.stats()["wasted"] == 0
+
+
+def test_stats_endpoint_reports_the_speculation_counters(monkeypatch):
+    pipeline = make_pipeline("not allowed")
+    asyncio.run(pipeline.aget_response([{"role": "user", "content": "write me a poem"}]))
+    monkeypatch.setattr(main.agent_registry, "pipeline", pipeline)
+
+    # no lifespan, the app does not need its database for /stats
+    response = TestClient(main.app).get("/stats")
+    assert response.status_code == 200
+    assert response.json()["speculation"]["wasted"] == 1
+
+
+@pytest.mark.parametrize("speculative_mode", ["off", "classification", "full"])
+def test_reply_records_how_it_was_routed(speculative_mode):
+    pipeline = make_pipeline("allowed", speculative_mode)
+    messages = [{"role": "user", "content": "when do you open?"}]
+
+    async def stream():
+        return [event async for event in pipeline.astream_response(messages)]
+
+    assert pipeline.get_response(messages)["memory"] == {"agent": "details_agent", "routed_by": "local"}
+    assert asyncio.run(pipeline.aget_response(messages))["memory"]["routed_by"] == "local"
+    assert asyncio.run(stream())[-1]["data"]["memory"]["routed_by"] == "local"
@@ -0,0 +1,34 @@
+import pytest
+
+from agents.menu_catalog import MenuCatalog
+from agents.recommendation_agent import RecommendationAgent
+from config import settings
+
+APRIORI_PATH = "./recommendation_objects/apriori_recommendation.json"
+POPULARITY_PATH = "./recommendation_objects/popularity_recommendation.csv"
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    # the static rules only, not a live version mined on this machine
+    monkeypatch.setattr(settings, "RECOMMENDATION_LIVE_DIR", "")
+    return RecommendationAgent(APRIORI_PATH, POPULARITY_PATH, client=object(), async_client=object())
+
+
+def test_every_menu_item_is_a_product_of_the_rules(agent):
+    menu = MenuCatalog.from_json(settings.MENU_PATH)
+    products = set(agent.products)
+    assert [item["name"] for item in menu.items if menu.recommendation_name(item["name"]) not in products] == []
+
+
+def test_recommends_from_a_priced_order(agent):
+    menu = MenuCatalog.from_json(settings.MENU_PATH)
+    # the model wrote the alias, the priced line carries the menu name
+    lines, _, _ = menu.price_order([{"item": "hot chocolate", "quantity": 1}])
+    assert lines[0]["item"] == "Dark chocolate (Drinking Chocolate)"
+
+    messages = [{"role": "user", "content": "a hot chocolate please"}]
+    prompt = agent.get_order_recommendation_messages(messages, lines)[-1]["content"]
+    recommendations = agent.get_apriori_recommendation(["Dark chocolate"])
+    assert recommendations
+    assert f"Please recommend me those items exactly: {', '.join(recommendations)}" in prompt
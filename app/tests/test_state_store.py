@@ -0,0 +1,173 @@
+import asyncio
+import time
+
+import fakeredis
+import pytest
+import redis
+
+from agents import state_store
+from agents.pipeline import AgentPipeline
+from config import settings
+
+
+class FakeGuard:
+    def get_response(self, messages):
+        return {"role": "assistant", "content": "", "memory": {"agent": "guard_agent", "guard_decision": "allowed"}}
+
+    async def aget_response(self, messages):
+        return self.get_response(messages)
+
+
+class FakeClassifier:
+    def get_response(self, messages, state=None):
+        return {"role": "assistant", "content": "", "memory": {"agent": "classification_agent", "classification_decision": "order_taking_agent"}}
+
+    async def aget_response(self, messages, state=None):
+        return self.get_response(messages, state)
+
+
+class FakeOrderTakingAgent:
+    """Adds a latte to the order it finds in the state, like the real agent's memory."""
+
+    def __init__(self):
+        self.states = []
+
+    def get_response(self, messages, state=None):
+        self.states.append(state)
+        memory = (state or {}).get("order_taking_agent") or {"step_number": 1, "order": [], "total": "$0.00"}
+        order = memory["order"] + [{"item": "Latte", "quantity": 1, "price": "$4.75"}]
+        return {
+            "role": "assistant",
+            "content": "anything else?",
+            "memory": {
+                "agent": "order_taking_agent",
+                "step_number": memory["step_number"] + 1,
+                "order": order,
+                "total": f"${4.75 * len(order):.2f}",
+                "asked_recommendation_before": True,
+                "summary": None,
+            },
+        }
+
+    async def aget_response(self, messages, state=None):
+        return self.get_response(messages, state)
+
+
+def make_pipeline(store):
+    agent = FakeOrderTakingAgent()
+    return AgentPipeline(FakeGuard(), FakeClassifier(), {"order_taking_agent": agent}, speculative_mode="off", state_store=store), agent
+
+
+# the state the pipeline stores after an order taking turn
+STATE = make_pipeline(None)[0].next_state(None, FakeOrderTakingAgent().get_response([]))
+
+
+def make_store(backend, ttl=60.0):
+    if backend == "memory":
+        return state_store.InMemoryStateStore(ttl=ttl)
+    return state_store.RedisStateStore(fakeredis.FakeRedis(), ttl=ttl)
+
+
+@pytest.fixture(params=["memory", "redis"])
+def backend(request):
+    return request.param
+
+
+def test_state_has_the_pipeline_keys():
+    assert STATE["last_agent"] == "order_taking_agent"
+    assert STATE["order_taking_agent"]["step_number"] == 2
+    assert STATE["order_taking_agent"]["order"] == [{"item": "Latte", "quantity": 1, "price": "$4.75"}]
+
+
+def test_round_trip(backend):
+    store = make_store(backend)
+    assert store.get(1) is None
+
+    store.set(1, STATE)
+    assert store.get(1) == STATE
+    # the caller gets its own copy
+    store.get(1)["order_taking_agent"]["order"].clear()
+    assert store.get(1) == STATE
+
+    store.delete(1)
+    assert store.get(1) is None
+
+
+def test_async_round_trip(backend):
+    store = make_store(backend)
+
+    async def round_trip():
+        await store.aset(2, STATE)
+        return await store.aget(2)
+
+    assert asyncio.run(round_trip()) == STATE
+
+
+def test_state_expires_after_the_ttl(backend):
+    store = make_store(backend, ttl=0.05)
+    store.set(1, STATE)
+    assert store.get(1) == STATE
+    time.sleep(0.1)
+    assert store.get(1) is None
+
+
+def test_redis_state_is_shared_and_every_set_restarts_the_ttl():
+    client = fakeredis.FakeRedis()
+    store = state_store.RedisStateStore(client, ttl=60.0)
+    store.set(1, STATE)
+    assert 59_000 < client.pttl("coffee:state:1") <= 60_000
+    # another replica's store reads the same key
+    assert state_store.RedisStateStore(client).get(1) == STATE
+
+    state_store.RedisStateStore(client, ttl=0.05).set(1, STATE)
+    assert client.pttl("coffee:state:1") <= 50
+
+
+def test_memory_store_drops_the_least_recently_used_user():
+    store = state_store.InMemoryStateStore(max_size=2)
+    store.set(1, STATE)
+    store.set(2, STATE)
+    store.get(1)
+    store.set(3, STATE)
+    assert store.get(2) is None
+    assert store.get(1) == STATE
+
+
+def test_create_state_store(monkeypatch):
+    client = fakeredis.FakeRedis()
+    urls = []
+    monkeypatch.setattr(redis.Redis, "from_url", lambda url: urls.append(url) or client)
+    monkeypatch.setattr(settings, "STATE_STORE_URL", "redis://state:6379/0")
+    monkeypatch.setattr(settings, "STATE_TTL", 120.0)
+
+    store = state_store.create_state_store("redis")
+    assert urls == ["redis://state:6379/0"]
+    store.set(1, STATE)
+    assert store.get(1) == STATE
+    assert 119_000 < client.pttl("coffee:state:1") <= 120_000
+
+    assert isinstance(state_store.create_state_store("memory"), state_store.InMemoryStateStore)
+    with pytest.raises(ValueError):
+        state_store.create_state_store("postgres")
+
+
+def test_pipeline_reads_and_writes_the_store(backend):
+    store = make_store(backend)
+    pipeline, agent = make_pipeline(store)
+    messages = [{"role": "user", "content": "a latte please"}]
+
+    asyncio.run(pipeline.aget_response(messages, session_id=7))
+    assert store.get(7) == STATE
+
+    # the next turn starts from the stored order, not from the history
+    pipeline.get_response(messages, session_id=7)
+    assert agent.states[-1] == STATE
+    state = store.get(7)
+    assert state["last_agent"] == "order_taking_agent"
+    assert state["order_taking_agent"]["step_number"] == 3
+    assert len(state["order_taking_agent"]["order"]) == 2
+
+    # another user has a state of their own
+    asyncio.run(pipeline.aget_response(messages, session_id=8))
+    assert agent.states[-1] == {}
+    assert store.get(8) == STATE
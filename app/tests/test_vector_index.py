@@ -0,0 +1,59 @@
+import os
+import pickle
+import threading
+
+import faiss
+import numpy as np
+
+from agents import vector_index
+from agents.vector_index import ReloadableIndex, build_faiss_index
+
+
+def write_index(tmp_path, documents, seed):
+    embeddings = np.random.RandomState(seed).rand(len(documents), 8).astype(np.float32)
+    faiss.normalize_L2(embeddings)
+    index, _ = build_faiss_index(embeddings, "flat")
+    faiss.write_index(index, str(tmp_path / "index.faiss"))
+    with open(tmp_path / "data.pkl", "wb") as f:
+        pickle.dump(documents, f)
+    # a distinct mtime even on coarse file systems
+    for name in ("index.faiss", "data.pkl"):
+        os.utime(tmp_path / name, ns=(seed * 10**9, seed * 10**9))
+    return embeddings
+
+
+def test_a_new_version_is_loaded_in_the_background(tmp_path, monkeypatch):
+    embeddings = write_index(tmp_path, ["Latte : old"], seed=1)
+    product_index = ReloadableIndex(str(tmp_path / "index.faiss"), str(tmp_path / "data.pkl"), check_interval=0, lexical=True)
+    write_index(tmp_path, ["Latte : new"], seed=2)
+
+    # the load blocks until the test lets it go, the search meanwhile answers from the current snapshot
+    release = threading.Event()
+    load = ReloadableIndex.load
+
+    def slow_load(self):
+        release.wait(5)
+        return load(self)
+
+    monkeypatch.setattr(vector_index.ReloadableIndex, "load", slow_load)
+    assert product_index.search(embeddings[:1]) == ["Latte : old"]
+    assert product_index.hybrid_search("latte", embeddings[:1]) == ["Latte : old"]
+    assert product_index.reload_thread.is_alive()
+
+    release.set()
+    product_index.reload_thread.join(5)
+    assert product_index.search(embeddings[:1]) == ["Latte : new"]
+    assert product_index.hybrid_search("latte", embeddings[:1]) == ["Latte : new"]
+
+
+def test_a_failed_reload_keeps_the_current_snapshot(tmp_path):
+    embeddings = write_index(tmp_path, ["Latte : old"], seed=1)
+    product_index = ReloadableIndex(str(tmp_path / "index.faiss"), str(tmp_path / "data.pkl"), check_interval=0)
+    with open(tmp_path / "index.faiss", "wb") as f:
+        f.write(b"not an index")
+
+    for _ in range(2):
+        # the file still differs, every check tries it again
+        assert product_index.search(embeddings[:1]) == ["Latte : old"]
+        product_index.reload_thread.join(5)
+        assert not product_index.reload_lock.locked()
@@ -5,6 +5,7 @@ import json
 
 # --- Configuration ---
 FASTAPI_URL = os.getenv("FASTAPI_URL", "http://api:8000")  # Replace with your FastAPI URL
+HISTORY_PAGE_SIZE = 50
 
 # --- State Management ---
 if 'jwt_token' not in st.session_state:
@@ -19,6 +20,10 @@ if 'last_order' not in st.session_state:
     st.session_state['last_order'] = None
 if 'show_register' not in st.session_state:
     st.session_state['show_register'] = False
+if 'history_cursor' not in st.session_state:
+    st.session_state['history_cursor'] = None
+if 'history_etag' not in st.session_state:
+    st.session_state['history_etag'] = None
 
 # --- Authentication Functions ---
 def login(username, password):
@@ -77,6 +82,8 @@ def logout():
     st.session_state['logged_in'] = False
     st.session_state['username'] = None
     st.session_state['chat_history'] = []
+    st.session_state['history_cursor'] = None
+    st.session_state['history_etag'] = None
     st.info("Logged out.")
     st.rerun()
 
@@ -99,17 +106,92 @@ def get_chat_response(prompt):
         st.error(f"Error sending message: {response.json().get('detail', 'Something went wrong')}")
         return None
 
-def load_chat_history():
+def stream_chat_response(prompt, placeholder):
+    """Shows the answer in the placeholder token by token, returns the final text."""
+    if not st.session_state['jwt_token']:
+        st.error("Please log in to chat.")
+        return None
+
+    headers = {"Authorization": f"Bearer {st.session_state['jwt_token']}"}
+    payload = {"prompt": prompt}
+    text = ""
+    try:
+        with requests.post(f"{FASTAPI_URL}/chats/ask/stream", headers=headers, json=payload, stream=True) as response:
+            response.raise_for_status()
+            event = None
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: "):
+                    data = json.loads(line[len("data: "):])
+                    if event == "token":
+                        text += data
+                        placeholder.markdown(text + "▌")
+                    elif event == "reset":
+                        text = ""
+                    elif event == "done":
+                        text = data.get("content") or text
+                    elif event == "error":
+                        st.error(f"Error sending message: {data.get('detail', 'Something went wrong')}")
+                        return None
+        placeholder.markdown(text)
+        return text
+    except requests.exceptions.RequestException as e:
+        st.error(f"Error sending message: {e}")
+        return None
+
+def merge_new_messages(chats):
+    """Adds messages loaded from the server, each replaces the pending copy shown before the server had it.
+
+    Turns may be saved after the answer is sent, so pending messages without a server copy yet stay at the end.
+    """
+    pending = [message for message in st.session_state['chat_history'] if message.get("pending")]
+    confirmed = [message for message in st.session_state['chat_history'] if not message.get("pending")]
+    for chat in chats:
+        for message in pending:
+            if message["role"] == chat["role"] and message["content"] == chat["content"]:
+                pending.remove(message)
+                break
+    st.session_state['chat_history'] = confirmed + chats + pending
+
+def load_chat_history(only_new=False):
+    """Loads the latest page of the history, or with only_new just the messages after the ones already shown."""
     if st.session_state['logged_in'] and st.session_state['jwt_token']:
         headers = {"Authorization": f"Bearer {st.session_state['jwt_token']}"}
+        params = {"limit": HISTORY_PAGE_SIZE}
+        if only_new and st.session_state.get('history_cursor'):
+            params["since"] = st.session_state['history_cursor']
+            if st.session_state.get('history_etag'):
+                headers["If-None-Match"] = st.session_state['history_etag']
+        else:
+            only_new = False
         try:
-            response = requests.get(f"{FASTAPI_URL}/chats/history", headers=headers)
-            response.raise_for_status()
-            history_data = response.json()
-            # Store last order in session state
-            st.session_state['last_order'] = get_last_order_from_memory(history_data)
-            st.session_state['chat_history'] = [{"role": chat["role"], "content": chat["content"]} for chat in history_data]
-        
+            while True:
+                response = requests.get(f"{FASTAPI_URL}/chats/history", headers=headers, params=params)
+                if response.status_code == 304:
+                    # nothing new since the last load
+                    return
+                response.raise_for_status()
+                history_data = response.json()
+                st.session_state['history_etag'] = response.headers.get("ETag")
+                st.session_state['history_cursor'] = response.headers.get("X-Latest-Cursor", st.session_state.get('history_cursor'))
+
+                # Store last order in session state
+                last_order = get_last_order_from_memory(history_data)
+                chats = [{"role": chat["role"], "content": chat["content"]} for chat in history_data]
+                if only_new:
+                    st.session_state['last_order'] = last_order or st.session_state['last_order']
+                    merge_new_messages(chats)
+                else:
+                    st.session_state['last_order'] = last_order
+                    st.session_state['chat_history'] = chats
+
+                # a full page of new messages may have more behind it
+                if not only_new or len(history_data) < HISTORY_PAGE_SIZE:
+                    return
+                params["since"] = st.session_state['history_cursor']
+                headers.pop("If-None-Match", None)
+
         except requests.exceptions.RequestException as e:
             st.error(f"Failed to load chat history: {e}")
         except requests.exceptions.HTTPError as e:
@@ -195,14 +277,16 @@ else:
 
     prompt = st.chat_input("Say something")
     if prompt:
-        st.session_state['chat_history'].append({"role": "user", "content": prompt})
+        st.session_state['chat_history'].append({"role": "user", "content": prompt, "pending": True})
         with st.chat_message("user"):
             st.markdown(prompt)
 
         with st.chat_message("assistant"):
+            placeholder = st.empty()
             with st.spinner("Thinking..."):
-                response = get_chat_response(prompt)
+                response = stream_chat_response(prompt, placeholder)
             if response:
-                st.markdown(response)
-                load_chat_history()
+                # shown until the server copies of the prompt and the answer come back with a history load
+                st.session_state['chat_history'].append({"role": "assistant", "content": response, "pending": True})
+                load_chat_history(only_new=True)
                 st.rerun()
\ No newline at end of file